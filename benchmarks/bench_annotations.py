@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Measures the cost of the annotation bookkeeping on the operations that the simplifier rewrites (which is where
+annotations have to be relocated or checked for elimination).
+
+Run from the repository root:
+
+    python benchmarks/bench_annotations.py [--annotated]
+
+Until an annotated AST is built, claripy skips that bookkeeping altogether. With --annotated, one annotated AST (which
+has nothing to do with the benchmarked ones) is built first, so that the per-AST checks are measured instead.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+
+
+POOL = 256
+
+
+class _Annotation(claripy.Annotation):
+    @property
+    def eliminatable(self):
+        return False
+
+    @property
+    def relocatable(self):
+        return True
+
+
+def benchmarks():
+    xs = [ claripy.BVS('x%d' % i, 32) for i in range(POOL) ]
+    ys = [ claripy.BVS('y%d' % i, 32) for i in range(POOL) ]
+    concats = [ claripy.Concat(x, y) for x, y in zip(xs, ys) ]
+    zero = claripy.BVV(0, 32)
+    return [
+        ('Extract(Concat)', lambda: [ claripy.Extract(31, 0, c) for c in concats ]),
+        ('a ^ 0', lambda: [ x ^ zero for x in xs ]),
+        ('a - a', lambda: [ x - x for x in xs ]),
+    ]
+
+
+def run(f, repeat=15, number=20):
+    return POOL / (min(timeit.repeat(f, repeat=repeat, number=number)) / number)
+
+
+if __name__ == '__main__':
+    claripy.set_debug(False)
+    if '--annotated' in sys.argv[1:]:
+        claripy.BVS('annotated', 32).annotate(_Annotation())
+    print("annotations used: %s" % claripy.ast.Base._annotations_used)
+    print("%-16s %12s" % ("operation", "ops/s"))
+    for _name, _f in benchmarks():
+        print("%-16s %12.0f" % (_name, run(_f)))
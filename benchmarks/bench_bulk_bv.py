@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Compares building a symbolic buffer byte by byte with the bulk constructors of claripy.ast.bv.
+
+Run from the repository root:
+
+    python benchmarks/bench_bulk_bv.py [bytes]
+
+Each round creates the bytes of the buffer as symbols, concatenates them, and chops the result back into bytes.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+
+
+def per_byte(n):
+    data = [ claripy.BVS('mem', 8) for _ in range(n) ]
+    buf = claripy.Concat(*data)
+    return [ claripy.Extract(i*8 - 1, (i-1)*8, buf) for i in range(n, 0, -1) ]
+
+
+def bulk(n):
+    data = claripy.BVS_array('mem', n, 8)
+    buf = claripy.Concat_array(data)
+    return buf.chop(8)
+
+
+def run(f, n):
+    start = time.perf_counter()
+    r = f(n)
+    elapsed = time.perf_counter() - start
+    assert len(r) == n
+    return elapsed
+
+
+if __name__ == '__main__':
+    claripy.set_debug(False)
+    _n = int(sys.argv[1]) if len(sys.argv) > 1 else 0x1000
+    print("%-10s %10s %14s" % ("builder", "seconds", "bytes/s"))
+    for _name, _f in (('per byte', per_byte), ('bulk', bulk)):
+        _elapsed = run(_f, _n)
+        print("%-10s %10.3f %14.0f" % (_name, _elapsed, _n / _elapsed))
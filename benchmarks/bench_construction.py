@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Measures how many ASTs per second the common operations construct.
+
+Run from the repository root:
+
+    python benchmarks/bench_construction.py [seconds]
+
+Each benchmark cycles through a pool of distinct operands and drops the results right away, so (since ASTs are
+hash-consed through a weak table) every iteration builds a new AST instead of finding the previous one.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+
+
+POOL = 256
+
+
+def _operands():
+    a = [ claripy.BVS('a%d' % i, 32) for i in range(POOL) ]
+    b = [ claripy.BVS('b%d' % i, 32) for i in range(POOL) ]
+    c = [ x == y for x, y in zip(a, b[1:] + b[:1]) ]
+    return a, b, c
+
+
+def benchmarks():
+    a, b, c = _operands()
+    pairs = list(zip(a, b))
+    triples = list(zip(c, a, b))
+    return [
+        ('a + b', lambda: [ x + y for x, y in pairs ]),
+        ('a == b', lambda: [ x == y for x, y in pairs ]),
+        ('Extract', lambda: [ claripy.Extract(15, 8, x) for x in a ]),
+        ('Concat', lambda: [ claripy.Concat(x, y) for x, y in pairs ]),
+        ('If', lambda: [ claripy.If(cond, x, y) for cond, x, y in triples ]),
+    ]
+
+
+def run(f, seconds):
+    n = 0
+    start = time.perf_counter()
+    while True:
+        f()
+        n += POOL
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return n / elapsed
+
+
+if __name__ == '__main__':
+    claripy.set_debug(False)
+    _seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    print("%-12s %12s" % ("operation", "ops/s"))
+    for _name, _f in benchmarks():
+        print("%-12s %12.0f" % (_name, run(_f, _seconds)))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Measures how fast the concrete, VSA and Z3 backends convert wide ASTs (a Concat of many arguments) and deep ASTs (a
+long chain of additions).
+
+Run from the repository root:
+
+    python benchmarks/bench_convert.py [width] [depth]
+
+The ASTs are built without eager evaluation (which would have folded the concrete ones), and the caches of the backend
+are dropped before each conversion, so that every node is converted.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+
+
+def wide(leaves, width):
+    return claripy.ast.BV('Concat', tuple(leaves[i % len(leaves)] for i in range(width)),
+                          length=leaves[0].length * width, eager_backends=None)
+
+
+def deep(leaf, depth):
+    e = leaf
+    for i in range(depth):
+        e = claripy.ast.BV('__add__', (e, claripy.BVV(i, leaf.length)), length=leaf.length, eager_backends=None)
+    return e
+
+
+def asts(backend, width, depth):
+    if backend is claripy.backends.concrete:
+        leaves = [ claripy.BVV(i, 8) for i in range(width) ]
+    else:
+        leaves = [ claripy.BVS('w%d' % i, 8) for i in range(width) ]
+    # VSA goes through the bounds of bitwise operations for every argument of a Concat, so it gets a narrower one
+    if backend is claripy.backends.vsa:
+        width = min(width, 64)
+    return [
+        ('wide', width, wide(leaves, width)),
+        ('deep', depth, deep(claripy.ast.BV('ZeroExt', (24, leaves[0]), length=32, eager_backends=None), depth)),
+    ]
+
+
+def run(backend, e, repeat=10):
+    def convert():
+        backend.downsize()
+        backend.convert(e)
+    return min(timeit.repeat(convert, repeat=repeat, number=1))
+
+
+if __name__ == '__main__':
+    claripy.set_debug(False)
+    _width = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    _depth = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    print("%-10s %-6s %8s %12s %12s" % ("backend", "shape", "nodes", "ms", "nodes/s"))
+    for _name in ('concrete', 'vsa', 'z3'):
+        _backend = getattr(claripy.backends, _name)
+        for _shape, _nodes, _e in asts(_backend, _width, _depth):
+            _elapsed = run(_backend, _e)
+            print("%-10s %-6s %8d %12.2f %12.0f" % (_name, _shape, _nodes, _elapsed * 1e3, _nodes / _elapsed))
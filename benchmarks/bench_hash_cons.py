@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Compares the weak and the sweeping hash-consing tables (CLARIPY_HASH_CONS) on construction throughput and peak RSS.
+
+Run from the repository root:
+
+    python benchmarks/bench_hash_cons.py [count]
+
+Each table runs in a fresh interpreter, since it is selected at import time. The workload builds `count` short-lived
+expressions over a pool of variables, while keeping every 16th of them alive, like a symbolic execution engine that
+drops most intermediate expressions but keeps its path constraints.
+"""
+
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def workload(claripy, count):
+    xs = [ claripy.BVS('x%d' % i, 32) for i in range(64) ]
+    kept = [ ]
+    for i in range(count):
+        a = xs[i % 64]
+        b = xs[(i * 7 + 1) % 64]
+        e = ((a + i) ^ b) * (a - i) | (b >> (i % 32))
+        if i % 16 == 0:
+            kept.append(e)
+    return kept
+
+
+_SNIPPET = """
+import resource, sys, time
+sys.path.insert(0, %r)
+sys.path.insert(0, %r)
+import claripy
+claripy.set_debug(False)
+from bench_hash_cons import workload
+start = time.perf_counter()
+kept = workload(claripy, %d)
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, len(claripy.ast.base.Base._hash_cache))
+"""
+
+
+def run(count, kind):
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, CLARIPY_HASH_CONS=kind)
+    out = subprocess.check_output([sys.executable, '-c', _SNIPPET % (root, here, count)], env=env)
+    elapsed, rss, size = out.decode().strip().splitlines()[-1].split()
+    return float(elapsed), int(rss), int(size)
+
+
+if __name__ == '__main__':
+    _count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    print("%-8s %12s %14s %12s" % ("table", "exprs/s", "peak RSS (MiB)", "table size"))
+    for _kind in ('weak', 'sweep'):
+        _elapsed, _rss, _size = run(_count, _kind)
+        print("%-8s %12.0f %14.1f %12d" % (_kind, _count / _elapsed, _rss / 1024.0, _size))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Compares the structural hashing engines of claripy.ast.base on deep __add__ and Concat chains.
+
+Run from the repository root:
+
+    python benchmarks/bench_hashing.py [depth]
+
+The first table times Base._calc_hash_md5 and Base._calc_hash_fast directly on every node of the chains. The second one
+builds the chains from scratch in a fresh interpreter for each engine (the engine is selected at import time through
+the CLARIPY_HASH_ENGINE environment variable).
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+from claripy.ast.base import Base
+
+
+def build_add_chain(depth):
+    # a subtraction between the additions keeps the flattening simplifier from collapsing the chain into one wide node
+    e = claripy.BVS('x', 64)
+    for i in range(depth):
+        e = (e + claripy.BVS('y', 64)) - claripy.BVV(i + 1, 64)
+    return e
+
+
+def build_concat_chain(depth):
+    e = claripy.BVS('x', 8)
+    for _ in range(depth):
+        e = claripy.Concat(claripy.BVS('b', 8), e[7:0] + 1)[15:0] * 3
+        e = e[7:0]
+    return e
+
+
+def hashing_inputs(expr):
+    inputs = [ ]
+    for n in [ expr ] + list(expr.children_asts()):
+        kwargs = {'length': n.length, 'variables': n.variables, 'symbolic': n.symbolic, 'annotations': n.annotations}
+        inputs.append((n.op, n.args, kwargs))
+    return inputs
+
+
+def time_engine(f, inputs, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for op, args, kwargs in inputs:
+            f(op, args, kwargs)
+    return time.perf_counter() - start
+
+
+def bench_engines(depth, rounds=20):
+    print("%-14s %10s %12s %12s %8s" % ("chain", "nodes", "md5 ns/node", "fast ns/node", "speedup"))
+    for name, builder in (('__add__', build_add_chain), ('Concat', build_concat_chain)):
+        inputs = hashing_inputs(builder(depth))
+        n = len(inputs) * rounds
+        t_md5 = time_engine(Base._calc_hash_md5, inputs, rounds)
+        t_fast = time_engine(Base._calc_hash_fast, inputs, rounds)
+        print("%-14s %10d %12.0f %12.0f %7.2fx" % (name, len(inputs), t_md5 / n * 1e9, t_fast / n * 1e9, t_md5 / t_fast))
+
+
+_CONSTRUCTION_SNIPPET = """
+import sys, time
+sys.path.insert(0, %r)
+sys.setrecursionlimit(100000)
+import claripy
+claripy.set_debug(False)
+sys.path.insert(0, %r)
+from bench_hashing import build_add_chain, build_concat_chain
+start = time.perf_counter()
+build_add_chain(%d)
+build_concat_chain(%d)
+print(time.perf_counter() - start)
+"""
+
+
+def bench_construction(depth):
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    here = os.path.dirname(os.path.abspath(__file__))
+    print("\n%-14s %12s" % ("engine", "build (s)"))
+    for engine in ('md5', 'fast'):
+        env = dict(os.environ, CLARIPY_HASH_ENGINE=engine)
+        out = subprocess.check_output([sys.executable, '-c', _CONSTRUCTION_SNIPPET % (root, here, depth, depth)], env=env)
+        print("%-14s %12.3f" % (engine, float(out.decode().strip().splitlines()[-1])))
+
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(100000)
+    claripy.set_debug(False)
+    _depth = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bench_engines(_depth)
+    bench_construction(_depth)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Measures the throughput of Backend.convert and Base.make_like, the two paths that dispatch on AST operations.
+
+Run from the repository root:
+
+    python benchmarks/bench_opcodes.py [rounds]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+
+
+def lazy(cls, op, args, length=None):
+    # concrete operations are normally evaluated eagerly; build the AST node itself instead
+    return cls(op, args, length=length, eager_backends=None)
+
+
+def concrete_tree(width=64, depth=6):
+    BV, Bool = claripy.ast.BV, claripy.ast.Bool
+    e = [ claripy.BVV(i, 32) for i in range(width) ]
+    for i in range(depth):
+        e = [ lazy(BV, '__xor__', (lazy(BV, '__add__', (a, b), 32), claripy.BVV(i, 32)), 32)
+              for a, b in zip(e[::2], e[1::2]) ] + e[len(e) // 2:]
+    return lazy(Bool, 'And', [ lazy(Bool, '__ne__', (a, claripy.BVV(7, 32))) for a in e ])
+
+
+def symbolic_tree(width=64, depth=3):
+    e = [ claripy.BVS('x', 32) for _ in range(width) ]
+    for i in range(depth):
+        e = [ claripy.If(a > b, a - b, claripy.Concat(a[15:0], b[31:16])) for a, b in zip(e[::2], e[1::2]) ] \
+            + e[len(e) // 2:]
+    return claripy.And(*[ a != claripy.BVV(7, 32) for a in e ])
+
+
+def nodes_of(expr):
+    # children_asts() walks the tree, so shared subexpressions would be counted once per occurrence
+    nodes = { }
+    for n in [ expr ] + list(expr.children_asts()):
+        nodes[n.cache_key] = n
+    return list(nodes.values())
+
+
+def bench_make_like(exprs, rounds):
+    nodes = [ n for e in exprs for n in nodes_of(e) ]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for n in nodes:
+            n.make_like(n.op, n.args)
+    elapsed = time.perf_counter() - start
+    return len(nodes) * rounds / elapsed
+
+
+def bench_convert(backend, expr, rounds):
+    nodes = len(nodes_of(expr))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        # drop the object cache, otherwise every round after the first is a single cache hit
+        backend.downsize()
+        backend.convert(expr)
+    elapsed = time.perf_counter() - start
+    return nodes * rounds / elapsed
+
+
+if __name__ == '__main__':
+    claripy.set_debug(False)
+    _rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    concrete = concrete_tree()
+    symbolic = symbolic_tree()
+
+    print("%-28s %14s" % ("benchmark", "nodes/s"))
+    print("%-28s %14.0f" % ("make_like", bench_make_like([ concrete, symbolic ], _rounds)))
+    print("%-28s %14.0f" % ("convert (concrete)", bench_convert(claripy.backends.concrete, concrete, _rounds)))
+    print("%-28s %14.0f" % ("convert (vsa)", bench_convert(claripy.backends.vsa, concrete, _rounds)))
+    print("%-28s %14.0f" % ("convert (z3)", bench_convert(claripy.backends.z3, symbolic, _rounds)))
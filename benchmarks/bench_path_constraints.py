@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Measures the cost of accumulating path constraints one at a time into a single flattened operation, as a symbolic
+execution that conjoins each new branch condition with the path constraint does.
+
+Run from the repository root:
+
+    python benchmarks/bench_path_constraints.py [count]
+
+Each new argument is appended to the flattened AST that the previous one produced, and only the new argument is hashed
+and looked at. What is left to grow with the number of arguments that were accumulated before it is copying the
+arguments into the new AST, and (unless CLARIPY_LAZY_VARIABLES is set) building the union of their variables.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+
+
+OPS = [
+    ('And', lambda x, i: x != i, lambda pc, c: claripy.And(pc, c)),
+    ('Or', lambda x, i: x == i, lambda pc, c: claripy.Or(pc, c)),
+    ('add', lambda x, i: x, lambda s, x: s + x),
+    ('xor', lambda x, i: x, lambda s, x: s ^ x),
+]
+
+
+def run(arg, append, count, tag):
+    """
+    Returns the total time, and the times that the first and the last tenth of the appends took.
+    """
+    xs = [ claripy.BVS('%s%d' % (tag, i), 32) for i in range(count) ]
+    tenth = count // 10
+    marks = [ ]
+    new = [ arg(x, i) for i, x in enumerate(xs) ]
+    r = new[0]
+    start = time.perf_counter()
+    for i in range(1, count):
+        if i in (1, tenth, count - tenth):
+            marks.append(time.perf_counter())
+        r = append(r, new[i])
+    end = time.perf_counter()
+    assert len(r.args) == count
+    return end - start, marks[1] - marks[0], end - marks[2]
+
+
+if __name__ == '__main__':
+    claripy.set_debug(False)
+    _count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print("%-6s %10s %12s %14s %14s" % ("op", "seconds", "appends/s", "first 10% (s)", "last 10% (s)"))
+    for _name, _arg, _append in OPS:
+        _elapsed, _head, _tail = run(_arg, _append, _count, _name)
+        print("%-6s %10.3f %12.0f %14.3f %14.3f" % (_name, _elapsed, _count / _elapsed, _head, _tail))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Times ModelCache.eval_constraints() over a set of constraints with overlapping subexpressions, with the memoizing
+Replacer that model caches use and with the Base.replace_dict() walk that they used before.
+
+Run from the repository root:
+
+    python benchmarks/bench_replacement.py [constraints] [rounds]
+
+The first round starts from an empty memo, and the following ones re-evaluate the same constraints (as the model
+cache does every time a solver checks whether a cached model still satisfies its constraints).
+"""
+
+import os
+import random
+import sys
+import time
+import weakref
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+from claripy.frontend_mixins.model_cache_mixin import ModelCache
+
+
+class ReplaceDictModelCache(ModelCache):
+    def __init__(self, model):
+        super().__init__(model)
+        self.replacements = weakref.WeakKeyDictionary()
+
+    def eval_ast(self, ast):
+        new_ast = ast.replace_dict(self.replacements, leaf_operation=self._leaf_op)
+        return claripy.backends.concrete.eval(new_ast, 1)[0]
+
+
+def build_constraints(n, nvars=64, seed=0):
+    rng = random.Random(seed)
+    xs = [ claripy.BVS('x%d' % i, 32, explicit_name=True) for i in range(nvars) ]
+    sums = [ xs[i] + xs[(i + 1) % nvars] * 3 for i in range(nvars) ]
+    constraints = [ ]
+    for _ in range(n):
+        a, b, c = rng.sample(sums, 3)
+        # eval_constraints() stops at the first unsatisfied constraint, so these are (almost surely) all satisfied
+        constraints.append(claripy.Or((a ^ b) - c != rng.getrandbits(32), a * c == b))
+    model = { x.args[0]: rng.getrandbits(32) for x in xs }
+    return constraints, model
+
+
+def bench(cls, constraints, model, rounds):
+    mc = cls(model)
+    times = [ ]
+    for _ in range(rounds):
+        start = time.perf_counter()
+        mc.eval_constraints(constraints)
+        times.append(time.perf_counter() - start)
+    return times[0], sum(times[1:]) / max(1, len(times) - 1)
+
+
+if __name__ == '__main__':
+    claripy.set_debug(False)
+    _n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    _rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    _constraints, _model = build_constraints(_n)
+
+    print("%-14s %12s %12s" % ("engine", "first (ms)", "next (ms)"))
+    for _name, _cls in (('replace_dict', ReplaceDictModelCache), ('Replacer', ModelCache)):
+        _first, _next = bench(_cls, _constraints, _model, _rounds)
+        print("%-14s %12.1f %12.1f" % (_name, _first * 1e3, _next * 1e3))
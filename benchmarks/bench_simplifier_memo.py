@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Measures the cost of building the same operations again, with and without the memo of the simplifier.
+
+Run from the repository root:
+
+    python benchmarks/bench_simplifier_memo.py
+
+The results of each round are kept (as they would be in the states of a symbolic execution), since the memo only
+refers to them weakly.
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+from claripy import simplifications
+
+
+POOL = 256
+
+
+def benchmarks(keep):
+    xs = [ claripy.BVS('x%d' % i, 32) for i in range(POOL) ]
+    ys = [ claripy.BVS('y%d' % i, 32) for i in range(POOL) ]
+    cs = [ claripy.BoolS('c%d' % i) for i in range(POOL) ]
+    concats = [ claripy.Concat(x, y) for x, y in zip(xs, ys) ]
+    return [
+        ('a + b', lambda: keep.append([ x + y for x, y in zip(xs, ys) ])),
+        ('Extract(Concat)', lambda: keep.append([ claripy.Extract(15, 8, c) for c in concats ])),
+        ('And', lambda: keep.append([ claripy.And(c, x == y) for c, x, y in zip(cs, xs, ys) ])),
+    ]
+
+
+def run(f, repeat=10, number=10):
+    return POOL / (min(timeit.repeat(f, repeat=repeat, number=number)) / number)
+
+
+if __name__ == '__main__':
+    claripy.set_debug(False)
+    _simpleton = simplifications.simpleton
+    _default_size = _simpleton.memo_size
+    print("%-16s %12s %12s" % ("operation", "no memo", "memo"))
+    for _name, _f in benchmarks([ ]):
+        _rates = [ ]
+        for _size in (0, _default_size):
+            _simpleton.set_memo_size(_size)
+            _simpleton.clear_memo()
+            _rates.append(run(_f))
+        print("%-16s %10.0f/s %10.0f/s" % ((_name,) + tuple(_rates)))
+    print("memo hit rate: %.2f" % _simpleton.memo_stats()['hit_rate'])
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Compares simplifying ASTs through Z3 (claripy.simplify) with the pure-Python pass of claripy.simplify_dag.
+
+Run from the repository root:
+
+    python benchmarks/bench_simplify_dag.py [count]
+
+The ASTs are built without the simplifier (as replacements and backends do), from fresh variables for each simplifier,
+so that neither of them can reuse the results of the other.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import claripy
+
+
+def unsimplified(count, tag):
+    exprs = [ ]
+    for i in range(count):
+        x = claripy.BVS('x_%s_%d' % (tag, i), 32)
+        y = claripy.BVS('y_%s_%d' % (tag, i), 32)
+        c = x.make_like('Concat', (x, y), length=64)
+        lo = c.make_like('Extract', (31, 0, c), length=32)
+        rev = lo.make_like('Reverse', (lo,))
+        rev = rev.make_like('Reverse', (rev,))
+        e = rev.make_like('__xor__', (rev, claripy.BVV(0, 32)))
+        e = e.make_like('__sub__', (e, x.make_like('__sub__', (x, x))))
+        exprs.append(claripy.ast.Bool('Not', (claripy.ast.Bool('__eq__', (e, claripy.BVV(i, 32))),)))
+    return exprs
+
+
+def run(f, exprs):
+    start = time.perf_counter()
+    r = [ f(e) for e in exprs ]
+    elapsed = time.perf_counter() - start
+    assert all(a.depth <= 3 for a in r)
+    return elapsed
+
+
+if __name__ == '__main__':
+    claripy.set_debug(False)
+    _count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print("%-14s %10s %12s" % ("simplifier", "seconds", "exprs/s"))
+    for _name, _f in (('z3', claripy.simplify), ('simplify_dag', claripy.simplify_dag)):
+        _elapsed = run(_f, unsimplified(_count, _name))
+        print("%-14s %10.3f %12.0f" % (_name, _elapsed, _count / _elapsed))
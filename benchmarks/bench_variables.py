@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Compares eager and lazy computation of AST variables (CLARIPY_LAZY_VARIABLES) when building large symbolic buffers.
+
+Run from the repository root:
+
+    python benchmarks/bench_variables.py [size]
+
+Each mode runs in a fresh interpreter, since it is selected at import time. The buffer is built by concatenating
+`size` symbolic bytes one at a time, and constrained by a conjunction of per-byte constraints built the same way.
+Both are flattened into a single wide node at every step, so the build time grows quadratically with `size`.
+"""
+
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def build_buffer(claripy, size):
+    buf = claripy.BVS('byte_0', 8)
+    for i in range(1, size):
+        buf = claripy.Concat(buf, claripy.BVS('byte_%d' % i, 8))
+    return buf
+
+
+def build_constraints(claripy, buf, size):
+    c = claripy.true
+    for i in range(size):
+        b = buf[i * 8 + 7:i * 8]
+        c = claripy.And(c, claripy.Or(b == 0x41, b > 0x60))
+    return c
+
+
+_SNIPPET = """
+import sys, time, tracemalloc
+sys.path.insert(0, %r)
+sys.path.insert(0, %r)
+sys.setrecursionlimit(100000)
+import claripy
+claripy.set_debug(False)
+from bench_variables import build_buffer, build_constraints
+tracemalloc.start()
+start = time.perf_counter()
+buf = build_buffer(claripy, %d)
+c = build_constraints(claripy, buf, %d)
+built = time.perf_counter() - start
+peak = tracemalloc.get_traced_memory()[1]
+start = time.perf_counter()
+n = len(c.variables)
+queried = time.perf_counter() - start
+print(built, peak, queried, n)
+"""
+
+
+def run(size, lazy):
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, CLARIPY_LAZY_VARIABLES='1' if lazy else '0')
+    out = subprocess.check_output([sys.executable, '-c', _SNIPPET % (root, here, size, size)], env=env)
+    built, peak, queried, n = out.decode().strip().splitlines()[-1].split()
+    return float(built), int(peak), float(queried), int(n)
+
+
+if __name__ == '__main__':
+    _size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    print("%-8s %10s %12s %12s %10s" % ("mode", "build (s)", "peak (MiB)", "query (s)", "variables"))
+    for _mode in ('eager', 'lazy'):
+        _built, _peak, _queried, _n = run(_size, _mode == 'lazy')
+        print("%-8s %10.3f %12.1f %12.4f %10d" % (_mode, _built, _peak / 2.0**20, _queried, _n))
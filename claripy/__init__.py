@@ -87,6 +87,7 @@ from .frontend import Frontend as _Frontend
 from . import frontends
 from . import frontend_mixins
 from .solvers import *
+from .arena import Arena
 
 #
 # Convenient button
@@ -97,7 +98,13 @@ def reset():
     Attempt to refresh any caching state associated with the module
     """
     downsize()
-    from .ast import bv  # pylint:disable=redefined-outer-name
+    from .ast import bv, variable_set, base  # pylint:disable=redefined-outer-name
+    from . import simplifications
     bv._bvv_cache.clear()
+    simplifications.simpleton.clear_memo()
+    base._simplify_dag_memo.clear()
+    variable_set.variable_sets.clear()
+    base.Base._hash_cache.sweep()
 
 from .debug import set_debug
+from .cost_model import CostModel, get_cost_model, set_cost_model
@@ -0,0 +1,121 @@
+"""
+Arenas scope the lifetime of the ASTs that are built while they are active, along with the caches that refer to them.
+
+    with claripy.Arena() as arena:
+        ... analyze one path ...
+        result = ...
+
+While an arena is active, new ASTs go into its own hash-consing table (ASTs that already exist are still found in the
+enclosing table), and BVVs and backend objects are cached in fresh caches. These all hold their contents strongly, so
+that nothing in the arena needs a weak reference. When the arena is exited, the ASTs that are still used from outside
+of it (such as `result` above) are promoted to the enclosing table, with their cached backend objects, and everything
+else is dropped in bulk.
+
+Arenas can be nested, and must be exited in the reverse order of entering. They are not thread-safe: the hash-consing
+table is shared by every thread, while the backend caches that are scoped are the ones of the thread that enters the
+arena.
+"""
+
+import logging
+
+from .ast.hash_cons import SweepingHashConsTable
+from .ast.base import Base
+from .ast import bv
+from .backend_manager import backends
+from .errors import ClaripyError
+
+l = logging.getLogger("claripy.arena")
+
+
+class ArenaHashConsTable(SweepingHashConsTable):
+    """
+    The hash-consing table of an arena. ASTs are looked up in the table of the enclosing scope too, but only inserted
+    in this one.
+    """
+
+    def __init__(self, parent, young_limit=0x2000):
+        super().__init__(young_limit=young_limit)
+        self.parent = parent
+
+    def get(self, h, default=None):
+        r = dict.get(self, h, None)
+        if r is None:
+            return self.parent.get(h, default)
+        return r
+
+
+class Arena:
+    """
+    A scope for the lifetime of ASTs (see the module documentation).
+
+    :ivar promoted:     The number of ASTs that were promoted to the enclosing table when the arena was exited.
+    :ivar dropped:      The number of ASTs that were dropped when the arena was exited.
+    """
+
+    def __init__(self, young_limit=0x2000):
+        """
+        :param young_limit: How many ASTs are inserted in the arena between two sweeps of the ASTs that are not used
+                            anymore (see SweepingHashConsTable).
+        """
+        self.young_limit = young_limit
+        self.table = None
+        self.promoted = None
+        self.dropped = None
+
+        self._parent_table = None
+        self._parent_bvv_cache = None
+        self._backend_caches = None
+
+    @property
+    def active(self):
+        return self.table is not None
+
+    def pin(self, ast):
+        """
+        Keeps `ast` (which must have been built in this arena) until the arena is exited, and promotes it then.
+        """
+        self.table.pin(ast)
+
+    def __enter__(self):
+        if self.active:
+            raise ClaripyError("This arena is already active")
+
+        self._parent_table = Base._hash_cache
+        self.table = ArenaHashConsTable(self._parent_table, young_limit=self.young_limit)
+        Base._hash_cache = self.table
+
+        self._parent_bvv_cache = bv._bvv_cache
+        bv._bvv_cache = bv.bvv_cache = bv.BVVCache(policy=self._parent_bvv_cache.policy,
+                                                   max_size=self._parent_bvv_cache.max_size)
+
+        self._backend_caches = [ (b, b._push_caches()) for b in backends._all_backends ]
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if Base._hash_cache is not self.table:
+            raise ClaripyError("Arenas must be exited in the reverse order of entering")
+
+        # the scoped caches are dropped (or detached from the ASTs) first, so that they do not keep anything alive
+        Base._hash_cache = self._parent_table
+        bv._bvv_cache.clear()
+        bv._bvv_cache = bv.bvv_cache = self._parent_bvv_cache
+        detached = [ (b, b._pop_caches(saved)) for b, saved in self._backend_caches ]
+        self._backend_caches = None
+
+        table = self.table
+        self.table = None
+        self.dropped = table.sweep(full=True)
+
+        parent = self._parent_table
+        for h, ast in table.items():
+            parent.insert(h, ast)
+        self.promoted = len(table)
+        table.clear()
+
+        for b, entries in detached:
+            b._promote_caches(entries, parent)
+
+        self._parent_table = None
+        self._parent_bvv_cache = None
+        l.debug("Arena exited: %d ASTs promoted, %d dropped", self.promoted, self.dropped)
+        return False
@@ -3,8 +3,12 @@ import itertools
 import logging
 import os
 import struct
+import sys
 import weakref
-from collections import OrderedDict, deque
+from collections import OrderedDict
+
+from .variable_set import variable_sets
+from . import hash_cons
 
 try:
     import cPickle as pickle
@@ -16,11 +20,32 @@ l = logging.getLogger("claripy.ast")
 WORKER = bool(os.environ.get('WORKER', False))
 md5_unpacker = struct.Struct('2Q')
 
+# The structural hashing engine is selected once, at import time, because ASTs hashed by different engines can never be
+# hash-consed together. 'fast' mixes the children's hashes with CPython's native (xxHash-based) tuple hash, while 'md5'
+# is the historical pickle+md5 digest.
+HASH_ENGINE = os.environ.get('CLARIPY_HASH_ENGINE', 'fast')
+
+# In lazy-variables mode, the variables of non-leaf ASTs are only computed (and cached) the first time they are
+# accessed, instead of being unioned from the arguments on every construction. Since they are then left out of the hash
+# (the arguments' hashes already determine them), this also has to be selected at import time.
+LAZY_VARIABLES = os.environ.get('CLARIPY_LAZY_VARIABLES', "False").lower() in {"1", "true", "yes", "y"}
+# The hash-consing table is selected at import time too: 'weak' (the default) holds ASTs weakly, while 'sweep' holds them
+# in a plain dict that is swept for unused ASTs in batches (see claripy.ast.hash_cons).
+HASH_CONS = os.environ.get('CLARIPY_HASH_CONS', 'weak')
+try:
+    _hash_cons_table = hash_cons.make_table(HASH_CONS)
+except ValueError as e:
+    raise ImportError(str(e))
+_hash_modulus = sys.hash_info.modulus
+_hash_mask = 0xffffffffffffffff
+
 #pylint:enable=unused-argument
 #pylint:disable=unidiomatic-typecheck
 
 
 class ASTCacheKey:
+    __slots__ = ('ast', '__weakref__')
+
     def __init__(self, a):
         self.ast = a
 
@@ -33,6 +58,64 @@ class ASTCacheKey:
     def __repr__(self):
         return '<Key %s %s>' % (self.ast._type_name(), self.ast.__repr__(inner=True))
 
+_empty_frozenset = frozenset()
+
+class _RareFields:
+    """
+    The fields of an AST that are almost never set, kept out of Base so that most ASTs do not pay for them.
+    """
+
+    __slots__ = ('uninitialized', 'uc_alloc_depth', 'excavated', 'burrowed', 'relocatable_annotations', 'leaves',
+                 'canonical', 'dag_size', 'tree_counts', 'flat_args', 'arg_fold')
+
+    def __init__(self, other=None):
+        if other is None:
+            self.uninitialized = None
+            self.uc_alloc_depth = None
+            self.excavated = None
+            self.burrowed = None
+            self.relocatable_annotations = _empty_frozenset
+            self.leaves = None
+            self.canonical = None
+            self.dag_size = None
+            self.tree_counts = None
+            self.flat_args = None
+            self.arg_fold = None
+        else:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+
+# symbolic values are created with uninitialized=False, which every AST built from them inherits, so they all share
+# this record. It is never written to (see _RareField.__set__).
+_initialized_rare = _RareFields()
+_initialized_rare.uninitialized = False
+
+class _RareField:
+    """
+    Exposes a field of the _RareFields record of an AST as an attribute, creating a record for the AST when the field
+    is first set to a different value.
+    """
+
+    __slots__ = ('name', 'default')
+
+    def __init__(self, name, default=None):
+        self.name = name
+        self.default = default
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        rare = obj._rare
+        return self.default if rare is None else getattr(rare, self.name)
+
+    def __set__(self, obj, value):
+        rare = obj._rare
+        if rare is None or rare is _initialized_rare:
+            if value is self.__get__(obj, None):
+                return
+            rare = obj._rare = _RareFields(rare)
+        setattr(rare, self.name, value)
+
 #
 # AST variable naming
 #
@@ -46,14 +129,16 @@ def _make_name(name, size, explicit_name=False, prefix=""):
     else:
         return name
 
-def _d(h, cls, state):
+def _d(h, cls, state): #pylint:disable=unused-argument
     """
     This function is the deserializer for ASTs.
     It exists to work around the fact that pickle will (normally) call __new__() with no arguments during deserialization.
     For ASTs, this does not work.
     """
     op, args, length, variables, symbolic, annotations = state
-    return cls.__new__(cls, op, args, length=length, variables=variables, symbolic=symbolic, annotations=annotations, hash=h)
+    # the hashes of both engines depend on the string hash seed of the process that computed them (through the hashes of
+    # names and variable sets), so `h` is not reused: it would not match the hashes of the same ASTs in this process
+    return cls.__new__(cls, op, args, length=length, variables=variables, symbolic=symbolic, annotations=annotations)
 
 class Base:
     """
@@ -71,14 +156,20 @@ class Base:
         assert c is d
 
     :ivar op:                       The operation that is being done on the arguments
+    :ivar opcode:                   The integer code of `op` (see claripy.operations.opcode)
     :ivar args:                     The arguments that are being used
     """
 
-    __slots__ = [ 'op', 'args', 'variables', 'symbolic', '_hash', '_simplified', '_cached_encoded_name',
-                  '_cache_key', '_errored', '_eager_backends', 'length', '_excavated', '_burrowed', '_uninitialized',
-                  '_uc_alloc_depth', 'annotations', 'simplifiable', '_uneliminatable_annotations', '_relocatable_annotations',
-                  'depth', '__weakref__']
-    _hash_cache = weakref.WeakValueDictionary()
+    # _cache_key is only set on first access (see __getattr__), and the rarely used fields live in _rare (see
+    # _RareFields), so that the tens of millions of nodes that never need them stay small
+    __slots__ = [ 'op', 'opcode', 'args', 'variables', 'symbolic', '_hash', '_simplified', '_cached_encoded_name',
+                  '_cache_key', '_errored', 'length', 'annotations', '_uneliminatable_annotations', '_rare', 'depth',
+                  '_annotated', '__weakref__']
+    _hash_cache = _hash_cons_table
+
+    # set once the first annotated AST is built. Until then, there are no annotations to propagate, relocate or apply
+    # anywhere, and all of the code that handles them can be skipped.
+    _annotations_used = False
 
     FULL_SIMPLIFY=1
     LITE_SIMPLIFY=2
@@ -88,7 +179,7 @@ class Base:
     MID_REPR=1
     FULL_REPR=2
 
-    def __new__(cls, op, args, add_variables=None, hash=None, **kwargs): #pylint:disable=redefined-builtin
+    def __new__(cls, op, args, add_variables=None, hash=None, extends=None, **kwargs): #pylint:disable=redefined-builtin
         """
         This is called when you create a new Base object, whether directly or through an operation.
         It finalizes the arguments (see the _finalize function, above) and then computes
@@ -97,7 +188,8 @@ class Base:
 
         :param op:                  The AST operation ('__add__', 'Or', etc)
         :param args:                The arguments to the AST operation (i.e., the objects to add)
-        :param variables:           The symbolic variables present in the AST (default: empty set)
+        :param variables:           The symbolic variables present in the AST (default: empty set). In lazy-variables
+                                        mode, this is ignored for non-leaf operations other than unions.
         :param symbolic:            A flag saying whether or not the AST is symbolic (default: False)
         :param length:              An integer specifying the length of this AST (default: None)
         :param simplified:          A measure of how simplified this AST is. 0 means unsimplified,
@@ -106,48 +198,72 @@ class Base:
         :param errored:             A set of backends that are known to be unable to handle this AST.
         :param eager_backends:      A list of backends with which to attempt eager evaluation
         :param annotations:         A frozenset of annotations applied onto this AST.
+        :param extends:             Optionally, an AST of the same class and extendable operation (see
+                                        claripy.operations.extendable_operations), without annotations, whose
+                                        arguments are the first ones of `args` (such as the previous version of a
+                                        growing n-ary operation). Only the other arguments are then looked at.
         """
 
         #if any(isinstance(a, BackendObject) for a in args):
         #   raise Exception('asdf')
 
         a_args = args if type(args) is tuple else tuple(args)
+        op_code = operations.opcode(op)
 
         # initialize the following properties: symbolic, variables and errored
         need_symbolic = 'symbolic' not in kwargs
         need_variables = 'variables' not in kwargs
         need_errored = 'errored' not in kwargs
+        if LAZY_VARIABLES and not add_variables and not operations.opcode_is_leaf[op_code] and op != 'union':
+            # the variables are derived from the arguments, on first access (see _materialize_variables)
+            need_variables = False
+            kwargs['variables'] = None
         args_have_annotations = None
         # Note that `args_have_annotations` may not be set if we don't need to set any of the above variables, in which
         # case it will stay as None, and will be passed to __a_init__() "as is". __a_init__() will properly handle it
         # there.
         arg_max_depth = 0
+        if extends is not None and (type(extends) is not cls or extends.op != op or extends.annotations or
+                                    not operations.opcode_is_extendable[op_code]):
+            extends = None
+        if extends is None:
+            new_args = a_args
+        else:
+            # the summaries of the arguments of `extends` are in its own
+            new_args = a_args[len(extends.args):]
+            arg_max_depth = extends.depth - 1
+            if extends._annotated:
+                args_have_annotations = True
         if need_symbolic or need_variables or need_errored:
-            symbolic_flag = False
-            variables_set = set()
-            errored_set = set()
-            for a in a_args:
+            symbolic_flag = False if extends is None else extends.symbolic
+            variables_sets = [ extends.variables ] if extends is not None and need_variables else [ ]
+            errored_set = set(extends._errored) if extends is not None and extends._errored else None
+            for a in new_args:
                 if not isinstance(a, Base): continue
                 if need_symbolic and not symbolic_flag: symbolic_flag |= a.symbolic
-                if need_variables: variables_set |= a.variables
-                if need_errored: errored_set |= a._errored
-                if args_have_annotations is not True:
-                    args_have_annotations = args_have_annotations or bool(a.annotations)
+                if need_variables: variables_sets.append(a.variables)
+                if need_errored and a._errored:
+                    errored_set = set(a._errored) if errored_set is None else errored_set | a._errored
+                if a._annotated:
+                    args_have_annotations = True
                 if arg_max_depth < a.depth: arg_max_depth = a.depth
 
             if need_symbolic: kwargs['symbolic'] = symbolic_flag
-            if need_variables: kwargs['variables'] = frozenset(variables_set)
+            if need_variables: kwargs['variables'] = variable_sets.union_all(variables_sets)
             if need_errored: kwargs['errored'] = errored_set
+        elif need_errored:
+            kwargs['errored'] = None
 
-        if type(kwargs['variables']) is not frozenset:  #pylint:disable=unidiomatic-typecheck
-            kwargs['variables'] = frozenset(kwargs['variables'])
+        if kwargs['variables'] is not None:
+            kwargs['variables'] = variable_sets.intern(kwargs['variables'])
 
         if add_variables:
-            kwargs['variables'] = kwargs['variables'] | add_variables
+            kwargs['variables'] = variable_sets.union(kwargs['variables'], variable_sets.intern(add_variables))
 
-        eager_backends = list(backends._eager_backends) if 'eager_backends' not in kwargs else kwargs['eager_backends']
+        eager_backends = backends._eager_backends if 'eager_backends' not in kwargs else kwargs['eager_backends']
 
-        if not kwargs['symbolic'] and eager_backends is not None and op not in operations.leaf_operations:
+        if not kwargs['symbolic'] and eager_backends is not None and not operations.opcode_is_leaf[op_code]:
+            eager_backends = list(eager_backends)
             for eb in eager_backends:
                 try:
                     r = operations._handle_annotations(eb._abstract(eb.call(op, args)), args)
@@ -171,14 +287,41 @@ class Base:
         if 'annotations' not in kwargs or kwargs['annotations'] is None:
             kwargs['annotations'] = ()
 
-        h = Base._calc_hash(op, a_args, kwargs) if hash is None else hash
+        arg_fold = None
+        if hash is not None:
+            h = hash
+        elif not operations.opcode_is_extendable[op_code]:
+            h = Base._calc_hash(op, a_args, kwargs)
+        else:
+            # the arguments are folded into the hash one at a time, so that an extension only folds in its new ones
+            if extends is None:
+                arg_fold = Base._fold_arg_keys(0, a_args)
+            else:
+                arg_fold = extends._arg_fold
+                if arg_fold is None:
+                    arg_fold = Base._fold_arg_keys(0, extends.args)
+                arg_fold = Base._fold_arg_keys(arg_fold, new_args)
+            h = Base._calc_hash(op, a_args, kwargs, arg_fold)
+
         self = cls._hash_cache.get(h, None)
         if self is None:
             self = super(Base, cls).__new__(cls)
             depth = arg_max_depth + 1
-            self.__a_init__(op, a_args, depth=depth, args_have_annotations=args_have_annotations, **kwargs)
+            self.__a_init__(op, a_args, opcode=op_code, depth=depth, args_have_annotations=args_have_annotations,
+                            **kwargs)
             self._hash = h
-            cls._hash_cache[h] = self
+            if extends is None:
+                self._annotated = _count_annotated(a_args, kwargs['annotations'])
+            else:
+                self._annotated = _count_annotated(new_args, (), extends=extends._annotated)
+            if kwargs['annotations'] and not Base._annotations_used:
+                Base._annotations_used = True
+            cls._hash_cache.insert(h, self)
+
+        if extends is not None:
+            # the fold is handed over, so that only the last AST of a chain of extensions keeps it
+            extends._arg_fold = None
+            self._arg_fold = arg_fold
         # else:
         #    if self.args != f_args or self.op != f_op or self.variables != f_kwargs['variables']:
         #        raise Exception("CRAP -- hash collision")
@@ -194,19 +337,21 @@ class Base:
         pass
 
     @staticmethod
-    def _calc_hash(op, args, keywords):
+    def _calc_hash_md5(op, args, keywords, arg_keys=None):
         """
         Calculates the hash of an AST, given the operation, args, and kwargs.
 
         :param op:                  The operation.
         :param args:                The arguments to the operation.
         :param keywords:            A dict including the 'symbolic', 'variables', and 'length' items.
+        :param arg_keys:            The keys of the arguments (see _calc_arg_keys_md5), or their fold (see
+                                        _fold_arg_keys_md5), if they are known already.
         :returns:                   a hash.
 
         We do it using md5 to avoid hash collisions.
         (hash(-1) == hash(-2), for example)
         """
-        args_tup = tuple(a if type(a) in (int, float) else hash(a) for a in args)
+        args_tup = Base._calc_arg_keys_md5(args) if arg_keys is None else arg_keys
         # HASHCONS: these attributes key the cache
         # BEFORE CHANGING THIS, SEE ALL OTHER INSTANCES OF "HASHCONS" IN THIS FILE
         to_hash = (
@@ -223,8 +368,65 @@ class Base:
         hd = hashlib.md5(pickle.dumps(to_hash, -1)).digest()
         return md5_unpacker.unpack(hd)[0] # 64 bits
 
+    @staticmethod
+    def _calc_arg_keys_md5(args):
+        return tuple(a if type(a) in (int, float) else hash(a) for a in args)
+
+    @staticmethod
+    def _fold_arg_keys_md5(fold, args):
+        """
+        Folds the keys of `args` into `fold`, the fold of the keys of the arguments that come before them (0 for none).
+        """
+        for k in Base._calc_arg_keys_md5(args):
+            fold = md5_unpacker.unpack(hashlib.md5(pickle.dumps((fold, k), -1)).digest())[0]
+        return fold
+
+    @staticmethod
+    def _calc_hash_fast(op, args, keywords, arg_keys=None):
+        """
+        Calculates the hash of an AST, given the operation, args, and kwargs, without serializing anything.
+
+        :param op:                  The operation.
+        :param args:                The arguments to the operation.
+        :param keywords:            A dict including the 'symbolic', 'variables', and 'length' items.
+        :param arg_keys:            The keys of the arguments (see _calc_arg_keys_fast), or their fold (see
+                                        _fold_arg_keys_fast), if they are known already.
+        :returns:                   a hash.
+
+        Child ASTs contribute their already-computed 64-bit hashes, which are mixed together with the rest of the key by
+        the tuple hash (an xxHash-style mixing function implemented in C). Python's int hash is only injective on
+        [0, sys.hash_info.modulus), and float hashes collide for 0.0/-0.0 and 1.0/1, so those arguments are first
+        encoded into values whose hashes are collision-free (see _hash_key).
+        """
+        # HASHCONS: these attributes key the cache
+        # BEFORE CHANGING THIS, SEE ALL OTHER INSTANCES OF "HASHCONS" IN THIS FILE
+        args_tup = Base._calc_arg_keys_fast(args) if arg_keys is None else arg_keys
+        return hash((
+            op, args_tup,
+            keywords.get('length', None),
+            keywords['variables'],
+            keywords['symbolic'],
+            keywords.get('annotations', None),
+        )) & _hash_mask
+
+    @staticmethod
+    def _calc_arg_keys_fast(args):
+        return tuple([
+            a._hash if isinstance(a, Base) else a if type(a) is int and 0 <= a < _hash_modulus else _hash_key(a)
+            for a in args
+        ])
+
+    @staticmethod
+    def _fold_arg_keys_fast(fold, args):
+        """
+        Folds the keys of `args` into `fold`, the fold of the keys of the arguments that come before them (0 for none).
+        """
+        for k in Base._calc_arg_keys_fast(args):
+            fold = hash((fold, k))
+        return fold
+
     #pylint:disable=attribute-defined-outside-init
-    def __a_init__(self, op, args, variables=None, symbolic=None, length=None, simplified=0, errored=None, eager_backends=None, uninitialized=None, uc_alloc_depth=None, annotations=None, encoded_name=None, depth=None, args_have_annotations=None):  #pylint:disable=unused-argument
+    def __a_init__(self, op, args, opcode=None, variables=None, symbolic=None, length=None, simplified=0, errored=None, eager_backends=None, uninitialized=None, uc_alloc_depth=None, annotations=None, encoded_name=None, depth=None, args_have_annotations=None):  #pylint:disable=unused-argument
         """
         Initializes an AST. Takes the same arguments as ``Base.__new__()``
 
@@ -235,42 +437,45 @@ class Base:
         # HASHCONS: these attributes key the cache
         # BEFORE CHANGING THIS, SEE ALL OTHER INSTANCES OF "HASHCONS" IN THIS FILE
         self.op = op
+        self.opcode = opcode if opcode is not None else operations.opcode(op)
         self.args = args if type(args) is tuple else tuple(args)
         self.length = length
-        self.variables = frozenset(variables) if type(variables) is not frozenset else variables
+        if variables is not None:
+            # already interned by __new__
+            self.variables = variables
         self.symbolic = symbolic
         self.annotations = annotations
 
 
         self.depth = depth if depth is not None else 1
 
-        self._eager_backends = eager_backends
         self._cached_encoded_name = encoded_name
 
-        self._errored = errored if errored is not None else set()
+        self._errored = errored if errored else _empty_frozenset
 
         self._simplified = simplified
-        self._cache_key = ASTCacheKey(self)
-        self._excavated = None
-        self._burrowed = None
+        self._rare = _initialized_rare if uninitialized is False else None
 
-        self._uninitialized = uninitialized
-        self._uc_alloc_depth = uc_alloc_depth
+        if uninitialized is not None:
+            self._uninitialized = uninitialized
+        if uc_alloc_depth is not None:
+            self._uc_alloc_depth = uc_alloc_depth
 
         if not annotations and not args_have_annotations:
-            self._uneliminatable_annotations = frozenset()
-            self._relocatable_annotations = frozenset()
+            self._uneliminatable_annotations = _empty_frozenset
         else:
             ast_args = tuple(a for a in self.args if isinstance(a, Base))
             self._uneliminatable_annotations = frozenset(itertools.chain(
                 itertools.chain.from_iterable(a._uneliminatable_annotations for a in ast_args),
                 tuple(a for a in self.annotations if not a.eliminatable and not a.relocatable)
-            ))
+            )) or _empty_frozenset
 
-            self._relocatable_annotations = OrderedDict((e, True) for e in tuple(itertools.chain(
+            relocatable_annotations = OrderedDict((e, True) for e in tuple(itertools.chain(
                 itertools.chain.from_iterable(a._relocatable_annotations for a in ast_args),
                 tuple(a for a in self.annotations if not a.eliminatable and a.relocatable)
             ))).keys()
+            if relocatable_annotations:
+                self._relocatable_annotations = relocatable_annotations
 
         if len(self.args) == 0:
             raise ClaripyOperationError("AST with no arguments!")
@@ -306,17 +511,21 @@ class Base:
     def make_like(self, op, args, **kwargs):
         if kwargs.pop("simplify", False) is True:
             # Try to simplify the expression again
-            simplified = simplifications.simpleton.simplify(op, args)
+            simplified = simplifications.simpleton.simplify_opcode(
+                self.opcode if op == self.op else operations.opcode(op), args
+            )
         else:
             simplified = None
         if simplified is not None:
             op = simplified.op
 
-        all_operations = operations.leaf_operations_symbolic | {'union'}
+        # symbolic leaves and unions cannot recompute their variables from their arguments, so they carry ours over
+        carry_variables = operations.opcode_is_symbolic_leaf[self.opcode if op == self.op else operations.opcode(op)] \
+                          or op == 'union'
         if 'annotations' not in kwargs: kwargs['annotations'] = self.annotations
-        if 'variables' not in kwargs and op in all_operations: kwargs['variables'] = self.variables
+        if 'variables' not in kwargs and carry_variables: kwargs['variables'] = self.variables
         if 'uninitialized' not in kwargs: kwargs['uninitialized'] = self._uninitialized
-        if 'symbolic' not in kwargs and op in all_operations: kwargs['symbolic'] = self.symbolic
+        if 'symbolic' not in kwargs and carry_variables: kwargs['symbolic'] = self.symbolic
         if simplified is None:
             # Cannot simplify the expression anymore
             return type(self)(op, args, **kwargs)
@@ -530,42 +739,107 @@ class Base:
 
     def children_asts(self):
         """
-        Return an iterator over the nested children ASTs.
+        Return an iterator over the nested children ASTs. Shared children are returned once per occurrence, so use
+        claripy.ast.traversal to visit each of them once.
         """
-        ast_queue = deque([iter(self.args)])
-        while ast_queue:
+        walk = traversal.preorder(self, dedupe=False)
+        next(walk)
+        yield from walk
 
-            try:
-                ast = next(ast_queue[-1])
-            except StopIteration:
-                ast_queue.pop()
-                continue
+    #
+    # Size metrics
+    #
+    # The tree metrics are combined from the ones of the arguments the first time they are needed (see _tree_metrics),
+    # and kept on every subexpression, so that they cost nothing on the ASTs that are never weighed. They saturate at
+    # 2**40 - 1. They count subexpressions once per occurrence, so on heavily shared DAGs they are much larger than the
+    # number of distinct nodes, which is what makes them a measure of how expensive an AST is to walk as a tree.
+    #
 
-            if isinstance(ast, Base):
-                ast_queue.append(iter(ast.args))
+    @property
+    def tree_size(self):
+        """
+        The number of nodes of this AST, counting shared subexpressions once per occurrence.
+        """
+        return self._tree_metrics()[0]
 
-                l.debug("Yielding AST %s with hash %s with %d children", ast, hash(ast), len(ast.args))
-                yield ast
+    @property
+    def symbolic_leaf_count(self):
+        """
+        The number of occurrences of symbolic leaves (variables) in this AST.
+        """
+        return self._tree_metrics()[1]
 
-    def leaf_asts(self):
+    @property
+    def nonlinear_count(self):
         """
-        Return an iterator over the leaf ASTs.
+        The number of occurrences of nonlinear operations (see claripy.operations.nonlinear_operations) with more than
+        one symbolic argument in this AST.
         """
-        seen = set()
+        return self._tree_metrics()[2]
 
-        ast_queue = deque([self])
-        while ast_queue:
+    def _tree_metrics(self):
+        r = self._tree_counts
+        if r is None:
+            r = traversal.postorder_map(self, _tree_metrics_visit, enter=_tree_metrics_enter)
+        return r
 
-            ast = ast_queue.pop()
-            if isinstance(ast, Base) and id(ast.cache_key) not in seen:
-                seen.add(id(ast.cache_key))
+    @property
+    def annotated_count(self):
+        """
+        The number of occurrences of annotated ASTs in this AST (including itself). Unlike the tree metrics, it is
+        combined from the arguments when the AST is built, since it decides whether annotations are looked at at all.
+        """
+        return self._annotated
 
-                if ast.depth == 1:
-                    yield ast
-                    continue
+    @property
+    def has_nested_annotations(self):
+        """
+        Whether this AST or any of its subexpressions is annotated.
+        """
+        return self._annotated > 0
 
-                ast_queue.extend(ast.args)
-                continue
+    @property
+    def dag_size(self):
+        """
+        The number of distinct nodes of this AST. Since arguments can share subexpressions, this cannot be combined from
+        theirs, so it is counted the first time it is needed, and then kept.
+        """
+        if self.depth == 1:
+            return 1
+        n = self._dag_size
+        if n is None:
+            n = self._dag_size = sum(1 for _ in traversal.postorder(self))
+        return n
+
+    def leaf_asts(self):
+        """
+        Return an iterator over the leaf ASTs.
+        """
+        return iter(self.leaf_index)
+
+    @property
+    def leaf_index(self):
+        """
+        A tuple of the distinct leaf ASTs of this AST, in the order of their first occurrence when the arguments are
+        walked from right to left (which is the order in which canonicalize() numbers the variables). It is built on
+        first access and then kept, so enumerating the leaves again costs O(#leaves). Building it reuses the indices that
+        subexpressions already have instead of walking them again.
+        """
+        if self.depth == 1:
+            return (self,)
+
+        index = self._leaves
+        if index is None:
+            leaves = { }
+            walk = traversal.preorder(self, descend=lambda a: a.depth > 1 and (a is self or a._leaves is None), reverse=True)
+            for ast in walk:
+                if ast.depth == 1:
+                    leaves.setdefault(ast._hash, ast)
+                elif ast is not self and ast._leaves is not None:
+                    for leaf in ast._leaves:
+                        leaves.setdefault(leaf._hash, leaf)
+            index = self._leaves = tuple(leaves.values())
+        return index
 
     # TODO: Deprecate this property
     @property
@@ -587,7 +861,9 @@ class Base:
         l.debug("Checking AST with hash %s for looping", hash(self))
 
         seen = set()
-        for child_ast in self.children_asts():
+        walk = traversal.preorder(self, dedupe=False)
+        next(walk)
+        for child_ast in walk:
             if hash(child_ast) in seen:
                 return child_ast
             seen.add(hash(child_ast))
@@ -665,23 +941,22 @@ class Base:
         if len(self.args) != len(o.args):
             return False
 
-        for arg_a, arg_b in zip(self.args, o.args):
+        for arg_a, arg_b in traversal.preorder_pairs(zip(self.args, o.args), descend=lambda a, b: a is not b):
             if not isinstance(arg_a, Base):
                 if type(arg_a) != type(arg_b):
                     return False
                 # They are not ASTs
                 if arg_a != arg_b:
                     return False
-                else:
-                    continue
 
-            if arg_a.op in operations.leaf_operations:
-                if arg_a is not arg_b:
-                    return False
+            elif arg_a is arg_b:
+                continue
 
-            else:
-                if not arg_a.structurally_match(arg_b):
-                    return False
+            elif operations.opcode_is_leaf[arg_a.opcode] or not isinstance(arg_b, Base):
+                return False
+
+            elif arg_a.op != arg_b.op or len(arg_a.args) != len(arg_b.args):
+                return False
 
         return True
 
@@ -696,65 +971,36 @@ class Base:
         :param leaf_operation:      An operation that should be applied to the leaf nodes.
         :returns:                   An AST with all instances of ast's in replacements.
         """
-        if variable_set is None:
-            variable_set = set()
+        variable_set = variable_sets.empty if variable_set is None else variable_sets.intern(variable_set)
 
         if leaf_operation is None:
             leaf_operation = lambda x: x
 
-        arg_queue = [iter([self])]
-        rep_queue = []
-        ast_queue = []
-
-        while arg_queue:
-            try:
-                ast = next(arg_queue[-1])
-                repl = ast
-
-                if not isinstance(ast, Base):
-                    rep_queue.append(repl)
-                    continue
-
-                elif ast.cache_key in replacements:
-                    repl = replacements[ast.cache_key]
-
-                elif ast.variables >= variable_set:
-
-                    if ast.op in operations.leaf_operations:
-                        repl = leaf_operation(ast)
-                        if repl is not ast:
-                            replacements[ast.cache_key] = repl
+        def enter(ast):
+            key = ast.cache_key
+            if key in replacements:
+                return replacements[key]
 
-                    elif ast.depth > 1:
-                        arg_queue.append(iter(ast.args))
-                        ast_queue.append(ast)
-                        continue
+            if not variable_sets.issuperset(ast.variables, variable_set):
+                return ast
 
-                rep_queue.append(repl)
-                continue
-
-            except StopIteration:
-                arg_queue.pop()
-
-                if ast_queue:
-                    ast = ast_queue.pop()
-                    repl = ast
+            if operations.opcode_is_leaf[ast.opcode]:
+                repl = leaf_operation(ast)
+                if repl is not ast:
+                    replacements[key] = repl
+                return repl
 
-                    args = rep_queue[-len(ast.args):]
-                    del rep_queue[-len(ast.args):]
+            return traversal.DESCEND if ast.depth > 1 else ast
 
-                    # Check if replacement occurred.
-                    if any((a is not b for a, b in zip(ast.args, args))):
-                        repl = ast.make_like(ast.op, tuple(args))
-                        replacements[ast.cache_key] = repl
+        def visit(ast, args):
+            # Check if replacement occurred.
+            if any(a is not b for a, b in zip(ast.args, args)):
+                repl = ast.make_like(ast.op, tuple(args))
+                replacements[ast.cache_key] = repl
+                return repl
+            return ast
 
-                    rep_queue.append(repl)
-
-        assert len(arg_queue) == 0, "arg_queue is not empty"
-        assert len(ast_queue) == 0, "ast_queue is not empty"
-        assert len(rep_queue) == 1, ("rep_queue has unexpected length", len(rep_queue))
-
-        return rep_queue.pop()
+        return traversal.postorder_map(self, visit, enter=enter)
 
     def replace(self, old, new, variable_set=None, leaf_operation=None):   # pylint:disable=unused-argument
         """
@@ -794,150 +1040,76 @@ class Base:
 
         return var_map, counter, self.replace_dict(var_map)
 
-    #
-    # This code handles burrowing ITEs deeper into the ast and excavating
-    # them to shallower levels.
-    #
-
-    def _burrow_ite(self):
-        if self.op != 'If':
-            # print("i'm not an if")
-            return self.swap_args([ (a.ite_burrowed if isinstance(a, Base) else a) for a in self.args ])
-
-        if not all(isinstance(a, Base) for a in self.args):
-            # print("not all my args are bases")
-            return self
+    @property
+    def canonical_hash(self):
+        """
+        A 64-bit hash of this AST up to a renaming of its variables, so that the ASTs for which canonicalize() returns the
+        same AST have the same canonical hash. Variables are hashed by the index of their first occurrence instead of by
+        their name. It is computed bottom-up and kept on each subexpression, without building a renamed copy of the AST.
 
-        old_true = self.args[1]
-        old_false = self.args[2]
+        Unlike the hash of the AST, it does not depend on the salted string hashes of the process (see _stable_key), so
+        it is the same in every process, and can key persistent caches. Annotations are the exception, since they are
+        only hashed by identity.
+        """
+        return self._canonical_form()[0]
 
-        if old_true.op != old_false.op or len(old_true.args) != len(old_false.args):
-            return self
+    @property
+    def canonical_variables(self):
+        """
+        The hashes of the variables of this AST, in the order of their first occurrence (which is the order in which they
+        are numbered by canonical_hash).
+        """
+        return self._canonical_form()[1]
 
-        if old_true.op == 'If':
-            # let's no go into this right now
-            return self
+    def canonically_match(self, o):
+        """
+        Checks whether `o` is the same AST as this one up to a renaming of the variables (and up to hash collisions), by
+        comparing their canonical hashes.
+        """
+        return self.canonical_hash == o.canonical_hash
 
-        if any(a.op in operations.leaf_operations for a in self.args):
-            # burrowing through these is pretty funny
-            return self
+    def _canonical_form(self):
+        r = self._canonical
+        if r is None:
+            r = traversal.postorder_map(self, _canonical_visit, enter=_canonical_enter)
+        return r
 
-        matches = [ old_true.args[i] is old_false.args[i] for i in range(len(old_true.args)) ]
-        if matches.count(True) != 1 or all(matches):
-            # TODO: handle multiple differences for multi-arg ast nodes
-            # print("wrong number of matches:",matches,old_true,old_false)
-            return self
+    #
+    # This code handles burrowing ITEs deeper into the ast and excavating
+    # them to shallower levels.
+    #
 
-        different_idx = matches.index(False)
-        inner_if = If(self.args[0], old_true.args[different_idx], old_false.args[different_idx])
-        new_args = list(old_true.args)
-        new_args[different_idx] = inner_if.ite_burrowed
-        # print("replaced the",different_idx,"arg:",new_args)
-        return old_true.__class__(old_true.op, new_args, length=self.length)
+    def _burrow_ite(self):
+        return traversal.postorder_map(self, _burrow_visit, enter=_burrow_enter)
 
     def _excavate_ite(self):
-        ast_queue = [iter([self])]
-        arg_queue = []
-        op_queue = []
-
-        while ast_queue:
-            try:
-                ast = next(ast_queue[-1])
-
-                if not isinstance(ast, Base):
-                    arg_queue.append(ast)
-                    continue
-
-                if ast.op in operations.leaf_operations:
-                    arg_queue.append(ast)
-                    continue
-
-                if ast.annotations:
-                    arg_queue.append(ast)
-                    continue
-
-                op_queue.append(ast)
-                ast_queue.append(iter(ast.args))
-
-            except StopIteration:
-                ast_queue.pop()
-
-                if op_queue:
-                    op = op_queue.pop()
-
-                    args = arg_queue[-len(op.args):]
-                    del arg_queue[-len(op.args):]
-
-                    ite_args = [isinstance(a, Base) and a.op == 'If' for a in args]
-
-                    if op.op == 'If':
-                        # if we are an If, call the If handler so that we can take advantage of its simplifiers
-                        excavated = If(*args)
-
-                    elif ite_args.count(True) == 0:
-                        # if there are no ifs that came to the surface, there's nothing more to do
-                        excavated = op.swap_args(args, simplify=True)
-
-                    else:
-                        # this gets called when we're *not* in an If, but there are Ifs in the args.
-                        # it pulls those Ifs out to the surface.
-                        cond = args[ite_args.index(True)].args[0]
-                        new_true_args = []
-                        new_false_args = []
-
-                        for a in args:
-                            if not isinstance(a, Base) or a.op != 'If':
-                                new_true_args.append(a)
-                                new_false_args.append(a)
-                            elif a.args[0] is cond:
-                                new_true_args.append(a.args[1])
-                                new_false_args.append(a.args[2])
-                            elif a.args[0] is Not(cond):
-                                new_true_args.append(a.args[2])
-                                new_false_args.append(a.args[1])
-                            else:
-                                # weird conditions -- giving up!
-                                excavated = op.swap_args(args, simplify=True)
-                                break
-
-                        else:
-                            excavated = If(cond, op.swap_args(new_true_args, simplify=True),
-                                           op.swap_args(new_false_args, simplify=True))
-
-                    # continue
-                    arg_queue.append(excavated)
-
-        assert len(op_queue) == 0, "op_queue is not empty"
-        assert len(ast_queue) == 0, "ast_queue is not empty"
-        assert len(arg_queue) == 1, ("arg_queue has unexpected length", len(arg_queue))
-
-        return arg_queue.pop()
+        return traversal.postorder_map(self, _excavate_visit, enter=_excavate_enter)
 
     @property
     def ite_burrowed(self):
         """
         Returns an equivalent AST that "burrows" the ITE expressions as deep as possible into the ast, for simpler
         printing.
+
+        The result of every subexpression is cached on it, so shared subexpressions are only burrowed once.
         """
-        if self._burrowed is None:
-            self._burrowed = self._burrow_ite()  # pylint:disable=attribute-defined-outside-init
-            self._burrowed._burrowed = self._burrowed  # pylint:disable=attribute-defined-outside-init
-        return self._burrowed
+        r = self._burrowed
+        if r is None:
+            r = self._burrow_ite()
+        return r
 
     @property
     def ite_excavated(self):
         """
         Returns an equivalent AST that "excavates" the ITE expressions out as far as possible toward the root of the
         AST, for processing in static analyses.
-        """
-        if self._excavated is None:
-            self._excavated = self._excavate_ite()  # pylint:disable=attribute-defined-outside-init
 
-            # we set the flag for the children so that we avoid re-excavating during
-            # VSA backend evaluation (since the backend evaluation recursively works on
-            # the excavated ASTs)
-            self._excavated._excavated = self._excavated
-        return self._excavated
+        The result of every subexpression is cached on it, so shared subexpressions are only excavated once.
+        """
+        r = self._excavated
+        if r is None:
+            r = self._excavate_ite()
+        return r
 
     #
     # these are convenience operations
@@ -992,11 +1164,45 @@ class Base:
 
         return self._uc_alloc_depth
 
+    #
+    # Rarely used fields, stored in the _rare side record
+    #
+
+    _uninitialized = _RareField('uninitialized')
+    _uc_alloc_depth = _RareField('uc_alloc_depth')
+    _excavated = _RareField('excavated')
+    _burrowed = _RareField('burrowed')
+    _relocatable_annotations = _RareField('relocatable_annotations', _empty_frozenset)
+    _leaves = _RareField('leaves')
+    _canonical = _RareField('canonical')
+    _dag_size = _RareField('dag_size')
+    _tree_counts = _RareField('tree_counts')
+    _flat_args = _RareField('flat_args')
+    _arg_fold = _RareField('arg_fold')
+
+    def _add_errored(self, backend):
+        """
+        Records that `backend` failed to convert this AST.
+        """
+        if not self._errored:
+            # do not add to the shared empty set
+            self._errored = { backend }
+        else:
+            self._errored.add(backend)
+
     #
     # Backwards compatibility crap
     #
 
     def __getattr__(self, a):
+        if a == 'variables':
+            # only reached when the variables of this AST have not been computed yet
+            return _materialize_variables(self)
+        if a == '_cache_key':
+            # only reached the first time the cache key of this AST is needed
+            self._cache_key = ASTCacheKey(self)
+            return self._cache_key
+
         if not a.startswith('_model_'):
             raise AttributeError(a)
 
@@ -1009,8 +1215,341 @@ class Base:
         except BackendError:
             return self
 
+_variables_slot = Base.__dict__['variables']
+
+def _has_variables(a):
+    # reading the slot descriptor directly does not fall back to Base.__getattr__
+    try:
+        _variables_slot.__get__(a, Base)
+        return True
+    except AttributeError:
+        return False
+
+def _materialize_variables(expr):
+    """
+    Computes and caches the variables of `expr`, and of all the ASTs below it that have not computed theirs yet. This
+    is done iteratively, so it works on ASTs that are deeper than the recursion limit.
+    """
+    for ast in traversal.postorder(expr, descend=lambda a: not _has_variables(a)):
+        if not _has_variables(ast):
+            ast.variables = variable_sets.union_all([ a.variables for a in ast.args if isinstance(a, Base) ])
+    return expr.variables
+
+def _hash_key(a):
+    """
+    Encodes a non-AST argument so that the tuple hash in Base._calc_hash_fast keeps it distinct from other values.
+    """
+    t = type(a)
+    if t is int:
+        # hash() of large or negative integers wraps modulo sys.hash_info.modulus, so we hash their bytes instead
+        return a.to_bytes(a.bit_length() // 8 + 1, 'little', signed=True)
+    if t is float:
+        return a.hex()
+    return a
+
+def _stable_key(a):
+    """
+    Encodes a non-AST argument into a value whose hash is the same in every process, and keeps it distinct from other
+    values (like _hash_key). The hashes of ints, and of tuples of them, are not salted, but the hashes of strings and bytes
+    are, and the hash of None is its address, so those are digested instead.
+    """
+    t = type(a)
+    if t is int or t is bool:
+        if 0 <= a < _hash_modulus:
+            return a
+        return 1, _digest(a.to_bytes(a.bit_length() // 8 + 1, 'little', signed=True))
+    if a is None:
+        return 0,
+    if t is str:
+        return 2, _digest(a.encode('utf-8', 'surrogatepass'))
+    if t is bytes:
+        return 3, _digest(a)
+    if t is float:
+        return 4, _digest(a.hex().encode())
+    if t is tuple:
+        return (5,) + tuple([ _stable_key(e) for e in a ])
+    if t is frozenset or t is set:
+        return (6,) + tuple(sorted([ _stable_key(e) for e in a ], key=repr))
+    # anything else (such as floating point sorts and rounding modes) is keyed by what it prints as
+    return 7, _digest(('%s:%r' % (t.__name__, a)).encode())
+
+def _digest(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+_stable_op_keys = { }
+
+def _stable_op_key(op):
+    k = _stable_op_keys.get(op, None)
+    if k is None:
+        k = _stable_op_keys[op] = _stable_key(op)
+    return k
+
+# the tree metrics of an AST (see Base.tree_size) are a tuple of its tree size, symbolic leaf count and nonlinear count,
+# which saturate at _metric_max
+_metric_max = 2**40 - 1
+_leaf_tree_counts = (1, 0, 0)
+_symbolic_leaf_tree_counts = (1, 1, 0)
+
+def _tree_metrics_enter(ast):
+    r = ast._tree_counts
+    if r is not None:
+        return r
+    if ast.depth > 1:
+        return traversal.DESCEND
+    # leaves are not worth keeping a side record for
+    return _symbolic_leaf_tree_counts if operations.opcode_is_symbolic_leaf[ast.opcode] else _leaf_tree_counts
+
+def _tree_metrics_visit(ast, counts):
+    size = 1
+    symbolic_leaves = 0
+    nonlinear = 0
+    symbolic_args = 0
+    for a, c in zip(ast.args, counts):
+        if isinstance(a, Base):
+            size += c[0]
+            symbolic_leaves += c[1]
+            nonlinear += c[2]
+            symbolic_args += a.symbolic
+    if symbolic_args > 1 and operations.opcode_is_nonlinear[ast.opcode]:
+        nonlinear += 1
+
+    r = ast._tree_counts = min(size, _metric_max), min(symbolic_leaves, _metric_max), min(nonlinear, _metric_max)
+    return r
+
+def _count_annotated(args, annotations, extends=0):
+    # `extends` is the count of an AST of the same (linear) operation, without annotations, whose arguments come before
+    # `args` (see Base.__new__)
+    n = extends + 1 if annotations else extends
+    for a in args:
+        if isinstance(a, Base):
+            n += a._annotated
+    return n
+
+# the variables that canonicalize() renames
+_canonical_var_ops = frozenset(('BVS', 'BoolS', 'FPS'))
+
+def _canonical_enter(ast):
+    r = ast._canonical
+    if r is not None:
+        return r
+    if ast.depth > 1:
+        return traversal.DESCEND
+
+    # leaves are not worth keeping a side record for
+    if ast.op in _canonical_var_ops:
+        # the name is left out
+        key = (_stable_op_key(ast.op), _stable_key(ast.length), tuple([ _stable_key(a) for a in ast.args[1:] ]),
+               ast.annotations)
+        return hash(key) & _hash_mask, (ast._hash,)
+    key = (_stable_op_key(ast.op), _stable_key(ast.length), tuple([ _stable_key(a) for a in ast.args ]),
+           ast.annotations)
+    return hash(key) & _hash_mask, ()
+
+def _canonical_visit(ast, forms):
+    parts, variables = _canonical_parts(ast.args, forms)
+    key = (_stable_op_key(ast.op), _stable_key(ast.length), tuple(parts), ast.annotations)
+    r = ast._canonical = hash(key) & _hash_mask, variables
+    return r
+
+def _canonical_parts(args, forms):
+    """
+    Numbers the variables of a sequence of arguments together, given their canonical forms (for ASTs), and returns the
+    parts that key their canonical hashes, and the variables in the order in which they are numbered.
+    """
+    # this runs once per node, over all of the variables below it, so the loops over variables are left to C
+    order = None
+    parts = [ ]
+    for a, form in zip(args, forms):
+        if not isinstance(a, Base):
+            parts.append(_stable_key(a))
+            continue
+
+        h, variables = form
+        if order is None:
+            # the first AST numbers its variables the same way as its parent
+            order = dict(zip(variables, itertools.count()))
+            parts.append((h, len(variables)))
+        else:
+            order.update(zip(itertools.filterfalse(order.__contains__, variables), itertools.count(len(order))))
+            parts.append((h, tuple(map(order.__getitem__, variables))))
+    return parts, () if order is None else tuple(order)
+
+def canonical_hashes(asts):
+    """
+    Returns the canonical hashes of a list of ASTs whose variables are numbered together (so that they match the ASTs
+    that canonicalize() returns when it is given the same var_map and counter for all of them), and their variables in
+    the order in which they are numbered.
+    """
+    asts = list(asts)
+    parts, variables = _canonical_parts(asts, [ a._canonical_form() for a in asts ])
+    return [ hash(p) & _hash_mask for p in parts ], variables
+
+#
+# ITE burrowing and excavation. Both are computed bottom-up over the DAG, and the result of every subexpression is cached
+# on it (and marked as final on the result itself, so that it is not processed again either).
+#
+
+def burrow_ites(asts):
+    """
+    Returns the ite_burrowed forms of a list of ASTs, in one walk over their shared subexpressions.
+    """
+    memo = { }
+    return [ traversal.postorder_map(a, _burrow_visit, enter=_burrow_enter, memo=memo) for a in asts ]
+
+def excavate_ites(asts):
+    """
+    Returns the ite_excavated forms of a list of ASTs, in one walk over their shared subexpressions.
+    """
+    memo = { }
+    return [ traversal.postorder_map(a, _excavate_visit, enter=_excavate_enter, memo=memo) for a in asts ]
+
+def _burrow_enter(ast):
+    r = ast._burrowed
+    if r is not None:
+        return r
+    if operations.opcode_is_leaf[ast.opcode]:
+        return ast
+    if ast.op == 'If':
+        # the arguments of an If are not burrowed themselves, only the If is
+        return _burrow_if(ast)
+    return traversal.DESCEND
+
+def _burrow_visit(ast, args):
+    return _set_burrowed(ast, ast.swap_args(args))
+
+def _set_burrowed(ast, r):
+    ast._burrowed = r
+    if r is not ast and r._burrowed is None:
+        r._burrowed = r
+    return r
+
+def _burrow_if(ite):
+    """
+    Burrows an If into the branches of its branches, one level at a time, for as long as they only differ in one
+    argument.
+    """
+    chain = [ ]
+    node = ite
+    while True:
+        if node.op != 'If':
+            # the If of the last level was simplified away
+            node = node.ite_burrowed
+            break
+        if node._burrowed is not None:
+            node = node._burrowed
+            break
+        step = _burrow_step(node)
+        if step is None:
+            node._burrowed = node
+            break
+        chain.append((node,) + step[:2])
+        node = step[2]
+
+    for outer, old_true, different_idx in reversed(chain):
+        new_args = list(old_true.args)
+        new_args[different_idx] = node
+        node = _set_burrowed(outer, old_true.__class__(old_true.op, new_args, length=outer.length))
+    return node
+
+def _burrow_step(ite):
+    """
+    Returns the branch of an If whose arguments are kept, the index of the argument in which its branches differ, and
+    the If between the differing arguments, or None if the If cannot be burrowed.
+    """
+    if not all(isinstance(a, Base) for a in ite.args):
+        return None
+
+    old_true = ite.args[1]
+    old_false = ite.args[2]
+
+    if old_true.op != old_false.op or len(old_true.args) != len(old_false.args):
+        return None
+
+    if old_true.op == 'If':
+        # let's no go into this right now
+        return None
+
+    if any(operations.opcode_is_leaf[a.opcode] for a in ite.args):
+        # burrowing through these is pretty funny
+        return None
+
+    matches = [ old_true.args[i] is old_false.args[i] for i in range(len(old_true.args)) ]
+    if matches.count(True) != 1 or all(matches):
+        # TODO: handle multiple differences for multi-arg ast nodes
+        return None
+
+    different_idx = matches.index(False)
+    return old_true, different_idx, If(ite.args[0], old_true.args[different_idx], old_false.args[different_idx])
+
+def _excavate_enter(ast):
+    r = ast._excavated
+    if r is not None:
+        return r
+    if operations.opcode_is_leaf[ast.opcode] or ast.annotations:
+        return ast
+    return traversal.DESCEND
+
+def _excavate_visit(op, args):
+    ite_args = [ isinstance(a, Base) and a.op == 'If' for a in args ]
+
+    if op.op == 'If':
+        # if we are an If, call the If handler so that we can take advantage of its simplifiers
+        excavated = If(*args)
+
+    elif ite_args.count(True) == 0:
+        # if there are no ifs that came to the surface, there's nothing more to do
+        excavated = op.swap_args(args, simplify=True)
+
+    else:
+        # this gets called when we're *not* in an If, but there are Ifs in the args.
+        # it pulls those Ifs out to the surface.
+        cond = args[ite_args.index(True)].args[0]
+        new_true_args = []
+        new_false_args = []
+
+        for a in args:
+            if not isinstance(a, Base) or a.op != 'If':
+                new_true_args.append(a)
+                new_false_args.append(a)
+            elif a.args[0] is cond:
+                new_true_args.append(a.args[1])
+                new_false_args.append(a.args[2])
+            elif a.args[0] is Not(cond):
+                new_true_args.append(a.args[2])
+                new_false_args.append(a.args[1])
+            else:
+                # weird conditions -- giving up!
+                excavated = op.swap_args(args, simplify=True)
+                break
+
+        else:
+            excavated = If(cond, op.swap_args(new_true_args, simplify=True),
+                           op.swap_args(new_false_args, simplify=True))
+
+    # the excavated ASTs are marked too, so that they are not excavated again (for instance, during VSA backend
+    # evaluation, which works recursively on the excavated ASTs)
+    op._excavated = excavated
+    if excavated is not op and excavated._excavated is None and not operations.opcode_is_leaf[excavated.opcode]:
+        excavated._excavated = excavated
+    return excavated
+
+
+_hash_engines = {
+    'md5': Base._calc_hash_md5,
+    'fast': Base._calc_hash_fast,
+}
+_arg_fold_engines = {
+    'md5': Base._fold_arg_keys_md5,
+    'fast': Base._fold_arg_keys_fast,
+}
+try:
+    Base._calc_hash = staticmethod(_hash_engines[HASH_ENGINE])
+    Base._fold_arg_keys = staticmethod(_arg_fold_engines[HASH_ENGINE])
+except KeyError:
+    raise ImportError("Unknown claripy hash engine %r (expected one of: %s)" % (HASH_ENGINE, ', '.join(_hash_engines)))
+
 def simplify(e):
-    if isinstance(e, Base) and e.op in operations.leaf_operations:
+    if isinstance(e, Base) and operations.opcode_is_leaf[e.opcode]:
         return e
 
     s = e._first_backend('simplify')
@@ -1025,9 +1564,44 @@ def simplify(e):
 
         return s
 
+# the results of simplify_dag(), by the hashes of the ASTs that they were computed for. They are held weakly, and
+# dropped by claripy.reset().
+_simplify_dag_memo = weakref.WeakValueDictionary()
+
+def simplify_dag(e):
+    """
+    Simplifies an AST with the rules of the simplifier (see claripy.simplifications), from the leaves up, until none of
+    them applies anymore. Unlike simplify(), this does not go through any backend.
+
+    The rules are already applied to every AST as it is built, but only once, and not to the ASTs that were built
+    without them (for instance, by replacements or by backends). The AST is walked once, and shared subexpressions are
+    simplified once. The results are not marked as simplified, so that simplify() still simplifies them with a backend.
+    Instead, they are memoized across calls, so that simplifying a grown AST again only walks its new subexpressions.
+    """
+    def enter(ast):
+        if ast._simplified or operations.opcode_is_leaf[ast.opcode]:
+            return ast
+        return traversal.DESCEND
+
+    def visit(ast, args):
+        r = ast.make_like(ast.op, args, length=ast.length, simplify=True)
+        # the ASTs that the rules build go through the rules as they are built, so only the root of the rewritten AST
+        # may have to be rewritten again (and the rules could rewrite it back into an AST that they already produced)
+        seen = { ast._hash }
+        while r._hash not in seen and not operations.opcode_is_leaf[r.opcode]:
+            seen.add(r._hash)
+            r = r.make_like(r.op, r.args, length=r.length, simplify=True)
+        # the result is simplified already, and may be the start of another call (such as on an AST built on it)
+        if r is not ast:
+            _simplify_dag_memo[r._hash] = r
+        return r
+
+    return traversal.postorder_map(e, visit, enter=enter, memo=_simplify_dag_memo)
+
 from ..errors import BackendError, ClaripyOperationError, ClaripyReplacementError
 from .. import operations
 from ..backend_manager import backends
 from ..ast.bool import If, Not, BoolS
 from ..ast.bv import BV
 from .. import simplifications
+from . import traversal
@@ -1,6 +1,8 @@
 import binascii
 import logging
 import numbers
+import weakref
+from collections import OrderedDict
 
 from .bits import Bits
 from ..ast.base import _make_name
@@ -8,13 +10,165 @@ from .bool import If
 
 l = logging.getLogger("claripy.ast.bv")
 
-_bvv_cache = dict()
+class BVVCache:
+    """
+    The intern table for BVV ASTs, keyed by (value, size).
+
+    Values from 0 to 255 in the common widths (8, 16, 32 and 64 bits) are kept in preallocated arrays and are never
+    evicted. All other BVVs are stored in a table whose eviction policy is one of:
+
+        - 'lru':        at most `max_size` BVVs are kept, and the least recently used one is evicted first
+        - 'weak':       a BVV is dropped as soon as nothing outside of the table references it
+        - 'unbounded':  BVVs are only dropped by clear() (or claripy.reset())
+
+    Since ASTs are hash-consed, evicting a BVV never breaks identity: as long as it is referenced elsewhere, building
+    the same BVV again returns the same object.
+    """
+
+    SMALL_WIDTHS = (8, 16, 32, 64)
+    SMALL_VALUES = 256
+    POLICIES = ('lru', 'weak', 'unbounded')
+
+    def __init__(self, policy='lru', max_size=0x10000):
+        self.policy = None
+        self.max_size = None
+        self._lru = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._table = None
+        self._small = None
+        self.configure(policy=policy, max_size=max_size)
+
+    def configure(self, policy=None, max_size=None):
+        """
+        Changes the eviction policy and/or the maximum size of the table. The cached BVVs are kept if the policy stays
+        the same, and dropped otherwise.
+
+        :param policy:      One of 'lru', 'weak' or 'unbounded'.
+        :param max_size:    The maximum number of BVVs (besides the small values) kept by the 'lru' policy.
+        """
+        policy = self.policy if policy is None else policy
+        if policy not in self.POLICIES:
+            raise ClaripyValueError("unknown BVV cache policy %r" % policy)
+        if max_size is not None:
+            if max_size < 0:
+                raise ClaripyValueError("BVV cache size must not be negative")
+            self.max_size = max_size
+
+        if policy != self.policy:
+            self.policy = policy
+            self._lru = policy == 'lru'
+            if policy == 'weak':
+                self._table = weakref.WeakValueDictionary()
+            else:
+                self._table = OrderedDict()
+            if self._small is None:
+                self._small = { width: [ None ] * self.SMALL_VALUES for width in self.SMALL_WIDTHS }
+
+        if policy == 'lru':
+            self._evict()
+
+    def get(self, value, size):
+        """
+        Returns the interned BVV of `value` and `size`, or None if there is none.
+        """
+        if value is not None and value < self.SMALL_VALUES:
+            small = self._small.get(size, None)
+            if small is not None:
+                r = small[value]
+                if r is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                return r
+
+        key = (value, size)
+        r = self._table.get(key, None)
+        if r is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if self._lru:
+            try:
+                self._table.move_to_end(key)
+            except KeyError:
+                # another thread evicted it in the meantime
+                pass
+        return r
+
+    def put(self, value, size, bvv):
+        """
+        Interns `bvv` as the BVV of `value` and `size`.
+        """
+        if value is not None and value < self.SMALL_VALUES:
+            small = self._small.get(size, None)
+            if small is not None:
+                small[value] = bvv
+                return
+
+        self._table[(value, size)] = bvv
+        if self._lru:
+            self._evict()
+
+    def _evict(self):
+        """
+        Drops the least recently used BVVs beyond `max_size`. The table is shared by every thread, without a lock, so they
+        may be evicted by another thread at the same time.
+        """
+        table = self._table
+        while len(table) > self.max_size:
+            try:
+                table.popitem(last=False)
+            except KeyError:
+                break
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drops every interned BVV, including the small values.
+        """
+        self._table.clear()
+        for small in self._small.values():
+            small[:] = [ None ] * self.SMALL_VALUES
+
+    def stats(self):
+        """
+        Returns the counters of this table as a dict. Evictions are only counted for the 'lru' policy.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'policy': self.policy,
+            'max_size': self.max_size,
+            'size': len(self._table),
+            'small_size': self._small_size(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _small_size(self):
+        # list.count() would compare the ASTs with ==, which builds expressions
+        return sum(1 for small in self._small.values() for bvv in small if bvv is not None)
+
+    def __len__(self):
+        return len(self._table) + self._small_size()
+
+
+bvv_cache = BVVCache()
+_bvv_cache = bvv_cache
 
 # This is a hilarious hack to get around some sort of bug in z3's python bindings, where
 # under some circumstances stuff gets destructed out of order
 def cleanup():
-    global _bvv_cache #pylint:disable=global-variable-not-assigned
-    del _bvv_cache
+    _bvv_cache.clear()
 import atexit
 atexit.register(cleanup)
 
@@ -59,7 +213,7 @@ class BV(Bits):
         elif s == bits:
             return [ self ]
         else:
-            return list(reversed([ self[(n+1)*bits - 1:n*bits] for n in range(0, s // bits) ]))
+            return Extract_array(self, [ (n*bits - 1, (n-1)*bits) for n in range(s // bits, 0, -1) ])
 
     def __getitem__(self, rng):
         if type(rng) is slice:
@@ -254,11 +408,12 @@ def BVV(value, size=None, **kwargs):
         value &= (1 << size) -1
 
     if not kwargs:
-        try: return _bvv_cache[(value, size)]
-        except KeyError: pass
+        result = _bvv_cache.get(value, size)
+        if result is not None:
+            return result
 
     result = BV('BVV', (value, size), length=size, **kwargs)
-    _bvv_cache[(value, size)] = result
+    _bvv_cache.put(value, size, result)
     return result
 
 def SI(name=None, bits=0, lower_bound=None, upper_bound=None, stride=None, to_conv=None, explicit_name=None,
@@ -363,6 +518,116 @@ union = operations.op('union', (BV, BV), BV, extra_check=operations.length_same_
 widen = operations.op('widen', (BV, BV), BV, extra_check=operations.length_same_check, calc_length=operations.basic_length_calc, bound=False)
 intersection = operations.op('intersection', (BV, BV), BV, extra_check=operations.length_same_check, calc_length=operations.basic_length_calc, bound=False)
 
+#
+# Bulk construction
+#
+
+def BVS_array(name, count, size=8, uninitialized=False, explicit_name=None, **kwargs):
+    """
+    Creates `count` bit-vector symbols of the same size at once, such as the bytes of a symbolic buffer. This is the
+    same as calling BVS() `count` times (without the value-set analysis options), but cheaper.
+
+    :param name:            The name of the symbols. If `explicit_name` is True, the index of each symbol is appended
+                            to its name.
+    :param count:           The number of symbols.
+    :param size:            The size (in bits) of each symbol.
+    :param uninitialized:   Whether these values should be counted as "uninitialized" values in the course of an
+                            analysis.
+    :param bool explicit_name:   If False, an identifier is appended to each name to ensure uniqueness.
+
+    :returns:               A list of BV objects representing these symbols.
+    """
+    if type(name) is bytes:
+        name = name.decode()
+    if type(name) is not str:
+        raise TypeError("Name value for BVS must be a str, got %r" % type(name))
+
+    explicit_name = False if explicit_name is None else explicit_name
+    result = [ ]
+    for i in range(count):
+        n = _make_name(name + '_%d' % i if explicit_name else name, size, explicit_name)
+        result.append(BV('BVS', (n, None, None, None, uninitialized, False, None), variables={n}, length=size,
+                         symbolic=True, eager_backends=None, uninitialized=uninitialized, encoded_name=n.encode(),
+                         **kwargs))
+    return result
+
+def Concat_array(args):
+    """
+    Concatenates a list of bit-vectors, the first one being the most significant. This is the same as Concat(*args),
+    but the simplifier is skipped when it would not change anything (for instance, when no two consecutive arguments
+    are concrete, and none of them is a Concat or an Extract), so that concatenating many bytes only costs a linear
+    check.
+    """
+    args = tuple(args)
+    if len(args) == 1:
+        return args[0]
+    if not _concat_irreducible(args):
+        return Concat(*args)
+
+    uninitialized = None
+    for a in args:
+        if a.uninitialized is True:
+            uninitialized = True
+            break
+    return BV('Concat', args, length=sum(a.length for a in args), uninitialized=uninitialized)
+
+def _concat_irreducible(args):
+    """
+    Returns whether the Concat simplifier is known to leave a Concat of `args` alone.
+    """
+    previous = None
+    for a in args:
+        if not isinstance(a, BV) or a.length == 0 or a.op == 'Concat':
+            return False
+        if previous is not None:
+            if not (previous.symbolic or a.symbolic):
+                return False
+            if (a.op == 'Extract' and previous.op == 'Extract' and a.args[2] is previous.args[2] and
+                    previous.args[1] == a.args[0] + 1):
+                return False
+        previous = a
+    return True
+
+def Extract_array(val, ranges):
+    """
+    Extracts several bit ranges from a bit-vector at once. This is the same as [ Extract(high, low, val) for high, low
+    in ranges ], but the bounds of the arguments of a Concat are only computed once (so that a wide Concat can be chopped
+    in linear time), and the simplifier is skipped when it would not change anything (on symbols).
+
+    :param val:     The bit-vector.
+    :param ranges:  A list of (high, low) bit ranges, as for Extract().
+
+    :returns:       A list of bit-vectors.
+    """
+    if not isinstance(val, BV):
+        return [ Extract(high, low, val) for high, low in ranges ]
+
+    size = val.length
+    if val.op == 'Concat':
+        # each argument, indexed by the bit range that it covers
+        pieces = { }
+        pos = size
+        for a in val.args:
+            pieces[(pos - 1, pos - a.length)] = a
+            pos -= a.length
+    else:
+        pieces = None
+    leaf = operations.opcode_is_symbolic_leaf[val.opcode]
+    uninitialized = True if val.uninitialized is True else None
+
+    result = [ ]
+    for high, low in ranges:
+        if pieces is not None:
+            r = pieces.get((high, low), None)
+            if r is not None:
+                result.append(r)
+                continue
+        elif leaf and 0 <= low <= high < size and high - low + 1 != size:
+            result.append(BV('Extract', (high, low, val), length=high - low + 1, uninitialized=uninitialized))
+            continue
+        result.append(Extract(high, low, val))
+    return result
+
 #
 # Bound operations
 #
@@ -0,0 +1,261 @@
+"""
+The hash-consing tables that map AST hashes to the one AST with that hash.
+
+Two tables are available, and one of them is selected at import time (see HASH_CONS in claripy.ast.base):
+
+- 'weak' (the default) holds the ASTs weakly, so that each AST leaves the table as soon as it dies. This costs a weak
+  reference and a death callback per AST.
+- 'sweep' holds the ASTs strongly, in a plain dict, and sweeps the ASTs that nothing else refers to anymore in
+  batches. It relies on CPython's reference counts, and falls back to 'weak' elsewhere.
+"""
+
+import logging
+import sys
+import weakref
+
+l = logging.getLogger("claripy.ast.hash_cons")
+
+
+class WeakHashConsTable(weakref.WeakValueDictionary):
+    """
+    A hash-consing table that holds its ASTs weakly. Pinned ASTs are additionally held strongly, until unpinned.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._pinned = { }
+        self.pinning = False
+
+    def insert(self, h, ast):
+        self[h] = ast
+        if self.pinning:
+            self._pinned[h] = ast
+
+    def pin(self, ast):
+        """
+        Keeps `ast` in the table until it is unpinned, whether or not it is still used.
+        """
+        self._pinned[ast._hash] = ast
+
+    def unpin(self, ast):
+        self._pinned.pop(ast._hash, None)
+
+    def sweep(self, full=False): #pylint:disable=unused-argument,no-self-use
+        """
+        Dead ASTs leave this table by themselves, so there is never anything to sweep.
+        """
+        return 0
+
+    def stats(self):
+        return { 'size': len(self), 'pinned': len(self._pinned) }
+
+
+class SweepingHashConsTable(dict):
+    """
+    A hash-consing table that holds its ASTs strongly, and periodically drops the ones that are not referred to by
+    anything but the table itself (and the table entries of their parents, which are dropped first).
+
+    Sweeping is generational: since most short-lived ASTs die young, only the ASTs that were inserted in the last two
+    rounds of `young_limit` insertions are checked after each round (the ones that survive two sweeps are likely to be
+    used for a while, or at least to die less quickly), and the whole table is only checked once it has doubled since the
+    last full sweep. Pinned ASTs are never checked nor dropped.
+
+    Unused ASTs that are still referred to by a reference cycle (of other objects, or through other ASTs) are dropped by
+    the first sweep after the garbage collector breaks the cycle.
+    """
+
+    def __init__(self, young_limit=0x2000):
+        super().__init__()
+        self.young_limit = young_limit
+        self.pinning = False
+        self.swept = 0
+        self._young = [ ]
+        self._aging = [ ]
+        self._pinned = set()
+        self._full_sweep_size = young_limit
+
+    def insert(self, h, ast):
+        self[h] = ast
+        if self.pinning:
+            self._pinned.add(h)
+            return
+
+        young = self._young
+        young.append(h)
+        if len(young) >= self.young_limit:
+            self.sweep(full=len(self) >= 2 * self._full_sweep_size)
+
+    def pin(self, ast):
+        """
+        Keeps `ast` in the table until it is unpinned, whether or not it is still used.
+        """
+        self._pinned.add(ast._hash)
+
+    def unpin(self, ast):
+        self._pinned.discard(ast._hash)
+
+    def sweep(self, full=True):
+        """
+        Drops the unused ASTs from the table, and returns how many were dropped.
+
+        :param full:    Check every AST in the table, instead of only the ones inserted in the last two rounds.
+        """
+        if full:
+            hashes = list(self)
+            self._aging = [ ]
+        else:
+            hashes = self._aging + self._young
+            self._aging = self._young
+        self._young = [ ]
+
+        pinned = self._pinned
+        # (through dict.get, since subclasses may look ASTs up elsewhere too)
+        get = dict.get
+        candidates = [ a for a in (get(self, h, None) for h in hashes if h not in pinned) if a is not None ]
+        del hashes
+
+        # parents hold references to their arguments, so they have to be dropped first
+        candidates.sort(key=_depth, reverse=True)
+        n = _drop_unreferenced(self, candidates, base.Base.__dict__['_cache_key'], _DEAD_REFS)
+
+        if full:
+            self._full_sweep_size = max(len(self), self.young_limit)
+        self.swept += n
+        return n
+
+    def stats(self):
+        return {
+            'size': len(self),
+            'pinned': len(self._pinned),
+            'young': len(self._young) + len(self._aging),
+            'swept': self.swept,
+        }
+
+
+def _depth(ast):
+    return ast.depth
+
+
+def _extra_refs(ast, key_slot):
+    """
+    Returns how many references `ast` holds to itself (through its cache key, and its ITE forms), or None if its cache
+    key is used elsewhere.
+    """
+    n = 0
+    try:
+        key = key_slot.__get__(ast, None)
+    except AttributeError:
+        pass
+    else:
+        if sys.getrefcount(key) > _KEY_REFS:
+            return None
+        n += 1
+
+    rare = ast._rare
+    if rare is not None:
+        n += (rare.excavated is ast) + (rare.burrowed is ast)
+    return n
+
+
+def _drop_unreferenced(table, candidates, key_slot, dead_refs, observed=None):
+    """
+    Drops the ASTs in `candidates` that have no more than `dead_refs` references besides their references to
+    themselves, and returns how many were dropped. `candidates` is emptied along the way.
+    """
+    n = 0
+    for i in range(len(candidates)): #pylint:disable=consider-using-enumerate
+        ast = candidates[i]
+        candidates[i] = None
+        extra = _extra_refs(ast, key_slot)
+        if extra is None:
+            continue
+
+        refs = sys.getrefcount(ast) - extra
+        if observed is not None:
+            observed.append(refs)
+        if refs <= dead_refs:
+            del table[ast._hash]
+            n += 1
+            if extra:
+                _break_self_refs(ast, key_slot)
+    return n
+
+
+def _break_self_refs(ast, key_slot):
+    """
+    Drops the references of a dropped AST to itself, so that it is freed right away instead of by the garbage collector
+    (which would keep its arguments in the table until it runs).
+    """
+    try:
+        key_slot.__delete__(ast)
+    except AttributeError:
+        pass
+
+    rare = ast._rare
+    if rare is not None:
+        if rare.excavated is ast:
+            rare.excavated = None
+        if rare.burrowed is ast:
+            rare.burrowed = None
+
+
+def _calibrate():
+    """
+    Measures the reference counts of a cache key that is only referred to by its AST, and of an AST that is only
+    referred to by a table and its cache key, as seen from _extra_refs() and _drop_unreferenced().
+    """
+    class _Rare:
+        __slots__ = ('excavated', 'burrowed')
+
+    class _Key:
+        __slots__ = ('ast',)
+
+    class _Probe:
+        __slots__ = ('_hash', '_rare', '_cache_key')
+
+    key_slot = _Probe.__dict__['_cache_key']
+
+    def _key_refs(a):
+        key = key_slot.__get__(a, None)
+        return sys.getrefcount(key)
+
+    probe = _Probe()
+    probe._hash = 0
+    probe._rare = _Rare()
+    probe._rare.excavated = probe._rare.burrowed = None
+    probe._cache_key = _Key()
+    probe._cache_key.ast = probe
+    key_refs = _key_refs(probe)
+
+    global _KEY_REFS #pylint:disable=global-statement
+    _KEY_REFS = key_refs
+
+    observed = [ ]
+    candidates = [ probe ]
+    table = { 0: probe }
+    del probe
+    _drop_unreferenced(table, candidates, key_slot, -1, observed=observed)
+    table.clear()
+    return observed[0], key_refs
+
+_KEY_REFS = None
+_DEAD_REFS = None
+SWEEP_SUPPORTED = hasattr(sys, 'getrefcount')
+if SWEEP_SUPPORTED:
+    _DEAD_REFS, _KEY_REFS = _calibrate()
+
+
+def make_table(kind):
+    """
+    Returns a new hash-consing table of the given kind ('weak' or 'sweep').
+    """
+    if kind == 'sweep':
+        if SWEEP_SUPPORTED:
+            return SweepingHashConsTable()
+        l.warning("The sweeping hash-consing table needs reference counts, falling back to the weak one.")
+    elif kind != 'weak':
+        raise ValueError("Unknown hash-consing table %r (expected 'weak' or 'sweep')" % kind)
+    return WeakHashConsTable()
+
+
+from . import base
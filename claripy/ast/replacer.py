@@ -0,0 +1,149 @@
+import weakref
+
+
+class Replacer:
+    """
+    Replaces subexpressions of ASTs according to a set of replacements, like Base.replace_dict(), but for callers that
+    replace many overlapping ASTs with the same replacements (such as model caches and replacement frontends).
+
+    The result of every AST that is walked, whether it changed or not, is memoized on the version of the replacement set
+    and the hash of the AST, so each shared subexpression is only walked once until the replacements change (or until
+    the result is freed, since the memo only refers to the results weakly). Subtrees
+    that cannot contain anything to replace (because their variables do not intersect those of the replaced ASTs) are
+    not walked at all.
+
+    :ivar replacements:     A dict from the cache keys of the replaced ASTs to their replacements.
+    :ivar version:          Incremented every time the replacements change.
+    """
+
+    def __init__(self, replacements=None, leaf_operation=None, max_memo=0x10000):
+        """
+        :param replacements:    A dict from cache keys to replacement ASTs. It is copied.
+        :param leaf_operation:  An operation that is applied to the symbolic leaves that are not replaced. Leaves
+                                without variables are left alone.
+        :param max_memo:        The number of results past which the memo is dropped.
+        """
+        self.replacements = { }
+        self.leaf_operation = leaf_operation
+        self.max_memo = max_memo
+        self.version = 0
+
+        self._targets = { }
+        self._variables = variable_sets.empty
+        self._prune = True
+        self._memo = weakref.WeakValueDictionary()
+
+        if replacements:
+            self.update(replacements)
+
+    def copy(self):
+        """
+        Returns a Replacer with the same replacements (but without the memoized results).
+        """
+        return Replacer(self.replacements, leaf_operation=self.leaf_operation, max_memo=self.max_memo)
+
+    #
+    # Changing the replacements
+    #
+
+    def add(self, old, new):
+        """
+        Replaces the AST `old` with `new` from now on.
+        """
+        self.update({ old.cache_key: new })
+
+    def update(self, replacements):
+        """
+        Adds a dict from cache keys to replacement ASTs to the replacements.
+        """
+        self.replacements.update(replacements)
+        self._changed(replacements)
+
+    def remove(self, keys):
+        """
+        Removes the replacements of the given cache keys.
+        """
+        for k in keys:
+            self.replacements.pop(k, None)
+        self._targets.clear()
+        self._variables = variable_sets.empty
+        self._prune = True
+        self._changed(self.replacements)
+
+    def _changed(self, added):
+        for k, v in added.items():
+            self._targets[k.ast._hash] = v
+            if k.ast.variables:
+                self._variables = variable_sets.union(self._variables, k.ast.variables)
+            else:
+                # a concrete AST can be anywhere
+                self._prune = False
+
+        self.version += 1
+        self._memo = weakref.WeakValueDictionary()
+
+    #
+    # Replacing
+    #
+
+    def replace(self, ast):
+        """
+        Returns `ast` with the replacements applied.
+        """
+        memo = self._memo
+        if len(memo) > self.max_memo:
+            memo = self._memo = weakref.WeakValueDictionary()
+
+        return traversal.postorder_map(ast, self._visit, enter=self._enter, memo=memo)
+
+    def _enter(self, ast):
+        r = self._targets.get(ast._hash, None)
+        if r is not None:
+            return r
+
+        if self.leaf_operation is None:
+            if self._prune and variable_sets.isdisjoint(ast.variables, self._variables):
+                return ast
+        elif not ast.variables:
+            return ast
+
+        if operations.opcode_is_leaf[ast.opcode]:
+            return ast if self.leaf_operation is None else self.leaf_operation(ast)
+        return traversal.DESCEND
+
+    @staticmethod
+    def _visit(ast, args):
+        if any(a is not b for a, b in zip(ast.args, args)):
+            return ast.make_like(ast.op, tuple(args))
+        return ast
+
+    #
+    # Inspecting
+    #
+
+    def cached(self, ast):
+        """
+        Returns the known replacement of `ast` (either given, or memoized from a previous replacement), or None if
+        there is none or if `ast` is left unchanged.
+        """
+        r = self._targets.get(ast._hash, None)
+        if r is None:
+            r = self._memo.get(ast._hash, None)
+        return None if r is ast else r
+
+    def downsize(self):
+        """
+        Drops the memoized results.
+        """
+        self._memo = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.replacements)
+
+    def __repr__(self):
+        return '<Replacer with %d replacements, %d memoized results>' % (len(self.replacements), len(self._memo))
+
+
+from . import traversal
+from .variable_set import variable_sets
+from .. import operations
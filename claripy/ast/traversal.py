@@ -0,0 +1,157 @@
+"""
+Non-recursive walks over AST DAGs.
+
+ASTs are hash-consed, so a large expression is usually a DAG in which the same subexpression is shared by many parents.
+The walks in this module visit each distinct subexpression (identified by its `_hash`) exactly once, and never recurse,
+so they work on ASTs of any depth.
+"""
+
+DESCEND = object()
+_FINISH = object()
+_MISSING = object()
+
+
+def preorder(root, descend=None, dedupe=True, reverse=False):
+    """
+    Yields the ASTs reachable from `root` (including `root` itself), parents before their arguments, and arguments from
+    left to right.
+
+    :param root:        The AST to start from.
+    :param descend:     An optional predicate that is called on each yielded AST, to decide whether to walk into its
+                        arguments. By default, every AST is walked into.
+    :param dedupe:      Yield shared subexpressions once (the default), or once per occurrence.
+    :param reverse:     Walk the arguments from right to left instead.
+    """
+    if not isinstance(root, Base):
+        return
+
+    seen = set()
+    stack = [ root ]
+    while stack:
+        node = stack.pop()
+        if dedupe:
+            if node._hash in seen:
+                continue
+            seen.add(node._hash)
+
+        yield node
+
+        if descend is None or descend(node):
+            stack.extend(a for a in (node.args if reverse else reversed(node.args)) if isinstance(a, Base))
+
+
+def postorder(root, descend=None):
+    """
+    Yields the distinct ASTs reachable from `root` (including `root` itself), arguments before their parents.
+
+    :param root:        The AST to start from.
+    :param descend:     An optional predicate that is called on each AST, before its arguments are walked, to decide
+                        whether to walk into them. By default, every AST is walked into.
+    """
+    if not isinstance(root, Base):
+        return
+
+    seen = { root._hash }
+    # each entry is a node, and the iterator over the arguments that are left to walk
+    stack = [ (root, iter(root.args) if descend is None or descend(root) else iter(())) ]
+    while stack:
+        node, args = stack[-1]
+        for a in args:
+            if isinstance(a, Base) and a._hash not in seen:
+                seen.add(a._hash)
+                stack.append((a, iter(a.args) if descend is None or descend(a) else iter(())))
+                break
+        else:
+            stack.pop()
+            yield node
+
+
+def postorder_map(root, visit, enter=None, memo=None, on_error=None):
+    """
+    Computes a value for every distinct AST reachable from `root`, arguments before their parents, and returns the value
+    of `root`.
+
+    :param root:        The AST to start from. If it is not an AST, `visit` is never called, and `root` is returned.
+    :param visit:       Called as visit(node, args) once the values of the arguments of `node` are known. `args` is a
+                        list with the values of the AST arguments, and the other arguments as they are.
+    :param enter:       Optionally called as enter(node) before walking into `node`. It returns DESCEND to walk into its
+                        arguments, or else the value of `node` (and `visit` is then not called on it).
+    :param memo:        A dict from AST hashes to their values. Shared subexpressions are only computed once per memo, so
+                        a memo can be passed in to share the work between several walks. A fresh one is used by
+                        default. It may also be a weakref.WeakValueDictionary.
+    :param on_error:    Optionally called with the list of the ASTs whose values were being computed, from the root
+                        down, if `enter` or `visit` raises. The exception is then re-raised.
+    """
+    if not isinstance(root, Base):
+        return root
+
+    memo = { } if memo is None else memo
+
+    # a node is pushed with a _FINISH marker above it and its arguments above that, so that it is popped again once the
+    # values of all of its arguments are on `values`
+    pending = [ root ]
+    values = [ ]
+    try:
+        while pending:
+            node = pending.pop()
+            if node is _FINISH:
+                node = pending.pop()
+                start = len(values) - len(node.args)
+                args = values[start:]
+                del values[start:]
+                r = visit(node, args)
+                memo[node._hash] = r
+                values.append(r)
+                continue
+
+            if not isinstance(node, Base):
+                values.append(node)
+                continue
+
+            h = node._hash
+            r = memo.get(h, _MISSING)
+            if r is not _MISSING:
+                values.append(r)
+                continue
+
+            r = DESCEND if enter is None else enter(node)
+            if r is not DESCEND:
+                memo[h] = r
+                values.append(r)
+                continue
+
+            pending.append(node)
+            pending.append(_FINISH)
+            pending.extend(reversed(node.args))
+    except Exception:
+        if on_error is not None:
+            on_error([ pending[i - 1] for i, n in enumerate(pending) if n is _FINISH ])
+        raise
+
+    return values.pop()
+
+
+def preorder_pairs(pairs, descend):
+    """
+    Walks ASTs side by side, and yields the distinct pairs of corresponding ASTs, starting with `pairs`. `descend` is
+    called on each yielded pair of ASTs, and returns whether to walk into their arguments, which are then paired by
+    position. Non-AST arguments are paired too, so that they can be compared.
+    """
+    seen = set()
+    stack = list(pairs)
+    stack.reverse()
+    while stack:
+        x, y = stack.pop()
+        if isinstance(x, Base) and isinstance(y, Base):
+            key = (x._hash, y._hash)
+            if key in seen:
+                continue
+            seen.add(key)
+
+        yield x, y
+
+        if isinstance(x, Base) and isinstance(y, Base) and descend(x, y):
+            stack.extend(reversed(list(zip(x.args, y.args))))
+
+
+from .base import Base
@@ -0,0 +1,159 @@
+import weakref
+
+
+class VariableSetPool:
+    """
+    The intern table for the variable sets of ASTs. Many ASTs have the exact same variables (for example, all of the
+    arithmetic over one symbolic buffer), and interning makes them share a single set object.
+
+    Sets are interned by content hash, and held weakly, so that the pool does not keep unused sets alive. The results
+    of union(), issuperset() and isdisjoint() are memoized on their operands. Since frozensets cache their hash and
+    tuples compare their items by identity first, looking up interned operands normally neither hashes nor compares
+    their contents. The memo tables are dropped whenever they grow over `max_memo` entries.
+    """
+
+    # past this many operands, union_all() builds the union in one go instead of folding it through the memo
+    FOLD_LIMIT = 32
+
+    def __init__(self, max_memo=0x10000):
+        self.max_memo = max_memo
+        self.hits = 0
+        self.misses = 0
+        self._pool = weakref.WeakValueDictionary()
+        self._unions = { }
+        self._supersets = { }
+        self._disjoint = { }
+        self.empty = self.intern(frozenset())
+
+    def intern(self, s):
+        """
+        Returns the interned frozenset with the same contents as `s`, which can be any iterable of variable names.
+        """
+        if type(s) is not frozenset:  #pylint:disable=unidiomatic-typecheck
+            s = frozenset(s)
+
+        # frozensets cache their hash, so this is cheap for sets that are already interned
+        h = hash(s)
+        r = self._pool.get(h, None)
+        if r is s or (r is not None and r == s):
+            return r
+
+        if r is None:
+            self._pool[h] = s
+        # on a hash collision, the new set is simply left out of the pool
+        return s
+
+    def union(self, a, b):
+        """
+        Returns the interned union of the interned sets `a` and `b`.
+        """
+        if a is b or not b:
+            return a
+        if not a:
+            return b
+
+        key = (a, b)
+        r = self._unions.get(key, None)
+        if r is not None:
+            self.hits += 1
+            return r
+
+        self.misses += 1
+        r = self.intern(a | b)
+        if len(self._unions) >= self.max_memo:
+            self._unions.clear()
+        self._unions[key] = r
+        self._unions[(b, a)] = r
+        return r
+
+    def union_all(self, sets):
+        """
+        Returns the interned union of a list of interned sets.
+        """
+        if len(sets) > self.FOLD_LIMIT:
+            return self.intern(frozenset().union(*sets))
+        if not sets:
+            return self.empty
+
+        r = sets[0]
+        for s in sets[1:]:
+            r = self.union(r, s)
+        return r
+
+    def issuperset(self, a, b):
+        """
+        Returns whether the interned set `a` contains every element of the interned set `b`.
+        """
+        if a is b or not b:
+            return True
+        if len(a) < len(b):
+            return False
+
+        key = (a, b)
+        r = self._supersets.get(key, None)
+        if r is not None:
+            self.hits += 1
+            return r
+
+        self.misses += 1
+        r = a >= b
+        if len(self._supersets) >= self.max_memo:
+            self._supersets.clear()
+        self._supersets[key] = r
+        return r
+
+    def isdisjoint(self, a, b):
+        """
+        Returns whether the interned sets `a` and `b` have no element in common.
+        """
+        if not a or not b:
+            return True
+        if a is b:
+            return False
+
+        key = (a, b)
+        r = self._disjoint.get(key, None)
+        if r is not None:
+            self.hits += 1
+            return r
+
+        self.misses += 1
+        r = a.isdisjoint(b)
+        if len(self._disjoint) >= self.max_memo:
+            self._disjoint.clear()
+        self._disjoint[key] = r
+        self._disjoint[(b, a)] = r
+        return r
+
+    def clear(self):
+        """
+        Drops the memoized unions and set comparisons. The interned sets themselves go away with their last user.
+        """
+        self._unions.clear()
+        self._supersets.clear()
+        self._disjoint.clear()
+
+    def stats(self):
+        """
+        Returns the counters of this pool as a dict.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._pool),
+            'unions': len(self._unions),
+            'supersets': len(self._supersets),
+            'disjoint': len(self._disjoint),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._pool)
+
+
+variable_sets = VariableSetPool()
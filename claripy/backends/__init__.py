@@ -1,5 +1,6 @@
 import ctypes
 import weakref
+import collections
 import operator
 import threading
 import numbers
@@ -7,6 +8,54 @@ import numbers
 import logging
 l = logging.getLogger('claripy.backend')
 
+class StripedCache:
+    """
+    A cache from the cache keys of ASTs (held weakly) to backend objects, that several threads can use at once. The keys
+    are spread over `stripes` dicts, each one with its own lock, so that threads looking up different ASTs rarely wait
+    on each other.
+    """
+
+    __slots__ = ('_stripes', '_locks')
+
+    def __init__(self, stripes=16):
+        self._stripes = [ weakref.WeakKeyDictionary() for _ in range(stripes) ]
+        self._locks = [ threading.Lock() for _ in range(stripes) ]
+
+    def get(self, key, default=None):
+        i = hash(key) % len(self._stripes)
+        with self._locks[i]:
+            return self._stripes[i].get(key, default)
+
+    def __getitem__(self, key):
+        i = hash(key) % len(self._stripes)
+        with self._locks[i]:
+            return self._stripes[i][key]
+
+    def __setitem__(self, key, value):
+        i = hash(key) % len(self._stripes)
+        with self._locks[i]:
+            self._stripes[i][key] = value
+
+    def __contains__(self, key):
+        i = hash(key) % len(self._stripes)
+        with self._locks[i]:
+            return key in self._stripes[i]
+
+    def __len__(self):
+        return sum(len(stripe) for stripe in self._stripes)
+
+    def items(self):
+        r = [ ]
+        for lock, stripe in zip(self._locks, self._stripes):
+            with lock:
+                r.extend(stripe.items())
+        return r
+
+    def clear(self):
+        for lock, stripe in zip(self._locks, self._stripes):
+            with lock:
+                stripe.clear()
+
 class Backend:
     """
     Backends are Claripy's workhorses. Claripy exposes ASTs (claripy.ast.Base objects)
@@ -48,17 +97,41 @@ class Backend:
     _convert() to see if the backend can handle that type of object.
     """
 
-    __slots__ = ('_op_raw', '_op_expr', '_cache_objects', '_solver_required', '_tls', '_true_cache', '_false_cache', )
+    __slots__ = ('_op_raw', '_op_expr', '_op_raw_table', '_op_expr_table', '_op_tables_key', '_cache_objects',
+                 '_solver_required', '_tls', '_true_cache', '_false_cache', '_shared_object_cache', '_cache_hits',
+                 '_cache_misses', '_verdict_cache_size', '_true_verdicts', '_false_verdicts', '_verdict_hits',
+                 '_verdict_lru_hits', '_verdict_misses', '_verdict_evictions', )
+
+    # whether the objects of this backend can be used from several threads at once (see set_shared_cache())
+    _thread_safe_objects = False
+    # the types of the non-AST arguments that _convert() returns as they are, which the conversion does not call it for
+    _unconverted_types = frozenset((int, str))
 
     def __init__(self, solver_required=None):
         self._op_raw = { }
         self._op_expr = { }
+        self._op_raw_table = None
+        self._op_expr_table = None
+        self._op_tables_key = None
         self._cache_objects = True
         self._solver_required = solver_required is not None
 
         self._tls = threading.local()
         self._true_cache = weakref.WeakKeyDictionary()
         self._false_cache = weakref.WeakKeyDictionary()
+        self._shared_object_cache = None
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+        # the verdicts of is_true() and is_false() by AST hash, which outlive the ASTs and downsize() (see
+        # set_verdict_cache_size())
+        self._verdict_cache_size = 0
+        self._true_verdicts = collections.OrderedDict()
+        self._false_verdicts = collections.OrderedDict()
+        self._verdict_hits = 0
+        self._verdict_lru_hits = 0
+        self._verdict_misses = 0
+        self._verdict_evictions = 0
 
     @property
     def is_smt_backend(self):
@@ -69,9 +142,81 @@ class Backend:
         try:
             return self._tls.object_cache
         except AttributeError:
-            self._tls.object_cache = weakref.WeakKeyDictionary()
+            shared = self._shared_object_cache
+            self._tls.object_cache = weakref.WeakKeyDictionary() if shared is None else shared
             return self._tls.object_cache
 
+    def set_shared_cache(self, enabled=True, stripes=16):
+        """
+        Makes every thread use the same cache of converted objects (a StripedCache with `stripes` stripes), instead of
+        one cache per thread, so that an AST that was converted by one thread is not converted again by the others.
+        This is only possible for the backends whose objects are thread-safe. It should not be changed while an arena
+        (see claripy.arena) is active.
+
+        :param enabled:     Whether the cache is shared. False goes back to one cache per thread.
+        :param stripes:     The number of independently locked parts of the shared cache.
+        """
+        if enabled and not self._thread_safe_objects:
+            raise BackendError("the objects of %s can't be shared between threads" % self.__class__.__name__)
+        self._shared_object_cache = StripedCache(stripes) if enabled else None
+        # the threads pick up the new cache the next time they use it
+        self._tls = threading.local()
+
+    def cache_stats(self):
+        """
+        Returns the counters of the cache of converted objects (of every thread) as a dict. The counters are updated
+        without locking, so they can be slightly off when several threads convert at the same time.
+        """
+        lookups = self._cache_hits + self._cache_misses
+        return {
+            'shared': self._shared_object_cache is not None,
+            'size': len(self._object_cache),
+            'hits': self._cache_hits,
+            'misses': self._cache_misses,
+            'hit_rate': self._cache_hits / lookups if lookups else 0.0,
+        }
+
+    def reset_cache_stats(self):
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    def _op_tables(self):
+        """
+        Returns `self._op_expr` and `self._op_raw` as lists indexed by opcode (see claripy.operations.opcode), with None
+        for the operations that the backend does not implement. The leaf operations that only have a raw operation get
+        an expression operation that calls it, so that leaves are converted without walking into their arguments. The
+        lists are rebuilt whenever new opcodes or operations have been registered since they were last built.
+        """
+        key = (len(operations.op_names), len(self._op_expr), len(self._op_raw))
+        if key != self._op_tables_key:
+            op_expr_table = [ self._op_expr.get(name, None) for name in operations.op_names ]
+            op_raw_table = [ self._op_raw.get(name, None) for name in operations.op_names ]
+            for code, is_leaf in enumerate(operations.opcode_is_leaf):
+                if is_leaf and op_expr_table[code] is None and op_raw_table[code] is not None:
+                    op_expr_table[code] = self._leaf_op(op_raw_table[code])
+            self._op_expr_table = op_expr_table
+            self._op_raw_table = op_raw_table
+            self._op_tables_key = key
+        return self._op_expr_table, self._op_raw_table
+
+    def _leaf_op(self, op):
+        """
+        Returns an expression operation that converts a leaf AST with the raw operation `op`.
+        """
+        unconverted = self._unconverted_types
+
+        def leaf_op(ast):
+            args = [ a if type(a) in unconverted else self._convert(a) for a in ast.args ]
+            try:
+                r = op(*args)
+                if r is NotImplemented:
+                    raise BackendUnsupportedError
+            except BackendUnsupportedError:
+                r = self.default_op(ast)
+            return r
+
+        return leaf_op
+
     def _make_raw_ops(self, op_list, op_dict=None, op_module=None):
         for o in op_list:
             if op_dict is not None:
@@ -119,12 +264,42 @@ class Backend:
 
     def downsize(self):
         """
-        Clears all caches associated with this backend.
+        Clears all caches associated with this backend, except for the verdicts of is_true() and is_false() that are
+        kept by AST hash (see set_verdict_cache_size()).
         """
         self._object_cache.clear()
         self._true_cache.clear()
         self._false_cache.clear()
 
+    def _push_caches(self):
+        """
+        Replaces the caches of this backend that refer to ASTs (in the current thread) with empty ones, for an arena
+        (see claripy.arena), and returns the replaced caches.
+        """
+        saved = self._object_cache
+        self._tls.object_cache = { }
+        return saved
+
+    def _pop_caches(self, saved):
+        """
+        Restores the caches replaced by _push_caches(), and returns the entries of the arena's caches in a form that does
+        not refer to any AST anymore, to be passed to _promote_caches().
+        """
+        object_cache = self._tls.object_cache
+        self._tls.object_cache = saved
+        return [ (k.ast._hash, v) for k, v in object_cache.items() ]
+
+    def _promote_caches(self, entries, table):
+        """
+        Copies the entries returned by _pop_caches() for the ASTs that are still in the hash-consing table `table` to the
+        restored caches, and drops the other ones.
+        """
+        object_cache = self._object_cache
+        for h, v in entries:
+            a = table.get(h, None)
+            if a is not None:
+                object_cache[a._cache_key] = v
+
     def handles(self, expr):
         """
         Checks whether this backend can handle the expression.
@@ -146,84 +321,101 @@ class Backend:
         :param save:    Save the result in the expression's object cache
         :return:        A backend object.
         """
-        ast_queue = [[expr]]
-        arg_queue = []
-        op_queue = []
+        if not isinstance(expr, Base):
+            return self._convert(expr)
+        return self._convert_asts((expr,))[0]
 
-        try:
-            while ast_queue:
-                args_list = ast_queue[-1]
-
-                if args_list:
-                    ast = args_list.pop(0)
-
-                    if type(ast) in {bool, int, str, float} or not isinstance(ast, Base):
-                        converted = self._convert(ast)
-                        arg_queue.append(converted)
-                        continue
-
-                    if self in ast._errored:
-                        raise BackendError("%s can't handle operation %s (%s) due to a failed "
-                                           "conversion on a child node" % (self, ast.op, ast.__class__.__name__))
+    def convert_list(self, args):
+        """
+        Resolves a list of claripy.ast.Base objects (numbers are kept as they are) into objects usable by the backend.
+        The ASTs are converted in a single traversal, so the subexpressions that they share are only converted once,
+        even when the backend does not cache its objects.
 
-                    if self._cache_objects:
-                        cached_obj = self._object_cache.get(ast._cache_key, None)
-                        if cached_obj is not None:
-                            arg_queue.append(cached_obj)
-                            continue
+        :param args:    The expressions.
+        :return:        A list of backend objects.
+        """
+        asts = [ a for a in args if isinstance(a, Base) ]
+        converted = iter(self._convert_asts(asts) if asts else ())
+        return [ next(converted) if isinstance(a, Base) else a if isinstance(a, numbers.Number) else self._convert(a)
+                 for a in args ]
 
-                    op_queue.append(ast)
-                    if ast.op in self._op_expr:
-                        ast_queue.append(None)
-                    else:
-                        ast_queue.append(list(ast.args))
+    def _convert_asts(self, exprs):
+        """
+        Converts a sequence of ASTs, with a memo shared by all of them, and returns the list of the backend objects.
+        """
+        op_expr_table, op_raw_table = self._op_tables()
+        object_cache = self._object_cache if self._cache_objects else None
 
-                else:
-                    ast_queue.pop()
+        apply_annotations = Base._annotations_used
+        hits = 0
+        misses = 0
 
-                    if op_queue:
-                        ast = op_queue.pop()
+        def finish(ast, r):
+            if apply_annotations:
+                for a in ast.annotations:
+                    r = self.apply_annotation(r, a)
 
-                        op = self._op_expr.get(ast.op, None)
-                        if op is not None:
-                            r = op(ast)
+            if object_cache is not None:
+                object_cache[ast._cache_key] = r
+            return r
 
-                        else:
-                            args = arg_queue[-len(ast.args):]
-                            del arg_queue[-len(ast.args):]
+        def enter(ast):
+            nonlocal hits, misses
+            if self in ast._errored:
+                raise BackendError("%s can't handle operation %s (%s) due to a failed "
+                                   "conversion on a child node" % (self, ast.op, ast.__class__.__name__))
 
-                            try:
-                                r = self._call(ast.op, args)
-                            except BackendUnsupportedError:
-                                r = self.default_op(ast)
+            if object_cache is not None:
+                cached_obj = object_cache.get(ast._cache_key, None)
+                if cached_obj is not None:
+                    hits += 1
+                    return cached_obj
+                misses += 1
 
-                        for a in ast.annotations:
-                            r = self.apply_annotation(r, a)
+            op = op_expr_table[ast.opcode]
+            if op is not None:
+                return finish(ast, op(ast))
+            return traversal.DESCEND
 
-                        if self._cache_objects:
-                            self._object_cache[ast._cache_key] = r
+        unconverted = self._unconverted_types
 
-                        arg_queue.append(r)
+        def visit(ast, args):
+            args = [ v if isinstance(a, Base) or type(a) in unconverted else self._convert(a)
+                     for a, v in zip(ast.args, args) ]
+            try:
+                op = op_raw_table[ast.opcode]
+                if op is None:
+                    r = self._call(ast.op, args)
+                else:
+                    # the raw ops don't get the model, cause, for example, Z3 stuff can't take it
+                    r = op(*args)
+                    if r is NotImplemented:
+                        raise BackendUnsupportedError
+            except BackendUnsupportedError:
+                r = self.default_op(ast)
+            return finish(ast, r)
+
+        memo = { }
+        in_progress = [ ]
+        converted = [ ]
+        try:
+            for expr in exprs:
+                converted.append(traversal.postorder_map(expr, visit, enter=enter, memo=memo,
+                                                         on_error=in_progress.extend))
+            return converted
 
         except (RuntimeError, ctypes.ArgumentError) as e:
             raise ClaripyRecursionError("Recursion limit reached. Sorry about that.") from e
 
         except BackendError:
-            for ast in op_queue:
-                ast._errored.add(self)
-            if isinstance(expr, Base):
-                expr._errored.add(self)
+            for ast in in_progress:
+                ast._add_errored(self)
+            expr._add_errored(self)
             raise
 
-        # Note: Uncomment the following assertions if you are touching the above implementation
-        # assert len(op_queue) == 0, "op_queue is not empty"
-        # assert len(ast_queue) == 0, "ast_queue is not empty"
-        # assert len(arg_queue) == 1, ("arg_queue has unexpected length", len(arg_queue))
-
-        return arg_queue.pop()
-
-    def convert_list(self, args):
-        return [ a if isinstance(a, numbers.Number) else self.convert(a) for a in args ]
+        finally:
+            self._cache_hits += hits
+            self._cache_misses += misses
 
     #
     # These functions provide support for applying operations to expressions.
@@ -311,14 +503,22 @@ class Backend:
         if not isinstance(e, Base):
             return self._is_true(self.convert(e), extra_constraints=extra_constraints, solver=solver, model_callback=model_callback)
 
-        try:
-            return self._true_cache[e.cache_key]
-        except KeyError:
+        t = self._true_cache.get(e.cache_key, None)
+        if t is not None:
+            if self._verdict_cache_size:
+                self._verdict_hits += 1
+            return t
+
+        t = self._verdict(self._true_verdicts, e)
+        if t is None:
             t = self._is_true(self.convert(e), extra_constraints=extra_constraints, solver=solver, model_callback=model_callback)
-            self._true_cache[e.cache_key] = t
+            self._add_verdict(self._true_verdicts, e, t)
             if t is True:
-                self._false_cache[e.cache_key] = False
-            return t
+                self._add_verdict(self._false_verdicts, e, False)
+        self._true_cache[e.cache_key] = t
+        if t is True:
+            self._false_cache[e.cache_key] = False
+        return t
 
     def is_false(self, e, extra_constraints=(), solver=None, model_callback=None): #pylint:disable=unused-argument
         """
@@ -335,14 +535,102 @@ class Backend:
         if not isinstance(e, Base):
             return self._is_false(self.convert(e), extra_constraints=extra_constraints, solver=solver, model_callback=model_callback)
 
-        try:
-            return self._false_cache[e.cache_key]
-        except KeyError:
+        f = self._false_cache.get(e.cache_key, None)
+        if f is not None:
+            if self._verdict_cache_size:
+                self._verdict_hits += 1
+            return f
+
+        f = self._verdict(self._false_verdicts, e)
+        if f is None:
             f = self._is_false(self.convert(e), extra_constraints=extra_constraints, solver=solver, model_callback=model_callback)
-            self._false_cache[e.cache_key] = f
+            self._add_verdict(self._false_verdicts, e, f)
             if f is True:
-                self._true_cache[e.cache_key] = False
-            return f
+                self._add_verdict(self._true_verdicts, e, False)
+        self._false_cache[e.cache_key] = f
+        if f is True:
+            self._true_cache[e.cache_key] = False
+        return f
+
+    #
+    # The verdicts of is_true() and is_false(), by AST hash
+    #
+
+    def set_verdict_cache_size(self, size):
+        """
+        Changes the maximum number of verdicts of is_true() and of is_false() that are kept by AST hash, in addition to
+        the caches that are keyed by the ASTs themselves. These verdicts are found again when an AST is recreated after
+        the previous one was freed, and they are not cleared by downsize(). 0 (the default) disables them (and drops
+        them).
+        """
+        self._verdict_cache_size = size
+        for verdicts in (self._true_verdicts, self._false_verdicts):
+            self._evict_verdicts(verdicts, size)
+
+    def clear_verdict_cache(self):
+        """
+        Drops the verdicts that are kept by AST hash.
+        """
+        self._true_verdicts.clear()
+        self._false_verdicts.clear()
+
+    def verdict_cache_stats(self):
+        """
+        Returns the counters of the verdicts of is_true() and is_false() as a dict. `hits` counts the verdicts that were
+        found in the caches keyed by the ASTs, and `lru_hits` the ones that were only found by AST hash. Nothing is
+        counted while the verdicts are not kept by AST hash.
+        """
+        lookups = self._verdict_hits + self._verdict_lru_hits + self._verdict_misses
+        return {
+            'verdict_cache_size': self._verdict_cache_size,
+            'size': len(self._true_verdicts) + len(self._false_verdicts),
+            'hits': self._verdict_hits,
+            'lru_hits': self._verdict_lru_hits,
+            'misses': self._verdict_misses,
+            'evictions': self._verdict_evictions,
+            'hit_rate': (self._verdict_hits + self._verdict_lru_hits) / lookups if lookups else 0.0,
+        }
+
+    def reset_verdict_cache_stats(self):
+        self._verdict_hits = 0
+        self._verdict_lru_hits = 0
+        self._verdict_misses = 0
+        self._verdict_evictions = 0
+
+    def _verdict(self, verdicts, e):
+        """
+        Returns the verdict that `verdicts` keeps for the hash of `e`, or None.
+        """
+        if not self._verdict_cache_size:
+            return None
+        r = verdicts.get(e._hash, None)
+        if r is None:
+            self._verdict_misses += 1
+            return None
+        self._verdict_lru_hits += 1
+        try:
+            verdicts.move_to_end(e._hash)
+        except KeyError:
+            # another thread evicted it in the meantime
+            pass
+        return r
+
+    def _add_verdict(self, verdicts, e, r):
+        if self._verdict_cache_size:
+            verdicts[e._hash] = r
+            self._evict_verdicts(verdicts, self._verdict_cache_size)
+
+    def _evict_verdicts(self, verdicts, size):
+        """
+        Drops the least recently used verdicts beyond `size`. The verdicts are shared by every thread, without a lock, so
+        they may be evicted by another thread at the same time.
+        """
+        while len(verdicts) > size:
+            try:
+                verdicts.popitem(last=False)
+            except KeyError:
+                break
+            self._verdict_evictions += 1
 
     def _is_false(self, e, extra_constraints=(), solver=None, model_callback=None): #pylint:disable=no-self-use,unused-argument
         """
@@ -778,6 +1066,7 @@ class Backend:
         raise BackendError('Backend %s does not support operation %s' % (self, expr.op))
 
 from ..errors import BackendError, ClaripyRecursionError, BackendUnsupportedError
+from .. import operations
 from .backend_z3 import BackendZ3
 from .backend_z3_parallel import BackendZ3Parallel
 from .backend_concrete import BackendConcrete
@@ -785,3 +1074,4 @@ from .backend_vsa import BackendVSA
 from .backend_smtlib import BackendSMTLibBase
 from .backend_smtlib_solvers import *
 from ..ast.base import Base
+from ..ast import traversal
@@ -12,6 +12,9 @@ class BackendConcrete(Backend):
 
     __slots__ = tuple()
 
+    _thread_safe_objects = True
+    _unconverted_types = frozenset((int, str, bytes))
+
     def __init__(self):
         Backend.__init__(self)
         self._make_raw_ops(set(backend_operations) - { 'If' }, op_module=bv)
@@ -75,8 +78,11 @@ class BackendConcrete(Backend):
             if expr.op == "BVV":
                 cached_obj = self._object_cache.get(expr._cache_key, None)
                 if cached_obj is None:
+                    self._cache_misses += 1
                     cached_obj = self.BVV(*expr.args)
                     self._object_cache[expr._cache_key] = cached_obj
+                else:
+                    self._cache_hits += 1
                 return cached_obj
         if type(expr) is Bool and expr.op == "BoolV":
             return expr.args[0]
@@ -107,7 +113,7 @@ class BackendConcrete(Backend):
             return a == b
 
     def _convert(self, a):
-        if type(a) in {int, str, bytes}:
+        if type(a) in self._unconverted_types:
             return a
         if isinstance(a, (numbers.Number, bv.BVV, fp.FPV, fp.RM, fp.FSort, strings.StringV)):
             return a
@@ -52,6 +52,8 @@ def convert_args(f):
     return converter
 
 class BackendVSA(Backend):
+    _thread_safe_objects = True
+
     def __init__(self):
         Backend.__init__(self)
         # self._make_raw_ops(set(expression_operations) - set(expression_set_operations), op_module=BackendVSA)
@@ -101,6 +103,9 @@ class BackendVSA(Backend):
     def convert(self, expr):
         return Backend.convert(self, expr.ite_excavated if isinstance(expr, Base) else expr)
 
+    def convert_list(self, args):
+        return Backend.convert_list(self, [ a.ite_excavated if isinstance(a, Base) else a for a in args ])
+
     def _convert(self, a):
         if isinstance(a, numbers.Number):
             return a
@@ -120,6 +120,12 @@ class BackendZ3(Backend):
 
         self._ast_cache_size = ast_cache_size
 
+        # the cross-thread cache of converted objects (see set_shared_cache()), kept in a context of its own
+        self._translation_cache = None
+        self._translation_context = None
+        self._translation_lock = threading.Lock()
+        self._translations = 0
+
         # and the operations
         all_ops = backend_fp_operations | backend_operations if supports_fp else backend_operations
         for o in all_ops - {'BVV', 'BoolV', 'FPV', 'FPS', 'BitVec', 'StringV'}:
@@ -252,6 +258,103 @@ class BackendZ3(Backend):
         self._simplification_cache_key.clear()
         self._simplification_cache_val.clear()
 
+    def set_shared_cache(self, enabled=True, stripes=16):  # pylint:disable=unused-argument
+        """
+        Z3 objects belong to the context of the thread that created them, so they can't be shared between threads.
+        Instead, the objects that any thread converts from an AST are translated (with z3.AstRef.translate) into a
+        context that is only used under a lock, and the other threads translate them from there into their own contexts
+        instead of converting the AST again.
+
+        :param enabled:     Whether the translation cache is used.
+        :param stripes:     Ignored, since the translation context can only be used by one thread at a time anyway.
+        """
+        with self._translation_lock:
+            if enabled:
+                if self._translation_cache is None:
+                    self._translation_context = z3.Context()
+                    # the entries are only ever dropped under the lock (they hold the ASTs strongly, like _ast_cache), so
+                    # that the translation context is not used by the thread that happens to collect them
+                    self._translation_cache = LRUCache(self._ast_cache_size)
+            else:
+                self._translation_cache = None
+                self._translation_context = None
+
+    def cache_stats(self):
+        stats = Backend.cache_stats(self)
+        stats['shared'] = self._translation_cache is not None
+        stats['translations'] = self._translations
+        stats['translation_size'] = 0 if self._translation_cache is None else len(self._translation_cache)
+        return stats
+
+    def reset_cache_stats(self):
+        Backend.reset_cache_stats(self)
+        self._translations = 0
+
+    def convert(self, expr):
+        """
+        Override Backend.convert() to go through the translation cache, when it is enabled.
+        """
+        translation_cache = self._translation_cache
+        if translation_cache is None or not self._cache_objects or not isinstance(expr, Base):
+            return Backend.convert(self, expr)
+
+        key = expr._cache_key
+        object_cache = self._object_cache
+        if object_cache.get(key, None) is None:
+            with self._translation_lock:
+                shared = translation_cache.get(key, None)
+                r = None if shared is None else shared.translate(self._context)
+            if r is not None:
+                self._translations += 1
+                # the variables are recorded when they are converted, which they were not in this thread
+                extra_bvs_data = self.extra_bvs_data
+                for leaf in expr.leaf_asts():
+                    if leaf.op == 'BVS':
+                        extra_bvs_data.setdefault(leaf._encoded_name, (leaf.args, leaf.annotations))
+                object_cache[key] = r
+                return r
+
+        r = Backend.convert(self, expr)
+        if isinstance(r, z3.AstRef):
+            with self._translation_lock:
+                translation_cache = self._translation_cache
+                if translation_cache is not None and key not in translation_cache:
+                    translation_cache[key] = r.translate(self._translation_context)
+        return r
+
+    def convert_list(self, args):
+        if self._translation_cache is None:
+            return Backend.convert_list(self, args)
+        return [ a if isinstance(a, numbers.Number) else self.convert(a) for a in args ]
+
+    def _push_caches(self):
+        saved = Backend._push_caches(self)
+        ast_cache = self._ast_cache
+        self._tls.ast_cache = SmartLRUCache(self._ast_cache_size, evict=self._pop_from_ast_cache)
+        return saved, ast_cache
+
+    def _pop_caches(self, saved):
+        saved, ast_cache = saved
+        entries = Backend._pop_caches(self, saved)
+        arena_ast_cache = self._tls.ast_cache
+        self._tls.ast_cache = ast_cache
+        # the arena's cache is dropped without evicting its entries, whose references are released (or handed over to
+        # the restored cache) by _promote_caches()
+        ast_entries = [ (h, a._hash, raw_ast) for h, (a, raw_ast) in arena_ast_cache.items() ]
+        return entries, ast_entries
+
+    def _promote_caches(self, entries, table):
+        entries, ast_entries = entries
+        Backend._promote_caches(self, entries, table)
+
+        ast_cache = self._ast_cache
+        for h, a_hash, raw_ast in ast_entries:
+            a = table.get(a_hash, None)
+            if a is not None and h not in ast_cache:
+                ast_cache[h] = (a, raw_ast)
+            else:
+                z3.Z3_dec_ref(self._context.ctx, raw_ast)
+
     @condom
     def _size(self, a):
         if not isinstance(a, z3.BitVecRef) and not isinstance(a, z3.BitVecNumRef):
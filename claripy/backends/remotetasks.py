@@ -13,6 +13,8 @@ from celery.contrib import rdb
 import pymongo
 import bson
 
+from ..ast.base import canonical_hashes
+
 app = celery.Celery('tasks', broker='amqp://guest@localhost//', backend='mongodb://localhost/')
 app.config_from_object(celeryconfig)
 z3 = None
@@ -35,11 +37,14 @@ def split_and_canonicalize(constraints):
     # TODO: deal with different *orders* of constraints
     parts = {}
     for _, cset in independent:
-        mapping, all_canonicalized = canonicalize_all(cset)
+        # the canonical hashes identify the constraints up to variable renaming without building renamed copies of them,
+        # which are only built for the parts that are actually solved (in results()). They are the same in every
+        # worker, so they can key the lemma cache.
         # note: the `sorted` does not fix the above TODO because it
         # does not account for different orderings in variable
         # renamings
-        parts[tuple(sorted(str(e._hash) for e in all_canonicalized))] = (mapping, all_canonicalized)
+        hashes, _ = canonical_hashes(cset)
+        parts[tuple(sorted(str(h) for h in hashes))] = cset
     return parts
 
 @app.task
@@ -151,7 +156,8 @@ def results(constraints):
 
     s = z3.solver()
 
-    for uuids, (mapping, exprs) in parts.items():
+    for uuids, cset in parts.items():
+        mapping, exprs = canonicalize_all(cset)
         if all(e.is_true() for e in exprs):
             continue
 
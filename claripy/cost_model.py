@@ -0,0 +1,85 @@
+"""
+The cost model that the frontends query to decide how to route expensive work: whether to simplify constraints before a
+query, and whether to try an approximation (such as VSA) before an exact solve.
+
+The model only looks at the metrics that ASTs keep once they are computed (see Base.tree_size), so querying it again on
+growing constraints only looks at their new subexpressions.
+The default model keeps the historical behavior of the frontends (always simplify, never approximate unless asked to);
+install a different one with set_cost_model().
+"""
+
+
+class CostModel:
+    """
+    Estimates the cost of solving ASTs as a weighted sum of their metrics.
+
+    :ivar size_weight:              The weight of every node (see Base.tree_size).
+    :ivar leaf_weight:              The weight of every occurrence of a variable (see Base.symbolic_leaf_count).
+    :ivar nonlinear_weight:         The weight of every nonlinear operation (see Base.nonlinear_count).
+    :ivar simplify_threshold:       The cost of constraints from which they are simplified before expensive queries,
+                                    or None to never simplify them.
+    :ivar approximate_threshold:    The cost of a query from which it is tried on an approximation first, or None to
+                                    only do so when asked to.
+    """
+
+    def __init__(self, size_weight=1, leaf_weight=1, nonlinear_weight=64, simplify_threshold=0,
+                 approximate_threshold=None):
+        self.size_weight = size_weight
+        self.leaf_weight = leaf_weight
+        self.nonlinear_weight = nonlinear_weight
+        self.simplify_threshold = simplify_threshold
+        self.approximate_threshold = approximate_threshold
+
+    def cost(self, e):
+        """
+        Returns the estimated cost of the AST `e`. Anything else is free.
+        """
+        if not isinstance(e, Base):
+            return 0
+        return (self.size_weight * e.tree_size + self.leaf_weight * e.symbolic_leaf_count +
+                self.nonlinear_weight * e.nonlinear_count)
+
+    def total_cost(self, exprs):
+        """
+        Returns the estimated cost of a list of ASTs.
+        """
+        return sum(self.cost(e) for e in exprs)
+
+    def should_simplify(self, constraints):
+        """
+        Returns whether a list of constraints should be simplified before an expensive query on them.
+        """
+        if self.simplify_threshold is None:
+            return False
+        return self.simplify_threshold <= 0 or self.total_cost(constraints) >= self.simplify_threshold
+
+    def should_approximate(self, exprs, constraints):
+        """
+        Returns whether a query on a list of ASTs under a list of constraints should be tried on an approximation first.
+        """
+        if self.approximate_threshold is None:
+            return False
+        return self.total_cost(exprs) + self.total_cost(constraints) >= self.approximate_threshold
+
+
+_cost_model = CostModel()
+
+def get_cost_model():
+    """
+    Returns the cost model that the frontends query.
+    """
+    return _cost_model
+
+def set_cost_model(model):
+    """
+    Installs the cost model that the frontends query, and returns the previous one.
+
+    :param model:   A CostModel (or anything that implements its methods), or None for the default one.
+    """
+    global _cost_model #pylint:disable=global-statement
+    previous = _cost_model
+    _cost_model = CostModel() if model is None else model
+    return previous
+
+
+from .ast.base import Base
@@ -9,7 +9,7 @@ class ModelCache:
 
     def __init__(self, model):
         self.model = model
-        self.replacements = weakref.WeakKeyDictionary()
+        self.replacer = Replacer(leaf_operation=self._leaf_op)
 
     def __hash__(self):
         if not hasattr(self, '_hash'):
@@ -24,7 +24,7 @@ class ModelCache:
 
     def __setstate__(self, s):
         self.model = s[0]
-        self.replacements = weakref.WeakKeyDictionary()
+        self.replacer = Replacer(leaf_operation=self._leaf_op)
 
     #
     # Splitting support
@@ -54,7 +54,7 @@ class ModelCache:
         """
         # If there was no last value, it was not constrained, so we can use
         # anything.
-        new_ast = ast.replace_dict(self.replacements, leaf_operation=self._leaf_op)
+        new_ast = self.replacer.replace(ast)
         return backends.concrete.eval(new_ast, 1)[0]
 
     def eval_constraints(self, constraints):
@@ -311,3 +311,4 @@ class ModelCacheMixin:
 from .. import backends, false
 from ..errors import UnsatError
 from ..ast import all_operations, Base
+from ..ast.replacer import Replacer
@@ -1,18 +1,29 @@
 class SimplifyHelperMixin:
+    """
+    Simplifies the constraints before the queries that are expensive on unsimplified constraints, when the cost model
+    (see claripy.cost_model) says that they are worth simplifying.
+    """
+
+    def _simplify_before_query(self):
+        if cost_model.get_cost_model().should_simplify(self.constraints):
+            self.simplify()
+
     def max(self, *args, **kwargs):
-        self.simplify()
+        self._simplify_before_query()
         return super(SimplifyHelperMixin, self).max(*args, **kwargs)
 
     def min(self, *args, **kwargs):
-        self.simplify()
+        self._simplify_before_query()
         return super(SimplifyHelperMixin, self).min(*args, **kwargs)
 
     def eval(self, e, n, *args, **kwargs):
         if n > 1:
-            self.simplify()
+            self._simplify_before_query()
         return super(SimplifyHelperMixin, self).eval(e, n, *args, **kwargs)
 
     def batch_eval(self, e, n, *args, **kwargs):
         if n > 1:
-            self.simplify()
+            self._simplify_before_query()
         return super(SimplifyHelperMixin, self).batch_eval(e, n, *args, **kwargs)
+
+from .. import cost_model
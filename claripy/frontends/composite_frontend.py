@@ -98,20 +98,21 @@ class CompositeFrontend(ConstrainedFrontend):
 
     @staticmethod
     def _names_for(names=None, lst=None, lst2=None, e=None, v=None):
-        if names is None:
-            names = set()
+        variables = [ ]
         if e is not None and isinstance(e, Base):
-            names.update(e.variables)
+            variables.append(e.variables)
         if v is not None and isinstance(v, Base):
-            names.update(v.variables)
-        if lst is not None:
-            for ee in lst:
-                if isinstance(ee, Base):
-                    names.update(ee.variables)
-        if lst2 is not None:
-            for ee in lst2:
-                if isinstance(ee, Base):
-                    names.update(ee.variables)
+            variables.append(v.variables)
+        if lst:
+            variables += [ ee.variables for ee in lst if isinstance(ee, Base) ]
+        if lst2:
+            variables += [ ee.variables for ee in lst2 if isinstance(ee, Base) ]
+
+        # the variable sets of ASTs are interned, so the union of the same sets is only ever computed once
+        variables = variable_sets.union_all(variables)
+        if names is None:
+            return variables
+        names.update(variables)
         return names
 
     def _merged_solver_for(self, *args, **kwargs):
@@ -387,8 +388,9 @@ class CompositeFrontend(ConstrainedFrontend):
         new_constraints = [ ]
 
         l.debug("Simplifying %r with %d solvers", self, len(self._solver_list))
+        model = cost_model.get_cost_model()
         for s in self._solver_list:
-            if isinstance(s, SimplifySkipperMixin) and s._simplified:
+            if isinstance(s, SimplifySkipperMixin) and s._simplified or not model.should_simplify(s.constraints):
                 new_constraints += s.constraints
                 continue
 
@@ -485,8 +487,10 @@ class CompositeFrontend(ConstrainedFrontend):
         return [ s.branch() for s in self._solver_list ]
 
 from ..ast import Base
+from ..ast.variable_set import variable_sets
 from ..ast.bool import Or
 from .. import backends
 from ..errors import BackendError, UnsatError
 from ..frontend_mixins.model_cache_mixin import ModelCacheMixin
 from ..frontend_mixins.simplify_skipper_mixin import SimplifySkipperMixin
+from .. import cost_model
@@ -104,12 +104,16 @@ class ConstrainedFrontend(Frontend):  # pylint:disable=abstract-method
         return constraints
 
     def simplify(self):
-        to_simplify = [ c for c in self.constraints if not any(
-            isinstance(a, SimplificationAvoidanceAnnotation) for a in c.annotations
-        ) ]
-        no_simplify = [ c for c in self.constraints if any(
-            isinstance(a, SimplificationAvoidanceAnnotation) for a in c.annotations
-        ) ]
+        if not Base._annotations_used:
+            to_simplify = self.constraints
+            no_simplify = [ ]
+        else:
+            to_simplify = [ c for c in self.constraints if not any(
+                isinstance(a, SimplificationAvoidanceAnnotation) for a in c.annotations
+            ) ]
+            no_simplify = [ c for c in self.constraints if any(
+                isinstance(a, SimplificationAvoidanceAnnotation) for a in c.annotations
+            ) ]
 
         if len(to_simplify) == 0:
             return self.constraints
@@ -149,6 +153,6 @@ class ConstrainedFrontend(Frontend):  # pylint:disable=abstract-method
     def is_false(self, e, extra_constraints=(), exact=None):
         raise NotImplementedError("is_false() is not implemented")
 
-from ..ast.base import simplify
+from ..ast.base import Base, simplify
 from ..ast.bool import And, Or
 from ..annotation import SimplificationAvoidanceAnnotation
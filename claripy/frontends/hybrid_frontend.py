@@ -89,21 +89,24 @@ class HybridFrontend(Frontend):
 
         return solutions[:n]
 
+    def _should_approximate_first(self, exprs):
+        return self._approximate_first or cost_model.get_cost_model().should_approximate(exprs, self.constraints)
+
     def satisfiable(self, extra_constraints=(), exact=None):
         return self._hybrid_call('satisfiable', extra_constraints=extra_constraints, exact=exact)
 
     def eval_to_ast(self, e, n, extra_constraints=(), exact=None):
-        if self._approximate_first and exact is None and n > 2:
+        if exact is None and n > 2 and self._should_approximate_first((e,)):
             return self._approximate_first_call('eval_to_ast', e, n, extra_constraints=extra_constraints)
         return self._hybrid_call('eval_to_ast', e, n, extra_constraints=extra_constraints, exact=exact)
 
     def eval(self, e, n, extra_constraints=(), exact=None):
-        if self._approximate_first and exact is None and n > 2:
+        if exact is None and n > 2 and self._should_approximate_first((e,)):
             return self._approximate_first_call('eval', e, n, extra_constraints=extra_constraints)
         return self._hybrid_call('eval', e, n, extra_constraints=extra_constraints, exact=exact)
 
     def batch_eval(self, e, n, extra_constraints=(), exact=None):
-        if self._approximate_first and exact is None and n > 2:
+        if exact is None and n > 2 and self._should_approximate_first(e):
             return self._approximate_first_call('batch_eval', e, n, extra_constraints=extra_constraints)
         return self._hybrid_call('batch_eval', e, n, extra_constraints=extra_constraints, exact=exact)
 
@@ -178,3 +181,4 @@ class HybridFrontend(Frontend):
 
 
 from ..errors import ClaripyFrontendError
+from .. import cost_model
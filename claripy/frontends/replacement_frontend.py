@@ -2,7 +2,6 @@
 
 import logging
 import numbers
-import weakref
 
 l = logging.getLogger("claripy.frontends.replacement_frontend")
 
@@ -18,7 +17,7 @@ class ReplacementFrontend(ConstrainedFrontend):
         self._replace_constraints = False if replace_constraints is None else replace_constraints
         self._unsafe_replacement = False if unsafe_replacement is None else unsafe_replacement
         self._replacements = {} if replacements is None else replacements
-        self._replacement_cache = weakref.WeakKeyDictionary() if replacement_cache is None else replacement_cache
+        self._replacement_cache = Replacer(self._replacements) if replacement_cache is None else replacement_cache
 
         self._validation_frontend = None
 
@@ -31,7 +30,7 @@ class ReplacementFrontend(ConstrainedFrontend):
         c._replace_constraints = self._replace_constraints
         c._unsafe_replacement = self._unsafe_replacement
         c._replacements = {}
-        c._replacement_cache = weakref.WeakKeyDictionary()
+        c._replacement_cache = Replacer()
 
         if self._validation_frontend is not None:
             c._validation_frontend = self._validation_frontend.blank_copy()
@@ -61,7 +60,7 @@ class ReplacementFrontend(ConstrainedFrontend):
         if not replace and old.cache_key in self._replacements:
             return
 
-        if not promote and old.cache_key in self._replacement_cache:
+        if not promote and self._replacement_cache.cached(old) is not None:
             return
 
         if not isinstance(new, Base):
@@ -73,40 +72,26 @@ class ReplacementFrontend(ConstrainedFrontend):
                 return
 
         if invalidate_cache:
+            # the replacements are shared with our copies, so they are copied on write
             self._replacements = dict(self._replacements)
-            self._replacement_cache = weakref.WeakKeyDictionary(self._replacements)
+            self._replacement_cache = self._replacement_cache.copy()
 
         self._replacements[old.cache_key] = new
-        self._replacement_cache[old.cache_key] = new
+        self._replacement_cache.add(old, new)
 
     def remove_replacements(self, old_entries):
         self._replacements = {k: v for k, v in self._replacements.items() if k not in old_entries}
-        self._replacement_cache = weakref.WeakKeyDictionary(self._replacements)
+        self._replacement_cache = Replacer(self._replacements)
 
     def clear_replacements(self):
         self._replacements = dict()
-        self._replacement_cache = weakref.WeakKeyDictionary(self._replacements)
+        self._replacement_cache = Replacer()
 
     def _replacement(self, old):
-        # depressing hack
-        try:
-            if not self._replacement_cache:
-                return old
-        except RuntimeError:
-            if not self._replacement_cache:
-                return old
-
-        if not isinstance(old, Base):
+        if not self._replacement_cache or not isinstance(old, Base):
             return old
 
-        try:
-            return self._replacement_cache[old.cache_key]
-        except KeyError:
-            # not found in the cache
-            new = old.replace_dict(self._replacement_cache)
-            if new is not old:
-                self._replacement_cache[old.cache_key] = new
-            return new
+        return self._replacement_cache.replace(old)
 
     def _add_solve_result(self, e, er, r):
         if not self._auto_replace:
@@ -123,7 +108,7 @@ class ReplacementFrontend(ConstrainedFrontend):
 
     def downsize(self):
         self._actual_frontend.downsize()
-        self._replacement_cache.clear()
+        self._replacement_cache.downsize()
 
     def __getstate__(self):
         return (
@@ -152,7 +137,7 @@ class ReplacementFrontend(ConstrainedFrontend):
         ) = s
 
         super().__setstate__(base_state)
-        self._replacement_cache = weakref.WeakKeyDictionary(self._replacements)
+        self._replacement_cache = Replacer(self._replacements)
 
     #
     # Replacement solving
@@ -278,6 +263,7 @@ class ReplacementFrontend(ConstrainedFrontend):
 
 
 from ..ast.base import Base
+from ..ast.replacer import Replacer
 from ..ast.bv import BVV
 from ..ast.bool import BoolV, false
 from ..errors import ClaripyFrontendError, BackendError
@@ -9,6 +9,9 @@ def op(name, arg_types, return_type, extra_check=None, calc_length=None, do_coer
     else:
         raise ClaripyOperationError("op {} got weird arg_types".format(name))
 
+    name_opcode = opcode(name)
+    args_match = _args_matcher(arg_types)
+
     def _type_fixer(args):
         num_args = len(args)
         if expected_num_args is not None and num_args != expected_num_args:
@@ -39,7 +42,8 @@ def op(name, arg_types, return_type, extra_check=None, calc_length=None, do_coer
                 yield arg
 
     def _op(*args):
-        fixed_args = tuple(_type_fixer(args))
+        # the arguments usually have the right types already, and then there is nothing to fix
+        fixed_args = args if args_match(args) else tuple(_type_fixer(args))
         if _d._DEBUG:
             for i in fixed_args:
                 if i is NotImplemented:
@@ -50,7 +54,7 @@ def op(name, arg_types, return_type, extra_check=None, calc_length=None, do_coer
                     raise ClaripyOperationError(msg)
 
         #pylint:disable=too-many-nested-blocks
-        simp = _handle_annotations(simplifications.simpleton.simplify(name, fixed_args), args)
+        simp = _handle_annotations(simplifications.simpleton.simplify_opcode(name_opcode, fixed_args), args)
         if simp is not None:
             return simp
 
@@ -59,8 +63,10 @@ def op(name, arg_types, return_type, extra_check=None, calc_length=None, do_coer
             kwargs['length'] = calc_length(*fixed_args)
 
         kwargs['uninitialized'] = None
-        if any(a.uninitialized is True for a in args if isinstance(a, ast.Base)):
-            kwargs['uninitialized'] = True
+        for a in args:
+            if isinstance(a, ast.Base) and a.uninitialized is True:
+                kwargs['uninitialized'] = True
+                break
         if name in preprocessors:
             args, kwargs = preprocessors[name](*args, **kwargs)
 
@@ -69,11 +75,43 @@ def op(name, arg_types, return_type, extra_check=None, calc_length=None, do_coer
     _op.calc_length = calc_length
     return _op
 
+def _args_matcher(arg_types):
+    """
+    Returns a function that checks whether a tuple of arguments already has the argument types of an operation (so that
+    _type_fixer() would return them unchanged). The common arities are unrolled.
+    """
+    if type(arg_types) is type: #pylint:disable=unidiomatic-typecheck
+        def _match(args):
+            for a in args:
+                if not isinstance(a, arg_types):
+                    return False
+            return True
+        return _match
+
+    arg_types = tuple(arg_types)
+    n = len(arg_types)
+    if n == 1:
+        t0, = arg_types
+        return lambda args: len(args) == 1 and isinstance(args[0], t0)
+    if n == 2:
+        t0, t1 = arg_types
+        return lambda args: len(args) == 2 and isinstance(args[0], t0) and isinstance(args[1], t1)
+    if n == 3:
+        t0, t1, t2 = arg_types
+        return lambda args: (len(args) == 3 and isinstance(args[0], t0) and isinstance(args[1], t1) and
+                             isinstance(args[2], t2))
+    return lambda args: len(args) == n and all(isinstance(a, t) for a, t in zip(args, arg_types))
+
 def _handle_annotations(simp, args):
     if simp is None:
         return None
+    if not ast.Base._annotations_used:
+        return simp
 
-    ast_args = tuple(a for a in args if isinstance(a, ast.Base))
+    # only the arguments with annotations somewhere below them have any to relocate or to lose
+    ast_args = tuple(a for a in args if isinstance(a, ast.Base) and a.has_nested_annotations)
+    if not ast_args:
+        return simp
     preserved_relocatable = frozenset(simp._relocatable_annotations)
     relocated_annotations = set()
     bad_eliminated = 0
@@ -514,6 +552,51 @@ op_precedence = {  # based on https://en.cppreference.com/w/c/language/operator_
 
 commutative_operations = { '__and__', '__or__', '__xor__', '__add__', '__mul__', 'And', 'Or', 'Xor', }
 
+# operations that are nonlinear (and expensive to solve) when more than one of their arguments is symbolic
+nonlinear_operations = { '__mul__', '__floordiv__', '__mod__', '__div__', '__truediv__', 'SDiv', 'SMod', }
+
+# the flattened n-ary operations whose ASTs can be built as extensions of a shorter AST of the same operation (see
+# Base.__new__). Their arguments are folded into their hash one at a time.
+extendable_operations = { 'And', 'Or', '__add__', '__xor__', '__or__', '__and__', }
+
+#
+# Opcodes
+#
+# Every operation name is mapped to a small integer, which is stored on each AST next to the string op. Hot paths (the
+# backends' converters, the simplifier dispatch and the leaf checks in claripy.ast.base) index per-opcode lists with it
+# instead of hashing the op string into sets and dicts. Operations that are not known here get an opcode the first
+# time they are seen.
+#
+
+op_names = [ ]
+opcodes = { }
+opcode_is_leaf = [ ]
+opcode_is_symbolic_leaf = [ ]
+opcode_is_nonlinear = [ ]
+opcode_is_extendable = [ ]
+
+def opcode(name):
+    """
+    Returns the opcode of operation `name`, allocating a new one if the operation has never been seen before.
+    """
+    try:
+        return opcodes[name]
+    except KeyError:
+        code = len(op_names)
+        op_names.append(name)
+        opcode_is_leaf.append(name in leaf_operations)
+        opcode_is_symbolic_leaf.append(name in leaf_operations_symbolic)
+        opcode_is_nonlinear.append(name in nonlinear_operations)
+        opcode_is_extendable.append(name in extendable_operations)
+        opcodes[name] = code
+        return code
+
+for _name in sorted(
+        expression_operations | backend_operations_all | backend_symbol_creation_operations | backend_fp_operations |
+        backend_strings_operations | set(opposites) | set(inverse_operations) | {'Identical', 'Reversed', 'Xor'}):
+    opcode(_name)
+del _name
+
 from .errors import ClaripyOperationError, ClaripyTypeError
 from . import simplifications
 from . import ast
@@ -1,43 +1,394 @@
 import collections
 import itertools
 import operator
+import weakref
 
 from functools import reduce
 
 
-class SimplificationManager:
+class Rule:
+    """
+    A rewrite rule of the simplifier.
+
+    :ivar op:           The operation that the rule rewrites.
+    :ivar rewrite:      The function that rewrites the operation. It is called with the arguments of the operation, and
+                        returns the new AST, or None if the rule does not apply after all.
+    :ivar patterns:     The arguments that the rule applies to, as a list of alternatives. Each alternative is a tuple
+                        with an entry per argument (from the first one, missing entries match anything): the op that the
+                        argument must have, a collection of such ops, or None to match anything.
+    :ivar name:         The name of the rule.
+    :ivar hits:         The number of operations that the rule rewrote.
+    """
+
+    __slots__ = ('op', 'rewrite', 'patterns', 'name', 'hits', 'order')
+
+    def __init__(self, op, rewrite, patterns, name, order):
+        self.op = op
+        self.rewrite = rewrite
+        self.patterns = patterns
+        self.name = name
+        self.hits = 0
+        self.order = order
+
+    def __repr__(self):
+        return '<Rule %s for %s>' % (self.name, self.op)
+
+
+class _RuleNode:
+    """
+    A node of a discrimination tree of rules. Each level of the tree matches the op of an argument.
+    """
+
+    __slots__ = ('rules', 'children', 'wildcard')
+
     def __init__(self):
-        self._simplifiers = {
-            'Reverse': self.bv_reverse_simplifier,
-            'And': self.boolean_and_simplifier,
-            'Or': self.boolean_or_simplifier,
-            'Not': self.boolean_not_simplifier,
-            'Extract': self.extract_simplifier,
-            'Concat': self.concat_simplifier,
-            'If': self.if_simplifier,
-            '__lshift__': self.lshift_simplifier,
-            '__rshift__': self.rshift_simplifier,
-            'LShR': self.lshr_simplifier,
-            '__eq__': self.eq_simplifier,
-            '__ne__': self.ne_simplifier,
-            '__or__': self.bitwise_or_simplifier,
-            '__and__': self.bitwise_and_simplifier,
-            '__xor__': self.bitwise_xor_simplifier,
-            '__add__': self.bitwise_add_simplifier,
-            '__sub__': self.bitwise_sub_simplifier,
-            '__mul__': self.bitwise_mul_simplifier,
-            'ZeroExt': self.zeroext_simplifier,
-            'SignExt': self.signext_simplifier,
-            'fpToIEEEBV': self.fptobv_simplifier,
-            'fpToFP': self.fptofp_simplifier,
-            'StrExtract': self.str_extract_simplifier,
-            'StrReverse': self.str_reverse_simplifier,
+        self.rules = [ ]
+        self.children = { }
+        self.wildcard = None
+
+    def insert(self, keys, rule):
+        if not keys:
+            if rule not in self.rules:
+                self.rules.append(rule)
+            return
+
+        ops = keys[0]
+        if ops is None:
+            if self.wildcard is None:
+                self.wildcard = _RuleNode()
+            self.wildcard.insert(keys[1:], rule)
+            return
+
+        for op in ((ops,) if isinstance(ops, str) else ops):
+            child = self.children.get(op)
+            if child is None:
+                child = self.children[op] = _RuleNode()
+            child.insert(keys[1:], rule)
+
+    def lookup(self, ops):
+        nodes = [ self ]
+        for op in ops:
+            nodes = [ n for node in nodes for n in (node.children.get(op), node.wildcard) if n is not None ]
+        rules = { id(rule): rule for node in nodes for rule in node.rules }
+        return tuple(sorted(rules.values(), key=lambda rule: rule.order))
+
+
+class _RuleIndex:
+    """
+    The rules of an operation, compiled into a discrimination tree on the ops of the arguments that their patterns look
+    at. The rules that apply to each combination of these ops are looked up in the tree once, and cached.
+    """
+
+    __slots__ = ('rules', 'positions', '_tree', '_candidates')
+
+    def __init__(self):
+        self.rules = [ ]
+        self.positions = ()
+        self._tree = _RuleNode()
+        self._candidates = { }
+
+    def add(self, rule):
+        self.rules.append(rule)
+        self.positions = tuple(sorted({
+            i for r in self.rules for pattern in r.patterns for i, ops in enumerate(pattern) if ops is not None
+        }))
+
+        # the positions may have changed, so the tree is compiled again
+        self._tree = _RuleNode()
+        for r in self.rules:
+            for pattern in r.patterns:
+                self._tree.insert([ pattern[i] if i < len(pattern) else None for i in self.positions ], r)
+        self._candidates = { }
+
+    def candidates(self, args):
+        """
+        Returns the rules that may apply to the arguments, in order.
+        """
+        n = len(args)
+        Base = ast.Base
+        ops = tuple([ args[i].op if i < n and isinstance(args[i], Base) else None for i in self.positions ])
+        try:
+            return self._candidates[ops]
+        except KeyError:
+            rules = self._candidates[ops] = self._tree.lookup(ops)
+            return rules
+
+    def apply(self, args):
+        for rule in self.candidates(args):
+            r = rule.rewrite(*args)
+            if r is not None:
+                rule.hits += 1
+                return r
+        return None
+
+
+class SimplificationManager:
+    """
+    Rewrites operations with the rules of the simplifier.
+
+    The rules of each operation are indexed on the ops of its arguments (see Rule.patterns), and only the ones that may
+    apply are tried, in the order in which they were added. The first one that rewrites the operation wins.
+
+    The results of the rules, including None ("no simplification"), are memoized on the opcode and the arguments
+    of the operation (by hash, for ASTs), since the same operations are built over and over again and every construction
+    goes through the simplifier before the hash-consing table. The memo is an LRU table of at most `memo_size` entries,
+    and setting `memo_size` to 0 disables it. It refers to the resulting ASTs weakly, so that it does not change when
+    they are freed.
+    """
+
+    def __init__(self, memo_size=0x10000):
+        self.memo_size = memo_size
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.memo_evictions = 0
+        self._memo = collections.OrderedDict()
+
+        self._rules = { }
+        self._rules_by_opcode = [ ]
+        self._rule_count = 0
+
+        any_args = None
+        shift_rules = [
+            (self.shift_zero_simplifier, any_args),
+            (self.rshift_concat_simplifier, [ ('Concat', None) ]),
+            (self.rshift_zeroext_simplifier, [ ('ZeroExt', None) ]),
+        ]
+        default_rules = {
+            'Reverse': [
+                (self.bv_reverse_reverse_simplifier, [ ('Reverse',) ]),
+                (self.bv_reverse_byte_simplifier, any_args),
+                (self.bv_reverse_concat_simplifier, [ ('Concat',) ]),
+                (self.bv_reverse_extract_simplifier, [ ('Extract',) ]),
+            ],
+            'And': [ (self.boolean_and_simplifier, any_args) ],
+            'Or': [ (self.boolean_or_simplifier, any_args) ],
+            'Not': [
+                (self.boolean_not_eq_simplifier, [ (('__eq__', '__ne__'),) ]),
+                (self.boolean_not_not_simplifier, [ ('Not',) ]),
+                (self.boolean_not_if_simplifier, [ ('If',) ]),
+                (self.boolean_not_comparison_simplifier, [ (tuple(_inverted_comparisons),) ]),
+            ],
+            'Extract': [
+                (self.extract_whole_simplifier, any_args),
+                (self.extract_ext_simplifier, [ (None, None, ('SignExt', 'ZeroExt')) ]),
+                (self.extract_zeroext_simplifier, [ (None, None, 'ZeroExt') ]),
+                (self.extract_reverse_simplifier, [ (None, None, 'Reverse') ]),
+                (self.extract_concat_simplifier, [ (None, None, 'Concat') ]),
+                (self.extract_extract_simplifier, [ (None, None, 'Extract') ]),
+                (self.extract_distribute_simplifier, [ (None, None, extract_distributable) ]),
+            ],
+            'Concat': [ (self.concat_simplifier, any_args) ],
+            'If': [ (self.if_simplifier, any_args) ],
+            '__lshift__': [ (self.shift_zero_simplifier, any_args) ],
+            '__rshift__': shift_rules,
+            'LShR': shift_rules,
+            '__eq__': [
+                (self.eq_identity_simplifier, any_args),
+                (self.eq_bool_simplifier, [ (None, 'BoolV'), ('BoolV', None) ]),
+                (self.eq_reverse_simplifier, [ ('Reverse', 'Reverse') ]),
+                (self.eq_if_simplifier, [ ('If', None) ]),
+                (self.eq_if_right_simplifier, [ (None, 'If') ]),
+                (self.eq_bits_simplifier, [ (SIMPLE_OPS, None), (None, SIMPLE_OPS) ]),
+            ],
+            '__ne__': [
+                (self.ne_identity_simplifier, any_args),
+                (self.ne_reverse_simplifier, [ ('Reverse', 'Reverse') ]),
+                (self.ne_if_simplifier, [ ('If', None) ]),
+                (self.ne_if_right_simplifier, [ (None, 'If') ]),
+                (self.ne_bits_simplifier, [ (None, SIMPLE_OPS) ]),
+            ],
+            '__or__': [
+                (self.bitwise_or_identity_simplifier, any_args),
+                (self.bitwise_or_simplifier, any_args),
+            ],
+            '__and__': [
+                (self.bitwise_and_rotate_simplifier, [ ('__or__', 'BVV') ]),
+                (self.bitwise_and_identity_simplifier, any_args),
+                (self.bitwise_and_simplifier, any_args),
+            ],
+            '__xor__': [
+                (self.bitwise_xor_identity_simplifier, any_args),
+                (self.bitwise_xor_simplifier_minmax, [ ('__and__', None), (None, '__and__') ]),
+                (self.bitwise_xor_simplifier, any_args),
+            ],
+            '__add__': [
+                (self.bitwise_add_sub_simplifier, [ ('__sub__', 'BVV') ]),
+                (self.bitwise_add_simplifier, any_args),
+            ],
+            '__sub__': [
+                (self.bitwise_sub_concrete_simplifier, [ (None, 'BVV') ]),
+                (self.bitwise_sub_simplifier, any_args),
+            ],
+            '__mul__': [ (self.bitwise_mul_simplifier, any_args) ],
+            'ZeroExt': [
+                (self.zeroext_zero_simplifier, any_args),
+                (self.zeroext_zeroext_simplifier, [ (None, 'ZeroExt') ]),
+            ],
+            'SignExt': [ (self.signext_simplifier, any_args) ],
+            'fpToIEEEBV': [ (self.fptobv_simplifier, [ ('fpToFP',) ]) ],
+            'fpToFP': [ (self.fptofp_simplifier, [ ('fpToIEEEBV',) ]) ],
+            'StrExtract': [
+                (self.str_extract_whole_simplifier, any_args),
+                (self.str_extract_simplifier, [ (None, None, 'StrExtract') ]),
+            ],
+            'StrReverse': [ (self.str_reverse_simplifier, any_args) ],
         }
+        for op, rules in default_rules.items():
+            for rewrite, patterns in rules:
+                self.add_rule(op, rewrite, patterns)
 
     def simplify(self, op, args):
-        if op not in self._simplifiers:
+        if op not in self._rules:
             return None
-        return self._simplifiers[op](*args)
+        return self.simplify_opcode(operations.opcode(op), args)
+
+    def simplify_opcode(self, opcode, args):
+        """
+        Same as simplify(), but dispatches on the opcode of the operation (see claripy.operations.opcode).
+        """
+        try:
+            index = self._rules_by_opcode[opcode]
+        except IndexError:
+            return None
+        if index is None:
+            return None
+        if not self.memo_size:
+            return index.apply(args)
+
+        Base = ast.Base
+        key = (opcode, tuple([ a._hash if isinstance(a, Base) else a for a in args ]))
+        memo = self._memo
+        try:
+            r = memo.get(key, _missing)
+        except TypeError:
+            # an argument that cannot be hashed
+            return index.apply(args)
+
+        if r is not _missing:
+            # a memoized AST may have been freed since
+            result = None if r is None else r()
+            if r is None or result is not None:
+                self.memo_hits += 1
+                try:
+                    memo.move_to_end(key)
+                except KeyError:
+                    # another thread evicted it in the meantime
+                    pass
+                return result
+
+        self.memo_misses += 1
+        r = index.apply(args)
+        memo[key] = None if r is None else weakref.ref(r)
+        self._evict(memo, self.memo_size)
+        return r
+
+    def _evict(self, memo, memo_size):
+        """
+        Drops the least recently used entries of the memo beyond `memo_size`. The memo is shared by every thread, without
+        a lock, so the entries may be evicted by another thread at the same time.
+        """
+        while len(memo) > memo_size:
+            try:
+                memo.popitem(last=False)
+            except KeyError:
+                break
+            self.memo_evictions += 1
+
+    #
+    # The rules
+    #
+
+    def add_rule(self, op, rewrite, patterns=None, name=None):
+        """
+        Adds a rewrite rule for an operation. It is tried after the rules that were added before it.
+
+        :param op:          The name of the operation.
+        :param rewrite:     The function that rewrites the operation (see Rule.rewrite).
+        :param patterns:    The arguments that the rule applies to (see Rule.patterns), or None for any arguments.
+        :param name:        The name of the rule (the name of `rewrite` by default).
+        :return:            The new Rule.
+        """
+        rule = Rule(
+            op, rewrite,
+            [ () ] if patterns is None else [ tuple(pattern) for pattern in patterns ],
+            rewrite.__name__ if name is None else name,
+            self._rule_count,
+        )
+        self._rule_count += 1
+
+        index = self._rules.get(op)
+        if index is None:
+            index = self._rules[op] = _RuleIndex()
+            code = operations.opcode(op)
+            if code >= len(self._rules_by_opcode):
+                self._rules_by_opcode.extend([ None ] * (code + 1 - len(self._rules_by_opcode)))
+            self._rules_by_opcode[code] = index
+        index.add(rule)
+
+        # the memoized results may not hold anymore
+        self.clear_memo()
+        return rule
+
+    def rules(self, op):
+        """
+        Returns the rules of an operation, in order.
+        """
+        index = self._rules.get(op)
+        return [ ] if index is None else list(index.rules)
+
+    def candidate_rules(self, op, args):
+        """
+        Returns the rules that may apply to an operation on the given arguments, in order.
+        """
+        index = self._rules.get(op)
+        return [ ] if index is None else list(index.candidates(args))
+
+    def rule_stats(self):
+        """
+        Returns the number of operations that each rule rewrote, as a dict from (op, rule name).
+        """
+        return { (rule.op, rule.name): rule.hits for index in self._rules.values() for rule in index.rules }
+
+    def reset_rule_stats(self):
+        for index in self._rules.values():
+            for rule in index.rules:
+                rule.hits = 0
+
+    #
+    # The memo
+    #
+
+    def set_memo_size(self, memo_size):
+        """
+        Changes the maximum number of memoized simplifications. 0 disables the memo (and drops it).
+        """
+        self.memo_size = memo_size
+        self._evict(self._memo, memo_size)
+
+    def clear_memo(self):
+        """
+        Drops the memoized simplifications.
+        """
+        self._memo.clear()
+
+    def memo_stats(self):
+        """
+        Returns the counters of the memo as a dict.
+        """
+        lookups = self.memo_hits + self.memo_misses
+        return {
+            'memo_size': self.memo_size,
+            'size': len(self._memo),
+            'hits': self.memo_hits,
+            'misses': self.memo_misses,
+            'evictions': self.memo_evictions,
+            'hit_rate': self.memo_hits / lookups if lookups else 0.0,
+        }
+
+    def reset_memo_stats(self):
+        self.memo_hits = 0
+        self.memo_misses = 0
+        self.memo_evictions = 0
 
     @staticmethod
     def _deduplicate_filter(args):
@@ -147,33 +498,27 @@ class SimplificationManager:
         return
 
     @staticmethod
-    def rshift_simplifier(val, shift):
+    def shift_zero_simplifier(val, shift):
         if (shift == 0).is_true():
             return val
-        if val.op == "Concat" and (val.args[0] == 0).is_true() and (shift > val.size() - val.args[0].size()).is_true():
-            return ast.all_operations.BVV(0, val.size())
-        if val.op == "ZeroExt" and (shift > val.size() - val.args[0]).is_true():
-            return ast.all_operations.BVV(0, val.size())
 
     @staticmethod
-    def lshr_simplifier(val, shift):
-        if (shift == 0).is_true():
-            return val
-        if val.op == "Concat" and (val.args[0] == 0).is_true() and (shift > val.size() - val.args[0].size()).is_true():
-            return ast.all_operations.BVV(0, val.size())
-        if val.op == "ZeroExt" and (shift > val.size() - val.args[0]).is_true():
+    def rshift_concat_simplifier(val, shift):
+        if (val.args[0] == 0).is_true() and (shift > val.size() - val.args[0].size()).is_true():
             return ast.all_operations.BVV(0, val.size())
 
     @staticmethod
-    def lshift_simplifier(val, shift):
-        if (shift == 0).is_true():
-            return val
+    def rshift_zeroext_simplifier(val, shift):
+        if (shift > val.size() - val.args[0]).is_true():
+            return ast.all_operations.BVV(0, val.size())
 
     @staticmethod
-    def eq_simplifier(a, b):
+    def eq_identity_simplifier(a, b):
         if a is b:
             return ast.true
 
+    @staticmethod
+    def eq_bool_simplifier(a, b):
         if isinstance(a, ast.Bool) and b is ast.true:
             return a
         if isinstance(b, ast.Bool) and a is ast.true:
@@ -183,35 +528,40 @@ class SimplificationManager:
         if isinstance(b, ast.Bool) and a is ast.false:
             return ast.all_operations.Not(b)
 
-        if a.op == 'Reverse' and b.op == 'Reverse':
-            return a.args[0] == b.args[0]
-
-        # TODO: all these ==/!= might really slow things down...
-        if a.op == 'If':
-            if a.args[1] is b and ast.all_operations.is_true(a.args[2] != b):
-                # (If(c, x, y) == x, x != y) -> c
-                return a.args[0]
-            elif a.args[2] is b and ast.all_operations.is_true(a.args[1] != b):
-                # (If(c, x, y) == y, x != y) -> !c
-                return ast.all_operations.Not(a.args[0])
-            # elif a._claripy.is_true(a.args[1] == b) and a._claripy.is_true(a.args[2] == b):
-            #	  return a._claripy.true
-            # elif a._claripy.is_true(a.args[1] != b) and a._claripy.is_true(a.args[2] != b):
-            #	  return a._claripy.false
-
-        if b.op == 'If':
-            if b.args[1] is a and ast.all_operations.is_true(b.args[2] != b):
-                # (x == If(c, x, y)) -> c
-                return b.args[0]
-            elif b.args[2] is a and ast.all_operations.is_true(b.args[1] != a):
-                # (y == If(c, x, y)) -> !c
-                return ast.all_operations.Not(b.args[0])
-            # elif b._claripy.is_true(b.args[1] == a) and b._claripy.is_true(b.args[2] == a):
-            #	  return b._claripy.true
-            # elif b._claripy.is_true(b.args[1] != a) and b._claripy.is_true(b.args[2] != a):
-            #	  return b._claripy.false
-
-        if (a.op in SIMPLE_OPS or b.op in SIMPLE_OPS) and a.length > 1 and a.length == b.length:
+    @staticmethod
+    def eq_reverse_simplifier(a, b):
+        return a.args[0] == b.args[0]
+
+    # TODO: all these ==/!= might really slow things down...
+    @staticmethod
+    def eq_if_simplifier(a, b):
+        if a.args[1] is b and ast.all_operations.is_true(a.args[2] != b):
+            # (If(c, x, y) == x, x != y) -> c
+            return a.args[0]
+        elif a.args[2] is b and ast.all_operations.is_true(a.args[1] != b):
+            # (If(c, x, y) == y, x != y) -> !c
+            return ast.all_operations.Not(a.args[0])
+        # elif a._claripy.is_true(a.args[1] == b) and a._claripy.is_true(a.args[2] == b):
+        #	  return a._claripy.true
+        # elif a._claripy.is_true(a.args[1] != b) and a._claripy.is_true(a.args[2] != b):
+        #	  return a._claripy.false
+
+    @staticmethod
+    def eq_if_right_simplifier(a, b):
+        if b.args[1] is a and ast.all_operations.is_true(b.args[2] != b):
+            # (x == If(c, x, y)) -> c
+            return b.args[0]
+        elif b.args[2] is a and ast.all_operations.is_true(b.args[1] != a):
+            # (y == If(c, x, y)) -> !c
+            return ast.all_operations.Not(b.args[0])
+        # elif b._claripy.is_true(b.args[1] == a) and b._claripy.is_true(b.args[2] == a):
+        #	  return b._claripy.true
+        # elif b._claripy.is_true(b.args[1] != a) and b._claripy.is_true(b.args[2] != a):
+        #	  return b._claripy.false
+
+    @staticmethod
+    def eq_bits_simplifier(a, b):
+        if a.length > 1 and a.length == b.length:
             for i in range(a.length):
                 a_bit = a[i:i]
                 if a_bit.symbolic:
@@ -225,38 +575,43 @@ class SimplificationManager:
                     return ast.all_operations.false
 
     @staticmethod
-    def ne_simplifier(a, b):
+    def ne_identity_simplifier(a, b):
         if a is b:
             return ast.false
 
-        if a.op == 'Reverse' and b.op == 'Reverse':
-            return a.args[0] != b.args[0]
-
-        if a.op == 'If':
-            if a.args[2] is b and ast.all_operations.is_true(a.args[1] != b):
-                # (If(c, x, y) == x, x != y) -> c
-                return a.args[0]
-            elif a.args[1] is b and ast.all_operations.is_true(a.args[2] != b):
-                # (If(c, x, y) == y, x != y) -> !c
-                return ast.all_operations.Not(a.args[0])
-            # elif a._claripy.is_true(a.args[1] == b) and a._claripy.is_true(a.args[2] == b):
-            #	  return a._claripy.false
-            # elif a._claripy.is_true(a.args[1] != b) and a._claripy.is_true(a.args[2] != b):
-            #	  return a._claripy.true
-
-        if b.op == 'If':
-            if b.args[2] is a and ast.all_operations.is_true(b.args[1] != a):
-                # (x == If(c, x, y)) -> c
-                return b.args[0]
-            elif b.args[1] is a and ast.all_operations.is_true(b.args[2] != a):
-                # (y == If(c, x, y)) -> !c
-                return ast.all_operations.Not(b.args[0])
-            # elif b._claripy.is_true(b.args[1] != a) and b._claripy.is_true(b.args[2] != a):
-            #	  return b._claripy.true
-            # elif b._claripy.is_true(b.args[1] == a) and b._claripy.is_true(b.args[2] == a):
-            #	  return b._claripy.false
-
-        if (a.op == SIMPLE_OPS or b.op in SIMPLE_OPS) and a.length > 1 and a.length == b.length:
+    @staticmethod
+    def ne_reverse_simplifier(a, b):
+        return a.args[0] != b.args[0]
+
+    @staticmethod
+    def ne_if_simplifier(a, b):
+        if a.args[2] is b and ast.all_operations.is_true(a.args[1] != b):
+            # (If(c, x, y) == x, x != y) -> c
+            return a.args[0]
+        elif a.args[1] is b and ast.all_operations.is_true(a.args[2] != b):
+            # (If(c, x, y) == y, x != y) -> !c
+            return ast.all_operations.Not(a.args[0])
+        # elif a._claripy.is_true(a.args[1] == b) and a._claripy.is_true(a.args[2] == b):
+        #	  return a._claripy.false
+        # elif a._claripy.is_true(a.args[1] != b) and a._claripy.is_true(a.args[2] != b):
+        #	  return a._claripy.true
+
+    @staticmethod
+    def ne_if_right_simplifier(a, b):
+        if b.args[2] is a and ast.all_operations.is_true(b.args[1] != a):
+            # (x == If(c, x, y)) -> c
+            return b.args[0]
+        elif b.args[1] is a and ast.all_operations.is_true(b.args[2] != a):
+            # (y == If(c, x, y)) -> !c
+            return ast.all_operations.Not(b.args[0])
+        # elif b._claripy.is_true(b.args[1] != a) and b._claripy.is_true(b.args[2] != a):
+        #	  return b._claripy.true
+        # elif b._claripy.is_true(b.args[1] == a) and b._claripy.is_true(b.args[2] == a):
+        #	  return b._claripy.false
+
+    @staticmethod
+    def ne_bits_simplifier(a, b):
+        if a.length > 1 and a.length == b.length:
             for i in range(a.length):
                 a_bit = a[i:i]
                 if a_bit.symbolic:
@@ -270,38 +625,41 @@ class SimplificationManager:
                     return ast.all_operations.true
 
     @staticmethod
-    def bv_reverse_simplifier(body):
-        if body.op == 'Reverse':
-            # Reverse(Reverse(x)) ==> x
-            return body.args[0]
+    def bv_reverse_reverse_simplifier(body):
+        # Reverse(Reverse(x)) ==> x
+        return body.args[0]
 
+    @staticmethod
+    def bv_reverse_byte_simplifier(body):
         if body.length == 8:
             # Reverse(byte) ==> byte
             return body
 
-        if body.op == 'Concat':
-            if all(a.op == 'Extract' for a in body.args):
-                first_ast = body.args[0].args[2]
-                for i,a in enumerate(body.args):
-                    if not (first_ast is a.args[2]
-                            and a.args[0] == ((i + 1) * 8 - 1)
-                            and a.args[1] == i * 8):
-                        break
+    @staticmethod
+    def bv_reverse_concat_simplifier(body):
+        if all(a.op == 'Extract' for a in body.args):
+            first_ast = body.args[0].args[2]
+            for i,a in enumerate(body.args):
+                if not (first_ast is a.args[2]
+                        and a.args[0] == ((i + 1) * 8 - 1)
+                        and a.args[1] == i * 8):
+                    break
+            else:
+                upper_bound = body.args[-1].args[0]
+                if first_ast.length == upper_bound + 1:
+                    return first_ast
                 else:
-                    upper_bound = body.args[-1].args[0]
-                    if first_ast.length == upper_bound + 1:
-                        return first_ast
-                    else:
-                        return first_ast[upper_bound:0]
-            if all(a.length == 8 for a in body.args):
-                return body.make_like(body.op, body.args[::-1], simplify=True)
-
-        if body.op == 'Concat':
-            if all(a.op == 'Reverse' for a in body.args):
-                if all(a.length % 8 == 0 for a in body.args):
-                    return body.make_like(body.op, [a.args[0] for a in reversed(body.args)], simplify=True)
-
-        if body.op == 'Extract' and body.args[2].op == 'Reverse':
+                    return first_ast[upper_bound:0]
+        if all(a.length == 8 for a in body.args):
+            return body.make_like(body.op, body.args[::-1], simplify=True)
+
+        if all(a.op == 'Reverse' for a in body.args):
+            if all(a.length % 8 == 0 for a in body.args):
+                return body.make_like(body.op, [a.args[0] for a in reversed(body.args)], simplify=True)
+
+    @staticmethod
+    def bv_reverse_extract_simplifier(body):
+        if body.args[2].op == 'Reverse':
             # Reverse(Extract(hi, lo, Reverse(x))) ==> Extract(bits-lo-1, bits-hi-1, x)
             # Holds only when (hi+1) and lo are multiples of 8 (or, multiples of bits_per_byte if we really want to
             # suppport cLEMENCy)
@@ -341,7 +699,8 @@ class SimplificationManager:
         if len(fargs) == 1:
             return fargs[0]
 
-        if any(len(arg.args) != 2 for arg in fargs):
+        # the first two arguments are checked before all of them, since most long conjunctions are over many variables
+        if len(fargs[0].args) != 2 or len(fargs[1].args) != 2:
             return flattened
 
         target_var = None
@@ -358,7 +717,7 @@ class SimplificationManager:
             elif fargs[0].args[1] is fargs[1].args[1]:
                 target_var = fargs[0].args[1]
 
-        if target_var is None:
+        if target_var is None or any(len(arg.args) != 2 for arg in fargs):
             return flattened
 
         # we now know that the And is a series of binary conditions over a single variable.
@@ -411,9 +770,17 @@ class SimplificationManager:
     @staticmethod
     def _flatten_simplifier(op_name, filter_func, *args, **kwargs):
         # we cannot further flatten if any top-level argument has non-relocatable annotations
-        if any(not anno.relocatable for anno in itertools.chain.from_iterable(arg.annotations for arg in args)):
+        if ast.Base._annotations_used and \
+                any(not anno.relocatable for anno in itertools.chain.from_iterable(arg.annotations for arg in args)):
             return
 
+        # appending to an AST that is already flattened (such as a path constraint that grows by one conjunct at a time)
+        # only has to look at the new arguments
+        if isinstance(args[0], ast.Base) and args[0].op == op_name and len(args) > 1:
+            r = SimplificationManager._flatten_append(op_name, args)
+            if r is not None:
+                return r
+
         new_args = tuple(itertools.chain.from_iterable(
             (a.args if isinstance(a, ast.Base) and a.op == op_name else (a,)) for a in args
         ))
@@ -430,44 +797,97 @@ class SimplificationManager:
             value_arg = value_args[0].make_like(op_name, tuple(value_args), simplify=False)
             new_args = tuple(other_args) + (value_arg,)
 
-        variables = frozenset(itertools.chain.from_iterable(a.variables for a in args if isinstance(a, ast.Base)))
         if filter_func: new_args = filter_func(new_args)
         if not new_args and 'initial_value' in kwargs:
             return kwargs['initial_value']
-        return next(a for a in args if isinstance(a, ast.Base)).make_like(op_name, new_args,
-                                                                          variables=variables,
-                                                                          simplify=False)
+
+        return SimplificationManager._flatten_make(op_name, new_args, args)
 
     @staticmethod
-    def bitwise_add_simplifier(*args):
-        if len(args) == 2 and args[1].op == 'BVV' and args[0].op == '__sub__' and args[0].args[1].op == 'BVV':
+    def _flatten_make(op_name, new_args, args, extends=None):
+        like = next(a for a in args if isinstance(a, ast.Base))
+        if ast.base.LAZY_VARIABLES:
+            # the variables will be derived from the new arguments, if anyone ever asks for them
+            return like.make_like(op_name, new_args, simplify=False, extends=extends)
+
+        if extends is None:
+            variables = ast.variable_set.variable_sets.union_all([ a.variables for a in args if isinstance(a, ast.Base) ])
+        else:
+            # the union with the variables of a growing AST is never looked up again, so it is not memoized (the memo
+            # would keep the variables of every version of the AST alive)
+            variables = extends.variables
+            added = frozenset().union(*[ a.variables for a in args if isinstance(a, ast.Base) and a is not extends ])
+            if not added <= variables:
+                variables = ast.variable_set.variable_sets.intern(variables | added)
+        return like.make_like(op_name, new_args, variables=variables, simplify=False, extends=extends)
+
+    @staticmethod
+    def _flatten_append(op_name, args):
+        """
+        Flattens an operation whose first argument is a flattened AST of the same operation, when none of the other
+        arguments would be flattened, collapsed or filtered out (in which case the flattened arguments are simply the
+        arguments of the first one, followed by the other ones). Returns None otherwise.
+
+        The set of the hashes of the arguments of a flattened AST is kept on it (see _flat_arg_hashes), and handed over
+        to the new AST, so that it is only built once for a chain of appends. The new AST is built as an extension of
+        the first argument (see Base.__new__), so that its arguments are not looked at again either.
+        """
+        first = args[0]
+        hashes = _flat_arg_hashes(first)
+        if hashes is None:
+            return None
+
+        rest = args[1:]
+        new_hashes = [ ]
+        for a in rest:
+            if not isinstance(a, ast.Base) or a.op == op_name or a.op == 'BVV' or a._hash in hashes:
+                return None
+            new_hashes.append(a._hash)
+        if len(rest) > 1 and len(set(new_hashes)) != len(new_hashes):
+            return None
+
+        r = SimplificationManager._flatten_make(op_name, first.args + rest, args, extends=first)
+        if r.op == op_name:
+            first._flat_args = None
+            hashes.update(new_hashes)
+            r._flat_args = hashes
+        return r
+
+    @staticmethod
+    def bitwise_add_sub_simplifier(*args):
+        if len(args) == 2 and args[0].args[1].op == 'BVV':
             # flatten add over sub
             # (x - y) + z ==> x - (y - z)
             return args[0].args[0] - (args[0].args[1] - args[1])
+
+    @staticmethod
+    def bitwise_add_simplifier(*args):
         return SimplificationManager._flatten_simplifier('__add__', lambda new_args: tuple(a for a in new_args if a.op != 'BVV' or a.args[0] != 0), *args, initial_value=ast.all_operations.BVV(0, len(args[0])))
 
     @staticmethod
     def bitwise_mul_simplifier(*args):
         return SimplificationManager._flatten_simplifier('__mul__', None, *args)
 
+    @staticmethod
+    def bitwise_sub_concrete_simplifier(a, b):
+        # many optimizations if b is concrete - effectively flattening
+        if b.args[0] == 0:
+            return a
+        elif a.op == '__sub__' and a.args[1].op == 'BVV':
+            # flatten right-heavy trees
+            # (x - y) - z ==> x - (y + z)
+            return a.args[0] - (a.args[1] + b)
+        elif a.op == '__add__' and a.args[-1].op == 'BVV':
+            # flatten sub over add
+            # (x + y) - z ==> x + (y - z)
+            if len(a.args) == 2:
+                return a.args[0] + (a.args[-1] - b)
+            else:
+                return a.swap_args(a.args[:-1] + (a.args[-1] - b,))
+
     @staticmethod
     def bitwise_sub_simplifier(a, b):
-        if b.op == 'BVV':
-            # many optimizations if b is concrete - effectively flattening
-            if b.args[0] == 0:
-                return a
-            elif a.op == '__sub__' and a.args[1].op == 'BVV':
-                # flatten right-heavy trees
-                # (x - y) - z ==> x - (y + z)
-                return a.args[0] - (a.args[1] + b)
-            elif a.op == '__add__' and a.args[-1].op == 'BVV':
-                # flatten sub over add
-                # (x + y) - z ==> x + (y - z)
-                if len(a.args) == 2:
-                    return a.args[0] + (a.args[-1] - b)
-                else:
-                    return a.swap_args(a.args[:-1] + (a.args[-1] - b,))
-        elif a is b or (a == b).is_true():
+        if b.op != 'BVV' and (a is b or (a == b).is_true()):
             return ast.all_operations.BVV(0, a.size())
         return None
 
@@ -476,7 +896,9 @@ class SimplificationManager:
     # and recognize b-bit z=signedmin(q,r) from this idiom:
     # s=r-q;t=q^r;u=s^r;v=u&t;w=v^s;x=rshift(w,b-1);y=x&t;z=q^y
     @staticmethod
-    def bitwise_xor_simplifier_minmax(a,b):
+    def bitwise_xor_simplifier_minmax(a, b, *args):
+        if args: return
+
         q,y = a,b
         if y.op != '__and__':
             q,y = b,a
@@ -527,7 +949,7 @@ class SimplificationManager:
             return ast.all_operations.If(cond,q,r)
 
     @staticmethod
-    def bitwise_xor_simplifier(a, b, *args):
+    def bitwise_xor_identity_simplifier(a, b, *args):
         if not args:
             if a is ast.all_operations.BVV(0, a.size()):
                 return b
@@ -536,9 +958,8 @@ class SimplificationManager:
             elif a is b or (a == b).is_true():
                 return ast.all_operations.BVV(0, a.size())
 
-            result = SimplificationManager.bitwise_xor_simplifier_minmax(a,b)
-            if result is not None: return result
-
+    @staticmethod
+    def bitwise_xor_simplifier(a, b, *args):
         def _flattening_filter(args):
             # since a ^ a == 0, we can safely remove those from args
             # this procedure is done carefully in order to keep the ordering of arguments
@@ -558,7 +979,7 @@ class SimplificationManager:
         return SimplificationManager._flatten_simplifier('__xor__', _flattening_filter, a, b, *args, initial_value=ast.all_operations.BVV(0, a.size()))
 
     @staticmethod
-    def bitwise_or_simplifier(a, b, *args):
+    def bitwise_or_identity_simplifier(a, b, *args):
         if not args:
             if a is ast.all_operations.BVV(0, a.size()):
                 return b
@@ -569,16 +990,19 @@ class SimplificationManager:
             elif a is b:
                 return a
 
+    @staticmethod
+    def bitwise_or_simplifier(a, b, *args):
         return SimplificationManager._flatten_simplifier('__or__', SimplificationManager._deduplicate_filter, a, b, *args)
 
     @staticmethod
-    def bitwise_and_simplifier(a, b, *args):
+    def bitwise_and_rotate_simplifier(a, b, *args):
         if not args:
             # try to perform a rotate-shift-mask simplification
-            r = SimplificationManager.rotate_shift_mask_simplifier(a, b)
-            if r is not None:
-                return r
+            return SimplificationManager.rotate_shift_mask_simplifier(a, b)
 
+    @staticmethod
+    def bitwise_and_identity_simplifier(a, b, *args):
+        if not args:
             if (a == 2**a.size()-1).is_true():
                 return b
             elif (b == 2**a.size()-1).is_true():
@@ -593,56 +1017,38 @@ class SimplificationManager:
                     # yes!
                     return ast.all_operations.ZeroExt(a.args[0].size(), a.args[1])
 
+    @staticmethod
+    def bitwise_and_simplifier(a, b, *args):
         return SimplificationManager._flatten_simplifier('__and__', SimplificationManager._deduplicate_filter, a, b, *args)
 
     @staticmethod
-    def boolean_not_simplifier(body):
+    def boolean_not_eq_simplifier(body):
         if body.op == '__eq__':
             return body.args[0] != body.args[1]
-        elif body.op == '__ne__':
+        else:
             return body.args[0] == body.args[1]
 
-        if body.op == 'Not':
-            return body.args[0]
-
-        if body.op == 'If':
-            return ast.all_operations.If(body.args[0], body.args[2], body.args[1])
-
-        if body.op == 'SLT':
-            return ast.all_operations.SGE(body.args[0], body.args[1])
-        elif body.op == 'SLE':
-            return ast.all_operations.SGT(body.args[0], body.args[1])
-        elif body.op == 'SGT':
-            return ast.all_operations.SLE(body.args[0], body.args[1])
-        elif body.op == 'SGE':
-            return ast.all_operations.SLT(body.args[0], body.args[1])
-
-        if body.op == 'ULT':
-            return ast.all_operations.UGE(body.args[0], body.args[1])
-        elif body.op == 'ULE':
-            return ast.all_operations.UGT(body.args[0], body.args[1])
-        elif body.op == 'UGT':
-            return ast.all_operations.ULE(body.args[0], body.args[1])
-        elif body.op == 'UGE':
-            return ast.all_operations.ULT(body.args[0], body.args[1])
-
-        if body.op == '__lt__':
-            return ast.all_operations.UGE(body.args[0], body.args[1])
-        elif body.op == '__le__':
-            return ast.all_operations.UGT(body.args[0], body.args[1])
-        elif body.op == '__gt__':
-            return ast.all_operations.ULE(body.args[0], body.args[1])
-        elif body.op == '__ge__':
-            return ast.all_operations.ULT(body.args[0], body.args[1])
-
-    @staticmethod
-    def zeroext_simplifier(n, e):
+    @staticmethod
+    def boolean_not_not_simplifier(body):
+        return body.args[0]
+
+    @staticmethod
+    def boolean_not_if_simplifier(body):
+        return ast.all_operations.If(body.args[0], body.args[2], body.args[1])
+
+    @staticmethod
+    def boolean_not_comparison_simplifier(body):
+        return getattr(ast.all_operations, _inverted_comparisons[body.op])(body.args[0], body.args[1])
+
+    @staticmethod
+    def zeroext_zero_simplifier(n, e):
         if n == 0:
             return e
 
-        if e.op == 'ZeroExt':
-            # ZeroExt(A, ZeroExt(B, x)) ==> ZeroExt(A + B, x)
-            return e.make_like(e.op, (n + e.args[0], e.args[1]), length=n + e.size(), simplify=True)
+    @staticmethod
+    def zeroext_zeroext_simplifier(n, e):
+        # ZeroExt(A, ZeroExt(B, x)) ==> ZeroExt(A + B, x)
+        return e.make_like(e.op, (n + e.args[0], e.args[1]), length=n + e.size(), simplify=True)
 
     @staticmethod
     def signext_simplifier(n, e):
@@ -652,21 +1058,27 @@ class SimplificationManager:
         # TODO: if top bit is 0, do a zero-extend instead
 
     @staticmethod
-    def extract_simplifier(high, low, val):
+    def extract_whole_simplifier(high, low, val):
         # if we're extracting the whole value, return the value
         if high - low + 1 == val.size():
             return val
 
-        if (val.op == 'SignExt' or val.op == 'ZeroExt') and low == 0 and high + 1 == val.args[1].size():
+    @staticmethod
+    def extract_ext_simplifier(high, low, val):
+        if low == 0 and high + 1 == val.args[1].size():
             return val.args[1]
 
-        if val.op == 'ZeroExt':
-            extending_bits = val.args[0]
-            if extending_bits == 0:
-                val = val.args[1]
-            else:
-                val = ast.all_operations.Concat(ast.all_operations.BVV(0, extending_bits), val.args[1])
+    @staticmethod
+    def extract_zeroext_simplifier(high, low, val):
+        extending_bits = val.args[0]
+        if extending_bits == 0:
+            val = val.args[1]
+        else:
+            val = ast.all_operations.Concat(ast.all_operations.BVV(0, extending_bits), val.args[1])
+        return SimplificationManager.extract_reverse_simplifier(high, low, val)
 
+    @staticmethod
+    def extract_reverse_simplifier(high, low, val):
         # Reverse(concat(a, b)) -> concat(Reverse(b), Reverse(a))
         # a and b must have lengths that are a multiple of 8
         if val.op == 'Reverse' and val.args[0].op == 'Concat' and all(a.length % 8 == 0 for a in val.args[0].args):
@@ -684,39 +1096,12 @@ class SimplificationManager:
 
             return ast.all_operations.Extract(high, low, val)
 
+        # the value may have been rewritten into something that the other rules apply to
         if val.op == 'Concat':
-            pos = val.length
-            high_i, low_i, low_loc = None, None, None
-            for i, v in enumerate(val.args):
-                if pos - v.length <= high < pos:
-                    high_i = i
-                if pos - v.length <= low < pos:
-                    low_i = i
-                    low_loc = low - (pos - v.length)
-                pos -= v.length
-
-            used = val.args[high_i:low_i+1]
-            if len(used) == 1:
-                self = used[0]
-            else:
-                self = ast.all_operations.Concat(*used)
-
-            new_high = low_loc + high - low
-            if new_high == self.length - 1 and low_loc == 0:
-                return self
-            else:
-                if self.op != 'Concat':
-                    return self[new_high:low_loc]
-                else:
-                    # to avoid infinite recursion we only return if something was simplified
-                    if len(used) != len(val.args) or new_high != high or low_loc != low:
-                        return ast.all_operations.Extract(new_high, low_loc, self)
+            return SimplificationManager.extract_concat_simplifier(high, low, val)
 
         if val.op == 'Extract':
-            _, inner_low = val.args[:2]
-            new_low = inner_low + low
-            new_high = new_low + (high - low)
-            return (val.args[2])[new_high:new_low]
+            return SimplificationManager.extract_extract_simplifier(high, low, val)
 
         if val.op == 'Reverse' and val.args[0].op == 'Concat' and all(a.length % 8 == 0 for a in val.args[0].args):
             val = val.make_like('Concat',
@@ -736,18 +1121,58 @@ class SimplificationManager:
         #		  __import__('ipdb').set_trace()
 
         if val.op in extract_distributable:
-            all_args = tuple(a[high:low] for a in val.args)
-            return reduce(getattr(operator, val.op), all_args)
+            return SimplificationManager.extract_distribute_simplifier(high, low, val)
+
+    @staticmethod
+    def extract_concat_simplifier(high, low, val):
+        pos = val.length
+        high_i, low_i, low_loc = None, None, None
+        for i, v in enumerate(val.args):
+            if pos - v.length <= high < pos:
+                high_i = i
+            if pos - v.length <= low < pos:
+                low_i = i
+                low_loc = low - (pos - v.length)
+            pos -= v.length
+
+        used = val.args[high_i:low_i+1]
+        if len(used) == 1:
+            self = used[0]
+        else:
+            self = ast.all_operations.Concat(*used)
+
+        new_high = low_loc + high - low
+        if new_high == self.length - 1 and low_loc == 0:
+            return self
+        else:
+            if self.op != 'Concat':
+                return self[new_high:low_loc]
+            else:
+                # to avoid infinite recursion we only return if something was simplified
+                if len(used) != len(val.args) or new_high != high or low_loc != low:
+                    return ast.all_operations.Extract(new_high, low_loc, self)
+
+    @staticmethod
+    def extract_extract_simplifier(high, low, val):
+        _, inner_low = val.args[:2]
+        new_low = inner_low + low
+        new_high = new_low + (high - low)
+        return (val.args[2])[new_high:new_low]
+
+    @staticmethod
+    def extract_distribute_simplifier(high, low, val):
+        all_args = tuple(a[high:low] for a in val.args)
+        return reduce(getattr(operator, val.op), all_args)
 
     # oh gods
     @staticmethod
     def fptobv_simplifier(the_fp):
-        if the_fp.op == 'fpToFP' and len(the_fp.args) == 2:
+        if len(the_fp.args) == 2:
             return the_fp.args[0]
 
     @staticmethod
     def fptofp_simplifier(*args):
-        if len(args) == 2 and args[0].op == 'fpToIEEEBV':
+        if len(args) == 2:
             to_bv, sort = args
             if sort == fp.FSORT_FLOAT and to_bv.length == 32:
                 return to_bv.args[0]
@@ -811,33 +1236,66 @@ class SimplificationManager:
         return expr
 
     @staticmethod
-    def str_extract_simplifier(start_idx, count, val):
+    def str_extract_whole_simplifier(start_idx, count, val):
         if start_idx == 0 and count == val.string_length:
             return val
+
+    @staticmethod
+    def str_extract_simplifier(start_idx, count, val):
         # if we are dealing with a chain of extractions on the same string we can
         # simplify the chain in one single StrExtract
-        if val.op == 'StrExtract':
-            v_start_idx, _, v_str = val.args
-            new_start = v_start_idx + start_idx
-            new_count = count
-            return v_str.StrExtract(new_start, new_count, v_str)
+        v_start_idx, _, v_str = val.args
+        new_start = v_start_idx + start_idx
+        new_count = count
+        return v_str.StrExtract(new_start, new_count, v_str)
 
     @staticmethod
     def str_reverse_simplifier(arg):
         return arg
 
 
+def _flat_arg_hashes(a):
+    """
+    Returns the set of the hashes of the arguments of an n-ary AST, if flattening it would not change them (they are
+    distinct, and none of them is a BVV or has the same op), and None otherwise. The set is kept on the AST until it is
+    handed over to another one (see SimplificationManager._flatten_append).
+    """
+    hashes = a._flat_args
+    if hashes is None:
+        op = a.op
+        hashes = set()
+        for arg in a.args:
+            if not isinstance(arg, ast.Base) or arg.op == op or arg.op == 'BVV':
+                hashes = False
+                break
+            hashes.add(arg._hash)
+        else:
+            if len(hashes) != len(a.args):
+                hashes = False
+        a._flat_args = hashes
+    return hashes or None
+
 SIMPLE_OPS = ('Concat', 'SignExt', 'ZeroExt')
 
+# the comparisons that Not(...) rewrites into, by the op of its argument
+_inverted_comparisons = {
+    'SLT': 'SGE', 'SLE': 'SGT', 'SGT': 'SLE', 'SGE': 'SLT',
+    'ULT': 'UGE', 'ULE': 'UGT', 'UGT': 'ULE', 'UGE': 'ULT',
+    '__lt__': 'UGE', '__le__': 'UGT', '__gt__': 'ULE', '__ge__': 'ULT',
+}
+
 extract_distributable = {
     '__and__', '__rand__',
     '__or__', '__ror__',
     '__xor__', '__rxor__',
 }
 
+_missing = object()
+
 from .backend_manager import backends
 from . import ast
 from . import fp
+from . import operations
 
 
 # the actual instance
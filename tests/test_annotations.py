@@ -118,7 +118,23 @@ def test_eagerness():
     y = x + 1
     assert y.annotations == x.annotations
 
+def test_nested_annotations():
+    x = claripy.BVS('x', 32)
+    y = claripy.BVS('y', 32)
+    assert not (x + y).has_nested_annotations
+
+    b = x.annotate(AnnotationB('a', 0))
+    assert claripy.ast.Base._annotations_used
+    e = ((b + 1) * y) ^ x
+    assert e.has_nested_annotations and not e.annotations
+    assert e.annotated_count == 1
+    assert ((e + b) - y).annotated_count == 2
+
+    # annotations that cannot be eliminated are tracked from any depth
+    assert list(e._uneliminatable_annotations) == list(b.annotations)
+
 if __name__ == '__main__':
     test_annotations()
     test_backend()
     test_eagerness()
+    test_nested_annotations()
@@ -0,0 +1,58 @@
+import nose.tools
+
+import claripy
+from claripy.ast.base import Base
+
+
+def test_arena():
+    a = claripy.BVS('a', 32)
+    outer = a + 1
+    s = claripy.Solver()
+
+    with claripy.Arena() as arena:
+        # ASTs of the enclosing scope are still found
+        nose.tools.assert_is(a + 1, outer)
+        tmp = [ (a + i) * 3 for i in range(100, 200) ]
+        s.add(tmp[5] == 100)
+        kept = tmp[7] ^ a
+        nose.tools.assert_equal(s.eval(a, 2), (s.eval(a, 1)[0],))
+        del tmp
+
+    # the ASTs that escaped are promoted (with their arguments), the others are dropped
+    nose.tools.assert_false(arena.active)
+    nose.tools.assert_greater_equal(arena.promoted, 4)
+    nose.tools.assert_greater(arena.dropped, 100)
+    nose.tools.assert_in(kept._hash, Base._hash_cache)
+    nose.tools.assert_is(kept, ((a + 107) * 3) ^ a)
+    nose.tools.assert_true(s.satisfiable())
+    nose.tools.assert_true(s.solution(a, s.eval(a, 1)[0]))
+
+    # the BVV cache is restored, and still works
+    nose.tools.assert_is(claripy.BVV(0x12345, 32), claripy.BVV(0x12345, 32))
+
+
+def test_arena_nesting():
+    a = claripy.BVS('a', 32)
+
+    with claripy.Arena() as outer:
+        with claripy.Arena() as inner:
+            e = a * 12345
+            inner.pin(a * 54321)
+            nose.tools.assert_raises(claripy.ClaripyError, inner.__enter__)
+        # the promoted ASTs are in the outer arena now
+        nose.tools.assert_is(outer.table.get(e._hash), e)
+        nose.tools.assert_is_not(outer.table.get((a * 54321)._hash), None)
+        nose.tools.assert_is(a * 12345, e)
+
+        # arenas have to be exited in order
+        inner = claripy.Arena()
+        inner.__enter__()
+        nose.tools.assert_raises(claripy.ClaripyError, outer.__exit__, None, None, None)
+        inner.__exit__(None, None, None)
+
+    nose.tools.assert_is(Base._hash_cache.get(e._hash), e)
+
+
+if __name__ == '__main__':
+    test_arena()
+    test_arena_nesting()
@@ -98,6 +98,83 @@ def test_type_errors():
     nose.tools.assert_raises(TypeError, lambda: claripy.BVS('asdf', None))
 
 
+def test_bvv_cache():
+    from collections import OrderedDict
+    from claripy.ast.bv import BVVCache
+
+    cache = BVVCache(policy='lru', max_size=2)
+    vals = [ claripy.BVV(0x1000 + i, 32) for i in range(3) ]
+    for v in vals:
+        nose.tools.assert_is_none(cache.get(v.args[0], 32))
+        cache.put(v.args[0], 32, v)
+
+    # the least recently used one went away
+    nose.tools.assert_is_none(cache.get(0x1000, 32))
+    nose.tools.assert_is(cache.get(0x1002, 32), vals[2])
+    stats = cache.stats()
+    nose.tools.assert_equal(stats['size'], 2)
+    nose.tools.assert_equal(stats['evictions'], 1)
+    nose.tools.assert_equal(stats['hits'], 1)
+    nose.tools.assert_equal(stats['misses'], 4)
+
+    # small values are never evicted
+    small = claripy.BVV(7, 8)
+    cache.put(7, 8, small)
+    cache.configure(max_size=0)
+    nose.tools.assert_is(cache.get(7, 8), small)
+    nose.tools.assert_equal(cache.stats()['size'], 0)
+    nose.tools.assert_equal(len(cache), 1)
+
+    cache.configure(policy='weak')
+    nose.tools.assert_equal(cache.stats()['policy'], 'weak')
+    nose.tools.assert_raises(ClaripyValueError, cache.configure, policy='nope')
+
+    # the table is shared by every thread without a lock, so a BVV can be evicted right after it was found
+    class EvictingTable(OrderedDict):
+        def get(self, key, default=None):
+            r = super().get(key, default)
+            self.clear()
+            return r
+
+    cache = BVVCache(policy='lru', max_size=2)
+    cache._table = EvictingTable()
+    cache.put(0x1000, 32, vals[0])
+    nose.tools.assert_is(cache.get(0x1000, 32), vals[0])
+    nose.tools.assert_is_none(cache.get(0x1000, 32))
+
+    # the global table interns BVVs
+    claripy.bvv_cache.reset_stats()
+    nose.tools.assert_is(claripy.BVV(0x12345678, 32), claripy.BVV(0x12345678, 32))
+    nose.tools.assert_true(claripy.bvv_cache.stats()['hits'] >= 1)
+
+
+def test_bulk_construction():
+    data = claripy.BVS_array('buf', 64, 8)
+    nose.tools.assert_equal(len(data), 64)
+    nose.tools.assert_equal(len(set(d.args[0] for d in data)), 64)
+    nose.tools.assert_true(all(d.op == 'BVS' and d.length == 8 for d in data))
+    named = claripy.BVS_array('named', 3, 16, explicit_name=True)
+    nose.tools.assert_equal([ d.args[0] for d in named ], [ 'named_0', 'named_1', 'named_2' ])
+
+    def assert_same(xs, ys):
+        nose.tools.assert_equal([ x._hash for x in xs ], [ y._hash for y in ys ])
+
+    # the bulk constructors build the same ASTs as the operations
+    buf = claripy.Concat_array(data)
+    nose.tools.assert_is(buf, claripy.Concat(*data))
+    assert_same(buf.chop(8), data)
+    assert_same(buf.chop(16), [ claripy.Extract(i + 15, i, buf) for i in range(496, -1, -16) ])
+    wide = claripy.BVS('wide', 64)
+    assert_same(wide.chop(8), [ claripy.Extract(i + 7, i, wide) for i in range(56, -1, -8) ])
+    assert_same(claripy.Extract_array(wide, [ (63, 0), (7, 0) ]), [ wide, claripy.Extract(7, 0, wide) ])
+
+    # reducible arguments are simplified as usual
+    mixed = [ claripy.BVV(1, 8), claripy.BVV(2, 8), data[0], claripy.Extract(15, 8, wide), claripy.Extract(7, 0, wide) ]
+    nose.tools.assert_is(claripy.Concat_array(mixed), claripy.Concat(*mixed))
+    assert_same(claripy.Concat_array(mixed).args, (claripy.BVV(0x102, 16), data[0], claripy.Extract(15, 0, wide)))
+    nose.tools.assert_is(claripy.Concat_array([ data[0] ]), data[0])
+
+
 if __name__ == '__main__':
 
     if len(sys.argv) > 1:
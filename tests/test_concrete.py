@@ -26,6 +26,55 @@ def test_concrete_fp():
     f = claripy.FPV(1.0, claripy.FSORT_FLOAT)
     nose.tools.assert_equal(claripy.backends.concrete.eval(f, 2), (1.0,))
 
+def test_shared_cache():
+    import threading
+    bc = claripy.backends.concrete
+    a = claripy.BVV(0x1234, 32)
+
+    bc.set_shared_cache()
+    try:
+        nose.tools.assert_true(bc.cache_stats()['shared'])
+        t = threading.Thread(target=bc.convert, args=(a,))
+        t.start()
+        t.join()
+
+        # the object that the other thread converted is found in the shared cache
+        bc.reset_cache_stats()
+        nose.tools.assert_equal(bc.convert(a), 0x1234)
+        stats = bc.cache_stats()
+        nose.tools.assert_equal((stats['hits'], stats['misses']), (1, 0))
+        nose.tools.assert_equal(stats['hit_rate'], 1.0)
+    finally:
+        bc.set_shared_cache(False)
+    nose.tools.assert_false(bc.cache_stats()['shared'])
+
+def test_convert_list():
+    bc = claripy.backends.concrete
+    calls = [ ]
+    mul = bc._op_raw['__mul__']
+    def counting_mul(*args):
+        calls.append(args)
+        return mul(*args)
+
+    bc._op_raw['__mul__'] = counting_mul
+    bc._op_tables_key = None
+    try:
+        # built without eager evaluation, which would have folded them
+        shared = claripy.ast.BV('__mul__', (claripy.BVV(3, 32), claripy.BVV(5, 32)), length=32, eager_backends=None)
+        a = claripy.ast.BV('__add__', (shared, claripy.BVV(1, 32)), length=32, eager_backends=None)
+        b = claripy.ast.BV('__sub__', (shared, claripy.BVV(1, 32)), length=32, eager_backends=None)
+        nose.tools.assert_equal(calls, [ ])
+
+        # the backend does not cache its objects, but the subexpressions that the ASTs share are converted once
+        nose.tools.assert_equal(bc.convert_list([ a, 7, b ]), [ 16, 7, 14 ])
+        nose.tools.assert_equal(len(calls), 1)
+        nose.tools.assert_equal(bc.convert_list([ ]), [ ])
+    finally:
+        bc._op_raw['__mul__'] = mul
+        bc._op_tables_key = None
+
 if __name__ == '__main__':
     test_concrete()
     test_concrete_fp()
+    test_shared_cache()
+    test_convert_list()
@@ -1,3 +1,7 @@
+import os
+import subprocess
+import sys
+
 import claripy
 import nose
 
@@ -228,6 +232,27 @@ def test_if_stuff():
     iiii = claripy.If(x > 10, (x*3+2)+0x20, (x*4+2)+0x10)
     nose.tools.assert_is(iii.ite_excavated, iiii)
 
+def test_ite_dag():
+    x = claripy.BVS('x', 32)
+    y = claripy.BVS('y', 32)
+
+    # shared subexpressions are excavated once, and remembered
+    shared = claripy.If(x > 10, x*3, x*4) + 2
+    a = shared * y
+    b = shared ^ y
+    nose.tools.assert_equal(claripy.excavate_ites([ a, b, x ]), [ a.ite_excavated, b.ite_excavated, x ])
+    nose.tools.assert_is(shared._excavated, claripy.If(x > 10, x*3+2, x*4+2))
+    nose.tools.assert_is(shared.ite_excavated.ite_excavated, shared.ite_excavated)
+    nose.tools.assert_equal(claripy.burrow_ites([ shared.ite_excavated, y ]),
+                            [ x*claripy.If(x > 10, claripy.BVV(3, 32), claripy.BVV(4, 32)) + 2, y ])
+
+    # deep ladders are walked without recursing
+    e = x
+    for i in range(2000):
+        e = claripy.If(x == i, e + 1, e + 2) if i % 500 == 0 else (e ^ y) + i
+    nose.tools.assert_equal(e.ite_excavated.depth, e.depth)
+    nose.tools.assert_less_equal(e.ite_burrowed.depth, e.depth)
+
 def test_ite():
     yield raw_ite, claripy.Solver
     yield raw_ite, claripy.SolverHybrid
@@ -378,6 +403,46 @@ def test_canonical():
     assert frozenset.union(*[a.variables for a in y2.recursive_leaf_asts]) == two_names
     assert y1.canonicalize()[-1] is y2.canonicalize()[-1]
 
+    # canonical hashes match whenever canonicalize() does, without renaming anything
+    assert x1.canonical_hash == x2.canonical_hash
+    assert y1.canonically_match(y2)
+    assert y1.canonical_variables == tuple(v._hash for v in (b1, c1, x1))
+    assert (x1 - x2).canonical_hash == (x2 - x1).canonical_hash
+    assert (x1 - x2).canonical_hash != (x1 - x1).canonical_hash
+    assert (x1 + 1).canonical_hash != (x1 + 2).canonical_hash
+    assert claripy.BVS('x', 32).canonical_hash != claripy.BVS('x', 64).canonical_hash
+    y3 = claripy.If(claripy.And(c1, b1), x1, ((x1+x1)*x1)+1)
+    assert y1.canonicalize()[-1] is y3.canonicalize()[-1]
+    assert y1.canonically_match(y3)
+
+    # variables shared between several ASTs are numbered together
+    z1 = claripy.BVS('z', 32)
+    hashes, variables = claripy.ast.base.canonical_hashes([ x1 + z1, x1 ])
+    assert hashes == claripy.ast.base.canonical_hashes([ x2 + z1, x2 ])[0]
+    assert hashes != claripy.ast.base.canonical_hashes([ x2 + z1, z1 ])[0]
+    assert variables == (x1._hash, z1._hash)
+
+def _canonical_hash_samples():
+    x = claripy.BVS('x', 128)
+    f = claripy.FPS('f', claripy.FSORT_DOUBLE)
+    return [
+        claripy.If(claripy.And(claripy.BoolS('b'), x > 2**100), x + 7, x ^ 2**90),
+        (f + claripy.FPV(1.5, claripy.FSORT_DOUBLE)) < f,
+        # symbolic strings are not renamed by canonicalize(), so their names count
+        claripy.StringS('s', 32, explicit_name=True) == claripy.StringV('abc'),
+    ]
+
+def test_canonical_hash_across_processes():
+    # the string hashes differ from a process to another, and the canonical hashes must not
+    script = "import sys; sys.path.insert(0, %r); import test_expression; " \
+             "print([ e.canonical_hash for e in test_expression._canonical_hash_samples() ])" \
+             % os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONHASHSEED='1234')
+    env['PYTHONPATH'] = os.pathsep.join([ os.path.dirname(os.path.dirname(claripy.__file__)) ] +
+                                        ([ env['PYTHONPATH'] ] if 'PYTHONPATH' in env else [ ]))
+    output = subprocess.check_output([ sys.executable, '-c', script ], env=env)
+    assert output.decode().strip() == str([ e.canonical_hash for e in _canonical_hash_samples() ])
+
 def test_depth():
     x1 = claripy.BVS('x', 32)
     assert x1.depth == 1
@@ -514,11 +579,36 @@ def test_bool_conversion():
     except claripy.ClaripyOperationError:
         pass
 
+def test_op_arg_types():
+    a = claripy.BVS("a", 32)
+    b = claripy.BVS("b", 32)
+
+    # arguments of the right types skip the type fixer, but must build the same ASTs as coerced ones
+    assert (a + 1) is (a + claripy.BVV(1, 32))
+    assert (1 + a) is (claripy.BVV(1, 32) + a)
+    assert claripy.If(a == b, a, 0) is claripy.If(a == b, a, claripy.BVV(0, 32))
+    assert claripy.Concat(a, b).length == 64
+    assert claripy.Extract(7, 0, a).length == 8
+
+    try:
+        claripy.Extract(7, 0)
+        assert False, "Extract should not take two arguments"
+    except claripy.ClaripyTypeError:
+        pass
+
+    try:
+        a + 1.5
+        assert False, "a BV and a float should not be added"
+    except TypeError:
+        pass
+
 if __name__ == '__main__':
+    test_op_arg_types()
     test_multiarg()
     test_depth()
     test_rename()
     test_canonical()
+    test_canonical_hash_across_processes()
     test_depth_repr()
     test_extract()
     test_true_false_cache()
@@ -530,6 +620,7 @@ if __name__ == '__main__':
     for func, param in test_ite():
         func(param)
     test_if_stuff()
+    test_ite_dag()
     test_signed_concrete()
     test_signed_symbolic()
     test_arith_shift()
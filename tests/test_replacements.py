@@ -1,3 +1,6 @@
+import gc
+import weakref
+
 import claripy
 
 import logging
@@ -75,7 +78,51 @@ def test_branching_replacement_solver():
     #assert s1a.satisfiable()
     #assert not s1b.satisfiable()
 
+def test_replacer():
+    from claripy.ast.replacer import Replacer
+    from claripy.frontend_mixins.model_cache_mixin import ModelCache
+
+    x = claripy.BVS('x', 32)
+    y = claripy.BVS('y', 32)
+    z = claripy.BVS('z', 32)
+    shared = x * 3 + y
+    e = claripy.If(shared == 0, shared, z + 1)
+
+    r = Replacer({ x.cache_key: claripy.BVV(2, 32) })
+    v = r.version
+    replaced = r.replace(e)
+    assert replaced is e.replace(x, claripy.BVV(2, 32))
+    assert r.replace(e) is replaced
+    assert r.cached(shared) is (claripy.BVV(2, 32) * 3 + y)
+    # subtrees without any replaced variable are not walked
+    assert r.cached(z + 1) is None
+
+    # changing the replacements drops the memoized results
+    r.add(y, z)
+    assert r.version > v
+    assert r.replace(e) is e.replace(x, claripy.BVV(2, 32)).replace(y, z)
+    r.remove([ x.cache_key ])
+    assert r.replace(e) is e.replace(y, z)
+
+    # replacing a concrete AST turns the variable pruning off
+    r = Replacer({ claripy.BVV(1, 32).cache_key: claripy.BVV(7, 32) })
+    assert r.replace(z + 1) is z + 7
+
+    # the memo does not keep the results alive
+    r = Replacer({ x.cache_key: y })
+    def _replace_unused():
+        return weakref.ref(r.replace(x * 123457 + z))
+    ref = _replace_unused()
+    gc.collect()
+    if claripy.ast.base.HASH_CONS == 'weak':
+        assert ref() is None
+
+    mc = ModelCache({ x.args[0]: 1, y.args[0]: 2 })
+    assert mc.eval_constraints([ shared == 5, claripy.ULE(z, 0) ])
+    assert mc.eval_list([ shared, e ]) == (5, 1)
+
 if __name__ == '__main__':
+    test_replacer()
     test_branching_replacement_solver()
     test_replacement_solver()
     test_contradiction()
@@ -1,5 +1,9 @@
-import claripy
+import os
+import sys
 import pickle
+import subprocess
+
+import claripy
 
 import logging
 l = logging.getLogger('claripy.test.serial')
@@ -19,6 +23,18 @@ def test_pickle_ast():
     assert bz.convert(c_copy).__module__ == 'z3.z3'
     assert str(bz.convert(c_copy)) == '1 + x'
 
+def test_pickle_ast_across_processes():
+    # the string hashes differ from a process to another, and the ASTs must still be hash-consed with the local ones
+    script = "import pickle, sys, claripy; " \
+             "sys.stdout.buffer.write(pickle.dumps(claripy.BVS('x', 32, explicit_name=True) + 1, -1))"
+    env = dict(os.environ, PYTHONHASHSEED='1234')
+    env['PYTHONPATH'] = os.pathsep.join([ os.path.dirname(os.path.dirname(claripy.__file__)) ] +
+                                        ([ env['PYTHONPATH'] ] if 'PYTHONPATH' in env else [ ]))
+    pickled = subprocess.check_output([ sys.executable, '-c', script ], env=env)
+
+    e = claripy.BVS('x', 32, explicit_name=True) + 1
+    assert pickle.loads(pickled) is e
+
 def test_pickle_frontend():
     s = claripy.Solver()
     x = claripy.BVS('x', 32)
@@ -73,5 +89,6 @@ def test_identity():
 
 if __name__ == '__main__':
     test_pickle_ast()
+    test_pickle_ast_across_processes()
     test_pickle_frontend()
     test_identity()
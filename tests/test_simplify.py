@@ -1,3 +1,4 @@
+import collections
 import claripy
 import nose
 
@@ -126,6 +127,161 @@ def test_concrete_flatten():
     i = d - 10
     nose.tools.assert_is(i, b)
 
+def test_simplification_memo():
+    simpleton = claripy.simplifications.simpleton
+    x = claripy.BVS('x', 32)
+    y = claripy.BVS('y', 32)
+    c = claripy.Concat(x, y)
+
+    old_size = simpleton.memo_size
+    try:
+        simpleton.clear_memo()
+        simpleton.reset_memo_stats()
+        e = claripy.Extract(15, 8, c)
+        nose.tools.assert_is(claripy.Extract(15, 8, c), e)
+        nose.tools.assert_true(claripy.backends.z3.identical(e, y[15:8]))
+        # "no simplification" is memoized too
+        nose.tools.assert_is(claripy.Extract(40, 8, c), claripy.Extract(40, 8, c))
+        stats = simpleton.memo_stats()
+        nose.tools.assert_greater_equal(stats['hits'], 2)
+        nose.tools.assert_greater(stats['misses'], 0)
+
+        # the memo is bounded, and can be disabled
+        simpleton.set_memo_size(1)
+        nose.tools.assert_equal(simpleton.memo_stats()['size'], 1)
+        simpleton.set_memo_size(0)
+        simpleton.reset_memo_stats()
+        nose.tools.assert_is(claripy.Extract(15, 8, c), e)
+        nose.tools.assert_equal(simpleton.memo_stats()['hits'] + simpleton.memo_stats()['misses'], 0)
+    finally:
+        simpleton.set_memo_size(old_size)
+
+    # the memo is shared by every thread without a lock, so an entry can be evicted right after it was found
+    class EvictingMemo(collections.OrderedDict):
+        def get(self, key, default=None):
+            r = super().get(key, default)
+            self.clear()
+            return r
+
+    m = claripy.simplifications.SimplificationManager()
+    m._memo = EvictingMemo()
+    nose.tools.assert_is(m.simplify('Extract', (15, 8, c)), e)
+    nose.tools.assert_is(m.simplify('Extract', (15, 8, c)), e)
+    nose.tools.assert_equal(m.memo_stats()['hits'], 1)
+
+def test_simplification_rules():
+    simpleton = claripy.simplifications.simpleton
+    x = claripy.BVS('x', 32)
+    y = claripy.BVS('y', 32)
+
+    # only the rules whose patterns match the ops of the arguments are tried
+    names = [ r.name for r in simpleton.candidate_rules('Extract', (15, 8, claripy.Concat(x, y))) ]
+    nose.tools.assert_equal(names, [ 'extract_whole_simplifier', 'extract_concat_simplifier' ])
+    names = [ r.name for r in simpleton.candidate_rules('Extract', (15, 8, x)) ]
+    nose.tools.assert_equal(names, [ 'extract_whole_simplifier' ])
+    nose.tools.assert_equal(len(simpleton.candidate_rules('Not', (x == y,))), 1)
+
+    simpleton.reset_rule_stats()
+    simpleton.clear_memo()
+    nose.tools.assert_true(claripy.backends.z3.identical(claripy.Not(claripy.ULT(x, y)), claripy.UGE(x, y)))
+    nose.tools.assert_equal(simpleton.rule_stats()[('Not', 'boolean_not_comparison_simplifier')], 1)
+
+    # rules can be added, and are tried in order
+    manager = claripy.simplifications.SimplificationManager(memo_size=0)
+    nose.tools.assert_is(manager.simplify('__floordiv__', (x, claripy.BVV(1, 32))), None)
+    manager.add_rule('__floordiv__', lambda a, b: a if b.args[0] == 1 else None, [ (None, 'BVV') ], name='div_one')
+    manager.add_rule('__floordiv__', lambda a, b: claripy.BVV(1, a.size()) if a is b else None, name='div_self')
+    nose.tools.assert_is(manager.simplify('__floordiv__', (x, claripy.BVV(1, 32))), x)
+    nose.tools.assert_is(manager.simplify('__floordiv__', (x, claripy.BVV(2, 32))), None)
+    nose.tools.assert_is(manager.simplify('__floordiv__', (x, x)), claripy.BVV(1, 32))
+    nose.tools.assert_equal([ r.name for r in manager.candidate_rules('__floordiv__', (x, x)) ], [ 'div_self' ])
+    nose.tools.assert_equal(manager.rule_stats()[('__floordiv__', 'div_one')], 1)
+    nose.tools.assert_equal(manager.rule_stats()[('__floordiv__', 'div_self')], 1)
+    nose.tools.assert_is(simpleton.simplify('__floordiv__', (x, claripy.BVV(1, 32))), None)
+
+def test_simplify_dag():
+    x = claripy.BVS('x', 32)
+    y = claripy.BVS('y', 32)
+
+    # ASTs that were built without the simplifier
+    rev = x.make_like('Reverse', (x,))
+    rev = rev.make_like('Reverse', (rev,))
+    e = rev.make_like('__add__', (rev, y.make_like('__xor__', (y, claripy.BVV(0, 32)))))
+    nose.tools.assert_equal(e.depth, 4)
+    s = claripy.simplify_dag(e)
+    nose.tools.assert_is(s, x + y)
+    nose.tools.assert_is(claripy.simplify_dag(s), s)
+
+    # the results are still simplified by a backend afterwards
+    d = x.make_like('__sub__', (x.make_like('__add__', (x, y)), y))
+    nose.tools.assert_is(claripy.simplify_dag(d), d)
+    nose.tools.assert_is(claripy.simplify(claripy.simplify_dag(d)), x)
+
+    # the rules are applied again to the rewritten ASTs
+    c = claripy.Concat(x, y)
+    ex = c.make_like('Extract', (7, 0, c), length=8)
+    eq = claripy.ast.Bool('__eq__', (ex, claripy.BVV(3, 8)))
+    n = claripy.ast.Bool('Not', (eq,))
+    nose.tools.assert_is(claripy.simplify_dag(n), y[7:0] != 3)
+
+    # shared subexpressions are simplified once, and deep ASTs are fine
+    e = x
+    expected = x
+    for _ in range(2000):
+        a = e.make_like('__xor__', (e, claripy.BVV(0, 32)))
+        e = a.make_like('__sub__', (a, y.make_like('__sub__', (y, a))))
+        expected = expected - (y - expected)
+    nose.tools.assert_is(claripy.simplify_dag(e), expected)
+
+    # the results are memoized across calls, so an AST that grew is only walked from its new subexpressions
+    memo = claripy.ast.base._simplify_dag_memo
+    nose.tools.assert_is(memo[e._hash], expected)
+    nose.tools.assert_is(memo[expected._hash], expected)
+    size = len(memo)
+    grown = e.make_like('__add__', (e.make_like('__xor__', (e, claripy.BVV(0, 32))), y))
+    nose.tools.assert_is(claripy.simplify_dag(grown), expected + y)
+    nose.tools.assert_less_equal(len(memo) - size, 4)
+    claripy.reset()
+    nose.tools.assert_not_in(e._hash, memo)
+
+    nose.tools.assert_equal(claripy.simplify_dag(5), 5)
+
+def test_flatten_append():
+    xs = [ claripy.BVS('fa_%d' % i, 32) for i in range(8) ]
+    cs = [ x != i for i, x in enumerate(xs) ]
+
+    # appending to a flattened AST builds the same AST as flattening all of the arguments at once
+    pc = cs[0]
+    versions = [ ]
+    for c in cs[1:]:
+        pc = claripy.And(pc, c)
+        versions.append(pc)
+    direct = claripy.ast.Bool('And', tuple(cs))
+    nose.tools.assert_is(pc, direct)
+    nose.tools.assert_equal(pc.tree_size, 1 + 3 * len(cs))
+    nose.tools.assert_equal(pc.depth, direct.depth)
+    nose.tools.assert_equal(pc.variables, direct.variables)
+    # the arguments were folded into the hash one at a time, and only the last AST keeps the fold
+    nose.tools.assert_equal(pc._arg_fold, claripy.ast.Base._fold_arg_keys(0, cs))
+    nose.tools.assert_true(all(v._arg_fold is None for v in versions[:-1]))
+
+    # duplicates are dropped, and extending the same AST twice gives independent results
+    nose.tools.assert_is(claripy.And(pc, cs[3]), pc)
+    a = claripy.And(pc, xs[0] == 1)
+    b = claripy.And(pc, xs[0] == 2)
+    nose.tools.assert_equal(a.args, pc.args + (xs[0] == 1,))
+    nose.tools.assert_equal(b.args, pc.args + (xs[0] == 2,))
+    nose.tools.assert_is(claripy.And(pc, xs[0] == 1), a)
+
+    s = xs[0]
+    x = xs[0]
+    for y in xs[1:]:
+        s = s + y
+        x = x ^ y
+    nose.tools.assert_is(s, xs[0].make_like('__add__', tuple(xs)))
+    nose.tools.assert_is(x, xs[0].make_like('__xor__', tuple(xs)))
+    nose.tools.assert_equal(s.variables, frozenset.union(*(y.variables for y in xs)))
+
 def perf():
     import timeit
     print(timeit.timeit("perf_boolean_and_simplification_0()",
@@ -143,3 +299,7 @@ if __name__ == '__main__':
     test_reverse_extract_reverse_simplification()
     test_reverse_concat_reverse_simplification()
     test_concrete_flatten()
+    test_simplification_memo()
+    test_simplification_rules()
+    test_simplify_dag()
+    test_flatten_append()
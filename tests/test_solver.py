@@ -1,6 +1,7 @@
 import claripy
 import nose
 import math
+import collections
 
 import logging
 l = logging.getLogger('claripy.test.solver')
@@ -580,6 +581,77 @@ def test_nan():
     assert res & 0xff800000 == 0x7f800000 and res & 0x007fffff != 0
 
 
+def test_translation_cache():
+    import threading
+    z = claripy.backends.z3
+    x = claripy.BVS('tc_x', 32)
+    e = claripy.And(x * 3 + 1 == 10, x != 7)
+
+    z.set_shared_cache()
+    try:
+        z.convert(e)
+        results = [ ]
+        def other_thread():
+            results.append(z.convert(e).ctx is z._context)
+            results.append(claripy.Solver().eval(x, 2, extra_constraints=(e,)))
+        z.reset_cache_stats()
+        t = threading.Thread(target=other_thread)
+        t.start()
+        t.join()
+        nose.tools.assert_equal(results, [ True, (3,) ])
+        nose.tools.assert_greater_equal(z.cache_stats()['translations'], 1)
+    finally:
+        z.set_shared_cache(False)
+
+def test_verdict_cache():
+    z = claripy.backends.z3
+    x = claripy.BVS('vc_x', 32)
+    make = lambda: claripy.Or(x == 1, x != 1)
+
+    true_verdicts = z._true_verdicts
+    z.set_verdict_cache_size(16)
+    try:
+        z.reset_verdict_cache_stats()
+        e = make()
+        nose.tools.assert_true(z.is_true(e))
+        nose.tools.assert_false(z.is_false(e))
+        stats = z.verdict_cache_stats()
+        nose.tools.assert_equal((stats['hits'], stats['lru_hits'], stats['misses']), (1, 0, 1))
+
+        # the verdicts outlive downsize(), which drops the caches that are keyed by the ASTs
+        z.downsize()
+        nose.tools.assert_true(z.is_true(e))
+        z.downsize()
+        nose.tools.assert_false(z.is_false(make()))
+        stats = z.verdict_cache_stats()
+        nose.tools.assert_equal(stats['lru_hits'], 2)
+        nose.tools.assert_equal(stats['misses'], 1)
+        nose.tools.assert_equal(stats['size'], 2)
+
+        # the verdicts are shared by every thread without a lock, so one can be evicted right after it was found
+        class EvictingVerdicts(collections.OrderedDict):
+            def get(self, key, default=None):
+                r = super().get(key, default)
+                self.clear()
+                return r
+        z._true_verdicts = EvictingVerdicts(z._true_verdicts)
+        z.downsize()
+        nose.tools.assert_true(z.is_true(e))
+        nose.tools.assert_equal(z.verdict_cache_stats()['lru_hits'], 3)
+
+        # nothing is counted while the verdicts are not kept
+        z.set_verdict_cache_size(0)
+        nose.tools.assert_equal(z.verdict_cache_stats()['size'], 0)
+        z.reset_verdict_cache_stats()
+        z.downsize()
+        nose.tools.assert_true(z.is_true(e))
+        nose.tools.assert_true(z.is_true(e))
+        stats = z.verdict_cache_stats()
+        nose.tools.assert_equal((stats['hits'], stats['lru_hits'], stats['misses']), (0, 0, 0))
+    finally:
+        z._true_verdicts = true_verdicts
+        z.set_verdict_cache_size(0)
+
 if __name__ == '__main__':
     for fparams in test_unsat_core():
         fparams[0](*fparams[1:])
@@ -604,3 +676,5 @@ if __name__ == '__main__':
     test_composite_solver()
     test_zero_division_in_cache_mixin()
     test_nan()
+    test_translation_cache()
+    test_verdict_cache()
@@ -0,0 +1,99 @@
+import sys
+
+import nose.tools
+
+import claripy
+from claripy.ast import traversal
+
+
+def _diamonds(x, depth):
+    # every level uses the previous one twice, so the tree has 2**depth paths but the DAG only a few nodes per level
+    e = x
+    for i in range(depth):
+        e = (e * 3) ^ (e + i)
+    return e
+
+
+def test_dedupe():
+    x = claripy.BVS('x', 32)
+    e = _diamonds(x, 40)
+
+    children = list(traversal.preorder(e))[1:]
+    nose.tools.assert_equal(len(children), len({ c._hash for c in children }))
+    # children_asts() still yields shared children once per occurrence
+    def occurrences(n):
+        return sum(1 + occurrences(a) for a in n.args if isinstance(a, claripy.ast.Base))
+    small = _diamonds(x, 3)
+    nose.tools.assert_equal(len(list(small.children_asts())), occurrences(small))
+    leaves = list(e.leaf_asts())
+    nose.tools.assert_equal(len(leaves), len({ l._hash for l in leaves }))
+    nose.tools.assert_true(any(l is x for l in leaves))
+    nose.tools.assert_true(all(l.depth == 1 for l in leaves))
+
+    visited = [ ]
+    def visit(node, args):
+        visited.append(node)
+        return node.make_like(node.op, tuple(args))
+    nose.tools.assert_is(traversal.postorder_map(e, visit), e)
+    nose.tools.assert_equal(len(visited), len(children) + 1)
+
+    # arguments come before their parents
+    order = { n._hash: i for i, n in enumerate(traversal.postorder(e)) }
+    for n in traversal.postorder(e):
+        for a in n.args:
+            if isinstance(a, claripy.ast.Base):
+                nose.tools.assert_less(order[a._hash], order[n._hash])
+
+    # a replacement in the shared leaf is done once, and reaches every path
+    y = claripy.BVS('y', 32)
+    r = e.replace(x, y)
+    nose.tools.assert_equal(r.variables, y.variables)
+    nose.tools.assert_true(r.structurally_match(_diamonds(x, 40).replace(x, y)))
+
+    # the backends convert every shared subexpression once, even without an object cache
+    z3 = claripy.backends.z3
+    cache_objects = z3._cache_objects
+    z3._cache_objects = False
+    try:
+        nose.tools.assert_is_not_none(z3.convert(e))
+    finally:
+        z3._cache_objects = cache_objects
+
+
+def test_deep():
+    depth = sys.getrecursionlimit() * 2
+
+    def chain(name):
+        e = claripy.BVS(name, 8, explicit_name=True)
+        for i in range(depth):
+            e = (e + claripy.BVS('y', 8, explicit_name=True)) - (i % 250 + 1)
+        return e
+
+    a = chain('a')
+    nose.tools.assert_true(a.structurally_match(a))
+    nose.tools.assert_false(a.structurally_match(chain('b')))
+    nose.tools.assert_equal(len(list(a.leaf_asts())), 2 + 250)
+    nose.tools.assert_is(a.canonicalize()[-1], chain('b').canonicalize()[-1])
+
+
+def test_errors():
+    x = claripy.BVS('x', 32)
+    e = claripy.If(x == 1, x + 1, x - 1)
+
+    # the ASTs that were being converted when the backend failed are marked as errored
+    nose.tools.assert_raises(claripy.BackendError, claripy.backends.concrete.convert, e)
+    nose.tools.assert_in(claripy.backends.concrete, e._errored)
+
+    in_progress = [ ]
+    def visit(node, args):
+        if node.op == '__sub__':
+            raise ValueError()
+        return node
+    nose.tools.assert_raises(ValueError, traversal.postorder_map, e, visit, on_error=in_progress.extend)
+    nose.tools.assert_equal(in_progress, [ e ])
+
+
+if __name__ == '__main__':
+    test_dedupe()
+    test_deep()
+    test_errors()